@@ -1,6 +1,9 @@
 import asyncio
 import logging
+import os
+import signal
 import sys
+from typing import Any
 
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
@@ -11,25 +14,8 @@ from aiogram.enums import ParseMode
 
 from database.init_db import init_db
 
-# Импорты роутеров (группируем по типу)
-from handlers.owner.dev_panel_router import dev_panel_router
-from handlers.start import start_router
-from handlers.client import client_router
-
-from handlers.owner.owner_main import owner_main_router
-from handlers.owner.client_button import owner_content_router
-from handlers.owner.admins_router import owner_admins_router
-from handlers.owner.broadcast_router import owner_broadcast_router
-from handlers.owner.crud.clients_router import owner_clients_router
-from handlers.owner.crud.vision_router import owner_vision_router
-from handlers.owner.crud.edit_and_delete import owner_vision_edit_router
-from handlers.owner.export_router import owner_export_router
-
-from handlers.admin.admin_main import admin_main_router
-from handlers.admin.admin_clients_router import admin_clients_router
-from handlers.admin.admin_broadcast_router import admin_broadcast_router
-from handlers.admin.admin_vision_edit_router import admin_vision_edit_router
-from handlers.admin.admin_vision_router import admin_vision_router
+# Роутеры и порядок их подключения
+from handlers.routers import ROUTERS
 
 from middlewares.anti_spam import RateLimitMiddleware
 from middlewares.private import PrivateChatOnlyMiddleware
@@ -42,70 +28,155 @@ from config import (
     OWNER_IDS,
     AUTO_BACKUP_INTERVAL_HOURS,
     AUTO_BACKUP_TARGET_IDS,
+    SCHEDULED_EXPORT_TARGET_IDS,
     CRITICAL_ALERT_OWNER_ID,
+    BOT_MODE,
+    WEBHOOK_BASE_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_SECRET,
+    WEBHOOK_HOST,
+    WEBHOOK_PORT,
+    UPDATE_WORKERS,
 )
 from middlewares.anti_spam import RateLimitMiddleware
 from middlewares.metrics import MetricsMiddleware
 from utils.owner_alerts import OwnerAlertHandler
 from utils.backup_service import auto_backup_worker
+from database.write_queue import write_queue
+from database.fsm_storage import fsm_storage
+from services.export_jobs import shutdown_export_pool
+from services.export_scheduler import scheduled_export_worker
+from utils.webhook_server import WebhookServer
+from utils import worker_ipc
+from utils.update_workers import UpdateWorkers, poll_updates, serve_worker
 
 
-# Настройка логирования
 LOG_DIR = Path("logs")
-LOG_DIR.mkdir(exist_ok=True)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        RotatingFileHandler(LOG_DIR / "bot.log", maxBytes=5_000_000, backupCount=3, encoding="utf-8"),
-    ],
-)
 owner_alert_handler = OwnerAlertHandler(OWNER_IDS, critical_owner_id=CRITICAL_ALERT_OWNER_ID)
 owner_alert_handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
-logging.getLogger().addHandler(owner_alert_handler)
 
 logger = logging.getLogger(__name__)
 
-async def main():
-    logger.info("Запуск бота...")
 
-    # 1. Инициализация базы данных
+def setup_logging(log_name: str = "bot.log") -> None:
+    # У каждого процесса свой файл: RotatingFileHandler не умеет ротацию из нескольких процессов
+    LOG_DIR.mkdir(exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+
+        handlers=[
+            logging.StreamHandler(sys.stdout),
+            RotatingFileHandler(LOG_DIR / log_name, maxBytes=5_000_000, backupCount=3, encoding="utf-8"),
+        ],
+    )
+    logging.getLogger().addHandler(owner_alert_handler)
+
+
+ALLOWED_UPDATES = ["message", "callback_query"]
+
+
+async def _wait_for_stop_signal(allow_restart: bool = False) -> bool:
+    """Ждёт SIGINT/SIGTERM. С allow_restart SIGHUP тоже останавливает, но возвращает True — перезапуск."""
+    loop = asyncio.get_running_loop()
+    stopped: asyncio.Future[bool] = loop.create_future()
+
+    def stop(restart: bool) -> None:
+        if not stopped.done():
+            stopped.set_result(restart)
+
+    signals = [(signal.SIGINT, False), (signal.SIGTERM, False)]
+    if allow_restart and hasattr(signal, "SIGHUP"):
+        signals.append((signal.SIGHUP, True))
+    for sig, restart in signals:
+        try:
+            loop.add_signal_handler(sig, stop, restart)
+        except NotImplementedError:
+            pass  # Windows: остановка по KeyboardInterrupt
+    return await stopped
+
+
+async def run_webhook(bot: Bot, handle_update, allow_restart: bool = False) -> bool:
+    server = WebhookServer(
+        handle_update,
+        secret=WEBHOOK_SECRET,
+        path=WEBHOOK_PATH,
+        host=WEBHOOK_HOST,
+        port=WEBHOOK_PORT,
+    )
+    await server.start()
     try:
-        logger.info("Инициализация базы данных...")
-        await init_db()
-    except Exception as e:
-        logger.error(f"Ошибка инициализации БД: {e}", exc_info=True)
-        return
+        if WEBHOOK_BASE_URL:
+            await bot.set_webhook(
+                WEBHOOK_BASE_URL + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                allowed_updates=ALLOWED_UPDATES,
+                drop_pending_updates=True,
+            )
+        logger.info("Бот запущен в режиме webhook! Ожидание обновлений...")
+        return await _wait_for_stop_signal(allow_restart)
+    finally:
+        await server.stop()
 
-    # 2. Создание бота
+
+async def run_sharded(bot: Bot) -> bool:
+    """Главный процесс многопроцессного режима: принимает обновления и раздаёт их воркерам."""
+    workers = UpdateWorkers(UPDATE_WORKERS, worker_main, pinned_user_ids=frozenset(OWNER_IDS))
+    workers.start()
+    supervisor = asyncio.create_task(workers.supervise())
+    try:
+        if BOT_MODE == "webhook":
+            return await run_webhook(bot, workers.route, allow_restart=True)
+        poller = asyncio.create_task(poll_updates(bot, workers.route, ALLOWED_UPDATES))
+        try:
+            logger.info("Бот запущен! Обновления обрабатывают воркеры: %s", UPDATE_WORKERS)
+            return await _wait_for_stop_signal(allow_restart=True)
+        finally:
+            poller.cancel()
+            try:
+                await poller
+            except asyncio.CancelledError:
+                pass
+    finally:
+        supervisor.cancel()
+        await workers.stop()
+
+
+def worker_main(index: int, queue: Any, bus: Any, completed: Any) -> None:
+    """Точка входа процесса-воркера (запускается через spawn)."""
+    # Ctrl+C получает вся группа процессов — останавливает воркеров главный процесс
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(f"bot-worker{index}.log")
+    asyncio.run(_run_worker(index, queue, bus, completed))
+
+
+async def _run_worker(index: int, queue: Any, bus: Any, completed: Any) -> None:
+    bot = create_bot()
+    dp = create_dispatcher()
+    worker_ipc.attach(index, bus)
+    write_queue.start()
+    logger.info("Воркер %s запущен", index)
+    try:
+        await serve_worker(index, queue, completed, lambda update: dp.feed_raw_update(bot, update))
+    finally:
+        await shutdown_writers()
+        await bot.session.close()
+        logger.info("Воркер %s остановлен", index)
+
+
+def create_bot() -> Bot:
     bot = Bot(
         token=str(BOT_TOKEN),
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     owner_alert_handler.bind_bot(bot)
+    return bot
 
-    # 3. Создание диспетчера
-    dp = Dispatcher()
-
-    # 4. Установка команд бота
-    try:
-        await set_commands(bot)
-        logger.info("Команды бота установлены")
-    except Exception as e:
-        logger.warning(f"Не удалось установить команды: {e}")
-
-    # 5. Инициализация контента
-    try:
-        await init_bot_content()
-        await get_bot_content(force_refresh=True)
-        logger.info("Контент бота загружен в кэш")
-    except Exception as e:
-        logger.error(f"Ошибка инициализации контента: {e}", exc_info=True)
 
-    
+def create_dispatcher() -> Dispatcher:
+    # FSM в SQLite: незаконченные формы переживают перезапуск
+    dp = Dispatcher(storage=fsm_storage)
 
     # Антиспам: ограничение частоты сообщений и нажатий кнопок
     spam_guard = RateLimitMiddleware(
@@ -125,54 +196,94 @@ async def main():
 
 
     dp.update.middleware(PrivateChatOnlyMiddleware())
-    # 6. Подключение роутеров (ВАЖНО: порядок!)
-    # Сначала общие
-  
-
-    # Потом владелец
-    dp.include_router(owner_main_router)
-    dp.include_router(owner_content_router)
-    dp.include_router(owner_admins_router)
-    dp.include_router(owner_broadcast_router)
-    dp.include_router(owner_clients_router)
-    dp.include_router(owner_vision_router)
-    dp.include_router(owner_vision_edit_router)
-    dp.include_router(owner_export_router)
-    dp.include_router(dev_panel_router)
-
-    # Потом админы
-    dp.include_router(admin_main_router)
-    dp.include_router(admin_broadcast_router)
-    dp.include_router(admin_clients_router)
-    dp.include_router(admin_vision_edit_router)
-    dp.include_router(admin_vision_router)
-
-    dp.include_router(start_router)
-    dp.include_router(client_router)
+    # Подключение роутеров (ВАЖНО: порядок! — см. handlers/routers.py)
+    for router in ROUTERS:
+        dp.include_router(router)
+    return dp
+
 
+async def shutdown_writers() -> None:
+    # Накопленные изменения FSM уходят через очередь записи — до её остановки
+    await fsm_storage.close()
+    await write_queue.stop()
+    shutdown_export_pool()
+
+
+async def main() -> bool:
+    """Возвращает True, если запрошен перезапуск всего бота (многопроцессный режим)."""
+    logger.info("Запуск бота...")
+
+    # 1. Инициализация базы данных
+    try:
+        logger.info("Инициализация базы данных...")
+        await init_db()
+    except Exception as e:
+        logger.error(f"Ошибка инициализации БД: {e}", exc_info=True)
+        return False
+
+    # 2. Создание бота
+    bot = create_bot()
+
+    # 3. Установка команд бота
+    try:
+        await set_commands(bot)
+        logger.info("Команды бота установлены")
+    except Exception as e:
+        logger.warning(f"Не удалось установить команды: {e}")
+
+    # 4. Инициализация контента
+    try:
+        await init_bot_content()
+        await get_bot_content(force_refresh=True)
+        logger.info("Контент бота загружен в кэш")
+    except Exception as e:
+        logger.error(f"Ошибка инициализации контента: {e}", exc_info=True)
+
+    # Все записи процесса идут через одного писателя пачками
+    write_queue.start()
+
+    # Фоновые задачи — только в главном процессе, воркеры их не запускают
     auto_backup_task = asyncio.create_task(
         auto_backup_worker(bot, target_ids=AUTO_BACKUP_TARGET_IDS, interval_hours=AUTO_BACKUP_INTERVAL_HOURS)
     )
+    scheduled_export_task = asyncio.create_task(
+        scheduled_export_worker(bot, target_ids=SCHEDULED_EXPORT_TARGET_IDS)
+    )
 
-    # 7. Запуск поллинга
+    # 5. Приём обновлений: поллинг или webhook (BOT_MODE), сами или через процессы-воркеры
+    restart = False
     try:
-        logger.info("Бот запущен! Ожидание обновлений...")
-        await bot.delete_webhook(drop_pending_updates=True)
-        await dp.start_polling(bot, allowed_updates=["message", "callback_query"])
+        if UPDATE_WORKERS > 1:
+            restart = await run_sharded(bot)
+        elif BOT_MODE == "webhook":
+            dp = create_dispatcher()
+            await run_webhook(bot, lambda update: dp.feed_raw_update(bot, update))
+        else:
+            dp = create_dispatcher()
+            logger.info("Бот запущен! Ожидание обновлений...")
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot, allowed_updates=ALLOWED_UPDATES)
     except Exception as e:
-        logger.error(f"Ошибка поллинга: {e}", exc_info=True)
+        logger.error(f"Ошибка приёма обновлений: {e}", exc_info=True)
     finally:
-        auto_backup_task.cancel()
-        try:
-            await auto_backup_task
-        except asyncio.CancelledError:
-            pass
+        for task in (auto_backup_task, scheduled_export_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await shutdown_writers()
         await bot.session.close()
         logger.info("Бот остановлен")
+    return restart
 
 if __name__ == "__main__":
+    setup_logging()
     try:
-        asyncio.run(main())
+        if asyncio.run(main()):
+            # Перезапуск из панели разработчика в многопроцессном режиме: воркеры уже остановлены
+            logger.info("Перезапуск бота...")
+            os.execv(sys.executable, [sys.executable, *sys.argv])
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
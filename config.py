@@ -34,6 +34,22 @@ def _parse_id_list(raw_value: str) -> List[int]:
 
 BOT_TOKEN = _get_required_env("BOT_TOKEN")
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///data/database.db")
+# Профиль SQLite (legacy / wal / wal_durable) и точечные переопределения PRAGMA: "cache_size=-32000,mmap_size=0"
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "wal")
+SQLITE_PRAGMAS = os.getenv("SQLITE_PRAGMAS", "")
+# Отдельный пул соединений только для чтения (выгрузки, статистика, поиск)
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "4"))
+# Сколько операций записи из очереди объединяются в одну транзакцию
+WRITE_BATCH_MAX_OPS = int(os.getenv("WRITE_BATCH_MAX_OPS", "100"))
+# Сколько карточек клиентов и списков их записей зрения держать в кэше процесса
+ENTITY_CACHE_SIZE = int(os.getenv("ENTITY_CACHE_SIZE", "1000"))
+# Заполнение данных в миграциях идёт пачками по столько строк — короткими транзакциями
+MIGRATION_BACKFILL_CHUNK = int(os.getenv("MIGRATION_BACKFILL_CHUNK", "1000"))
+# Запросы дольше этого порога пишутся в лог вместе с параметрами и видны в панели разработчика
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "100"))
+# FSM в SQLite: изменения форм копятся в памяти и пишутся одной транзакцией раз в интервал
+FSM_FLUSH_INTERVAL_SECONDS = float(os.getenv("FSM_FLUSH_INTERVAL_SECONDS", "1"))
+FSM_CACHE_SIZE = int(os.getenv("FSM_CACHE_SIZE", "10000"))
 
 OWNER_IDS = _parse_id_list(_get_required_env("OWNER_IDS"))
 
@@ -47,4 +63,46 @@ else:
 
 
 AUTO_BACKUP_INTERVAL_HOURS = int(os.getenv("AUTO_BACKUP_INTERVAL_HOURS", "24"))
-AUTO_BACKUP_TARGET_IDS = _parse_id_list(os.getenv("AUTO_BACKUP_TARGET_IDS", "")) or OWNER_IDS
\ No newline at end of file
+AUTO_BACKUP_TARGET_IDS = _parse_id_list(os.getenv("AUTO_BACKUP_TARGET_IDS", "")) or OWNER_IDS
+
+# Выгрузки: размер пачки при чтении из БД, число процессов-воркеров и частота обновления прогресса
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "500"))
+# Пул из EXPORT_WORKERS процессов создаётся лениво в каждом процессе, где запускается выгрузка:
+# в главном (выгрузки по расписанию) и, при UPDATE_WORKERS > 1, в воркере владельцев — всего
+# до 2 × EXPORT_WORKERS процессов выгрузок
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "1"))
+EXPORT_PROGRESS_INTERVAL_SECONDS = float(os.getenv("EXPORT_PROGRESS_INTERVAL_SECONDS", "3"))
+# Выгрузка дольше этого времени прерывается, воркер освобождается
+EXPORT_TIMEOUT_SECONDS = float(os.getenv("EXPORT_TIMEOUT_SECONDS", "1800"))
+
+# Плановые выгрузки: "<кнопка выгрузки>:<формат>[:delta]" через запятую, например
+# "export_all_visions:csv:delta". Время — по Бишкеку, к нему добавляется случайный сдвиг
+# до SCHEDULED_EXPORT_JITTER_MINUTES; в часы SCHEDULED_EXPORT_PEAK_HOURS ("9-21") выгрузки не запускаются
+SCHEDULED_EXPORTS = os.getenv("SCHEDULED_EXPORTS", "")
+SCHEDULED_EXPORT_TIME = os.getenv("SCHEDULED_EXPORT_TIME", "03:00")
+SCHEDULED_EXPORT_JITTER_MINUTES = int(os.getenv("SCHEDULED_EXPORT_JITTER_MINUTES", "30"))
+SCHEDULED_EXPORT_PEAK_HOURS = os.getenv("SCHEDULED_EXPORT_PEAK_HOURS", "9-21")
+SCHEDULED_EXPORT_TARGET_IDS = _parse_id_list(os.getenv("SCHEDULED_EXPORT_TARGET_IDS", "")) or OWNER_IDS
+
+# PDF-рецепты: TTF-шрифт с кириллицей и число страниц в части, которую рисует один воркер
+PDF_FONT_PATH = os.getenv("PDF_FONT_PATH", "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf")
+PDF_PAGES_PER_PART = int(os.getenv("PDF_PAGES_PER_PART", "500"))
+
+# Лимит Bot API на загрузку файла (50 MB); файлы больше отправляются частями
+TELEGRAM_UPLOAD_LIMIT_BYTES = int(os.getenv("TELEGRAM_UPLOAD_LIMIT_MB", "49")) * 1024 * 1024
+# Транспорт обновлений: polling (по умолчанию) или webhook — встроенный aiohttp-сервер
+BOT_MODE = os.getenv("BOT_MODE", "polling").strip().lower()
+if BOT_MODE not in ("polling", "webhook"):
+    raise RuntimeError(f"Invalid BOT_MODE: {BOT_MODE} (expected polling or webhook)")
+# Публичный адрес, на который Telegram шлёт обновления (https://bot.example.com); пусто — setWebhook не вызывается
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+# Сверяется с заголовком X-Telegram-Bot-Api-Secret-Token; обязателен в режиме webhook
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+
+# Процессы-обработчики обновлений: 1 — всё в одном процессе; больше — главный процесс принимает
+# обновления и раздаёт их воркерам по пользователю (utils/update_workers.py). Все владельцы
+# закреплены за одним воркером: статус рассылки и выгрузки панели владельца живут в его памяти
+UPDATE_WORKERS = max(1, int(os.getenv("UPDATE_WORKERS", "1")))
@@ -0,0 +1,142 @@
+# database/benchmark_profiles.py
+"""Сравнение профилей SQLite на нагрузке бота.
+
+Одновременно работают: клиенты, которые регистрируются и сохраняют записи зрения (короткие
+транзакции записи), просмотр карточек клиентов (точечные чтения) и выгрузка, которая
+непрерывно читает всю таблицу визитов пачками.
+
+    python -m database.benchmark_profiles --seconds 10 --writers 8 --readers 8
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from database.base import Base
+from database.models import Person, Vision
+from database.sqlite_profile import SQLITE_PROFILES, SQLiteProfile, install_sqlite_profile
+
+
+def _seed(path: Path, persons: int, visions_per_person: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(Person.__table__.insert(), [
+            {"telegram_id": i, "first_name": f"Имя{i}", "last_name": "Фамилия", "phone": f"+996{i:09d}"}
+            for i in range(1, persons + 1)
+        ])
+        conn.execute(Vision.__table__.insert(), [
+            {"person_id": p, "visit_date": date(2024, 1, 1) + timedelta(days=v * 30), "sph_r": -1.0, "pd": 62.0}
+            for p in range(1, persons + 1)
+            for v in range(visions_per_person)
+        ])
+    engine.dispose()
+
+
+def _percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+async def _run_profile(profile: SQLiteProfile, args: argparse.Namespace) -> dict[str, float]:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        _seed(path, args.persons, args.visions)
+
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=args.writers + args.readers + 1)
+        install_sqlite_profile(engine.sync_engine, profile)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        deadline = time.perf_counter() + args.seconds
+        write_latencies: list[float] = []
+        read_latencies: list[float] = []
+        errors = 0
+        export_rows = 0
+        next_telegram_id = args.persons + 1
+
+        async def writer() -> None:
+            nonlocal errors, next_telegram_id
+            while time.perf_counter() < deadline:
+                telegram_id = next_telegram_id
+                next_telegram_id += 1
+                started = time.perf_counter()
+                try:
+                    async with sessions() as session, session.begin():
+                        person = Person(telegram_id=telegram_id, first_name="Новый", phone=f"+997{telegram_id:09d}")
+                        session.add(person)
+                        await session.flush()
+                        session.add(Vision(person_id=person.id, visit_date=date.today(), sph_r=-0.5))
+                    write_latencies.append(time.perf_counter() - started)
+                except OperationalError:
+                    errors += 1
+
+        async def reader() -> None:
+            nonlocal errors
+            person_id = 1
+            while time.perf_counter() < deadline:
+                person_id = person_id % args.persons + 1
+                started = time.perf_counter()
+                try:
+                    async with sessions() as session:
+                        await session.get(Person, person_id)
+                        await session.scalar(select(func.count(Vision.id)).where(Vision.person_id == person_id))
+                    read_latencies.append(time.perf_counter() - started)
+                except OperationalError:
+                    errors += 1
+
+        async def exporter() -> None:
+            nonlocal errors, export_rows
+            while time.perf_counter() < deadline:
+                try:
+                    async with sessions() as session:
+                        result = await session.stream(select(Vision.id, Vision.person_id, Vision.sph_r))
+                        async for partition in result.partitions(500):
+                            export_rows += len(partition)
+                            await asyncio.sleep(0)
+                except OperationalError:
+                    errors += 1
+
+        await asyncio.gather(
+            *(writer() for _ in range(args.writers)),
+            *(reader() for _ in range(args.readers)),
+            exporter(),
+        )
+        await engine.dispose()
+
+    return {
+        "writes/s": len(write_latencies) / args.seconds,
+        "write p95 ms": _percentile(write_latencies, 95) * 1000,
+        "reads/s": len(read_latencies) / args.seconds,
+        "read p95 ms": _percentile(read_latencies, 95) * 1000,
+        "export rows/s": export_rows / args.seconds,
+        "locked errors": errors,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="*", default=list(SQLITE_PROFILES))
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--visions", type=int, default=4)
+    args = parser.parse_args()
+
+    results = {name: await _run_profile(SQLITE_PROFILES[name], args) for name in args.profiles}
+
+    metrics = list(next(iter(results.values())))
+    print(f"{'profile':<14}" + "".join(f"{m:>16}" for m in metrics))
+    for name, row in results.items():
+        print(f"{name:<14}" + "".join(f"{row[m]:>16.1f}" for m in metrics))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,198 @@
+# database/cache.py
+"""Кэш карточек клиентов и их записей зрения в памяти процесса.
+
+Персонал листает профиль туда-обратно (назад в профиль, отмена, выбор из поиска), и каждый
+раз перечитывать одну и ту же строку persons незачем. get_person / get_person_visions читают
+через кэш, а сессии SQLAlchemy сбрасывают затронутые ключи сами: after_flush — по
+изменённым объектам, массовые UPDATE/DELETE по модели — целиком по её виду. Массовый
+оператор с RETURNING id может вместо этого назвать строки сам (CACHE_KEYS_FROM_RETURNING +
+invalidate_persons). Вставка новых клиентов кэш не трогает: новых строк в нём нет.
+После коммита ключи сбрасываются ещё раз: чтение, начатое до коммита, могло успеть положить
+в кэш старые данные. В многопроцессном режиме сброс после коммита рассылается и остальным
+воркерам (utils/worker_ipc.py).
+"""
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, TypeVar
+
+from sqlalchemy import Select, event, inspect, select
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from config import ENTITY_CACHE_SIZE
+from utils import worker_ipc
+from .models import Person, Vision
+from .session import ReadSessionLocal
+
+M = TypeVar("M", Person, Vision)
+
+_INVALIDATIONS_KEY = "entity_cache_invalidations"
+# Опция выполнения массового оператора: затронутые строки вызывающий передаст в invalidate_persons
+CACHE_KEYS_FROM_RETURNING = {"entity_cache_keys_from_returning": True}
+
+
+class LRUCache:
+    def __init__(self, max_entries: int):
+        self._max_entries = max(1, max_entries)
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        value = self._data.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_entries:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+person_cache = LRUCache(ENTITY_CACHE_SIZE)
+vision_list_cache = LRUCache(ENTITY_CACHE_SIZE)
+_CACHES = {"person": person_cache, "visions": vision_list_cache}
+
+# Растёт при каждом сбросе: чтение, пересёкшееся со сбросом, результат в кэш не кладёт
+_generation = 0
+
+
+def _snapshot(obj: M) -> dict[str, Any]:
+    return {attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs}
+
+
+def _restore(model: type[M], data: dict[str, Any]) -> M:
+    # Отсоединённый объект с identity — как объект из закрытой сессии, его можно merge()
+    obj = model(**data)
+    make_transient_to_detached(obj)
+    return obj
+
+
+def _invalidate_local(keys: set[tuple[str, int | None]]) -> None:
+    global _generation
+    if not keys:
+        return
+    _generation += 1
+    for kind, key in keys:
+        if key is None:
+            _CACHES[kind].clear()
+        else:
+            _CACHES[kind].pop(key)
+
+
+def invalidate(keys: set[tuple[str, int | None]]) -> None:
+    """Сбрасывает ключи вида ("person" | "visions", id); id None — весь кэш этого вида."""
+    _invalidate_local(keys)
+    if keys:
+        worker_ipc.publish("entity_cache", keys)
+
+
+worker_ipc.subscribe("entity_cache", _invalidate_local)
+
+
+def clear_entity_cache() -> None:
+    invalidate({("person", None), ("visions", None)})
+
+
+async def get_person(person_id: int) -> Person | None:
+    data = person_cache.get(person_id)
+    if data is None:
+        generation = _generation
+        async with ReadSessionLocal() as session:
+            person = await session.get(Person, person_id)
+        if person is None:
+            return None
+        data = _snapshot(person)
+        if generation == _generation:
+            person_cache.put(person_id, data)
+    return _restore(Person, data)
+
+
+def person_visions_query(person_id: int) -> Select:
+    # Порядок индекса ix_visions_person_id_visit_date — выборка без сортировки
+    return (
+        select(Vision)
+        .where(Vision.person_id == person_id)
+        .order_by(Vision.visit_date.desc(), Vision.id.desc())
+    )
+
+
+async def get_person_visions(person_id: int) -> list[Vision]:
+    """Записи зрения клиента от новых к старым."""
+    rows = vision_list_cache.get(person_id)
+    if rows is None:
+        generation = _generation
+        async with ReadSessionLocal() as session:
+            visions = (await session.scalars(person_visions_query(person_id))).all()
+        rows = [_snapshot(vision) for vision in visions]
+        if generation == _generation:
+            vision_list_cache.put(person_id, rows)
+    return [_restore(Vision, row) for row in rows]
+
+
+def _pending(session: Session) -> set[tuple[str, int | None]]:
+    return session.info.setdefault(_INVALIDATIONS_KEY, set())
+
+
+def invalidate_persons(session: Any, person_ids: Iterable[int]) -> None:
+    """Сбрасывает клиентов и их записи по id, которые вернул RETURNING массового оператора.
+
+    session — Session или AsyncSession; после коммита сброс повторяется и уходит остальным воркерам.
+    """
+    keys = set()
+    for person_id in person_ids:
+        keys.update({("person", person_id), ("visions", person_id)})
+    _pending(getattr(session, "sync_session", session)).update(keys)
+    _invalidate_local(keys)
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_flushed(session: Session, flush_context) -> None:
+    keys = _pending(session)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Person):
+            keys.update({("person", obj.id), ("visions", obj.id)})
+        elif isinstance(obj, Vision):
+            # Триггеры пересчитывают сводку в persons (vision_count, latest_vision_id)
+            keys.update({("visions", obj.person_id), ("person", obj.person_id)})
+    _invalidate_local(keys)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _invalidate_bulk(orm_execute_state) -> None:
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is None or orm_execute_state.execution_options.get("entity_cache_keys_from_returning"):
+        return
+    # Новых клиентов в кэше нет; существующего клиента register_user обновляет отдельным
+    # UPDATE и называет строку сам
+    if orm_execute_state.is_insert and mapper.class_ is Person:
+        return
+    # Какие строки задел массовый оператор, неизвестно — сбрасываем весь вид
+    keys = _pending(orm_execute_state.session)
+    if mapper.class_ in (Person, Vision):
+        keys.update({("person", None), ("visions", None)})
+    _invalidate_local(keys)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed(session: Session) -> None:
+    invalidate(session.info.pop(_INVALIDATIONS_KEY, set()))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back(session: Session) -> None:
+    session.info.pop(_INVALIDATIONS_KEY, None)
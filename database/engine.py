@@ -1,11 +1,68 @@
+from dataclasses import replace
+
+from sqlalchemy import Engine, URL, create_engine, event, make_url
 from sqlalchemy.ext.asyncio import create_async_engine
 
-from config import DATABASE_URL
+from config import DATABASE_URL, READ_POOL_SIZE, SQL_SLOW_QUERY_MS, SQLITE_PRAGMAS, SQLITE_PROFILE
+from .instrumentation import SQLMetrics, install_sql_metrics
+from .sqlite_profile import install_sqlite_profile, resolve_sqlite_profile
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+SQLITE_STORAGE_PROFILE = resolve_sqlite_profile(SQLITE_PROFILE, SQLITE_PRAGMAS)
+# Режим журнала и синхронизацию задаёт пишущее соединение, читающему их менять нельзя
+_READ_ONLY_PROFILE = replace(SQLITE_STORAGE_PROFILE, journal_mode=None, synchronous=None)
+# Время запросов обоих движков процесса бота — гистограмма, медленные запросы, разбивка по хендлерам
+sql_metrics = SQLMetrics(slow_query_ms=SQL_SLOW_QUERY_MS)
 
 async_engine = create_async_engine(
     DATABASE_URL,
     #echo=True,        # лог SQL-запросов (на проде False)
     future=True
 )
+if IS_SQLITE:
+    install_sqlite_profile(async_engine.sync_engine, SQLITE_STORAGE_PROFILE)
+install_sql_metrics(async_engine.sync_engine, sql_metrics)
+
+# Тот же файл БД, но через синхронный драйвер — для фоновых процессов (выгрузки)
+SYNC_DATABASE_URL = make_url(DATABASE_URL).set(drivername="sqlite")
+
+
+def _read_only_url(url: URL) -> URL:
+    # file:<путь>?mode=ro — SQLite сам запрещает запись на уровне открытия файла
+    if not IS_SQLITE or not url.database or url.database == ":memory:":
+        return url
+    return url.set(database=f"file:{url.database}?mode=ro", query={**url.query, "uri": "true"})
+
+
+def _install_read_only(engine: Engine) -> None:
+    if not IS_SQLITE:
+        return
+    install_sqlite_profile(engine, _READ_ONLY_PROFILE)
+
+    @event.listens_for(engine, "connect")
+    def _query_only(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA query_only=1")
+        cursor.close()
+
+
+# Движок только для чтения со своим пулом: тяжёлые чтения не занимают соединения пишущего движка
+read_engine = create_async_engine(
+    _read_only_url(make_url(DATABASE_URL)),
+    pool_size=READ_POOL_SIZE,
+    future=True,
+)
+_install_read_only(read_engine.sync_engine)
+install_sql_metrics(read_engine.sync_engine, sql_metrics)
 
 
+def create_sync_engine(read_only: bool = False, **kwargs) -> Engine:
+    """Синхронный движок на тот же файл с тем же профилем SQLite."""
+    if read_only:
+        engine = create_engine(_read_only_url(SYNC_DATABASE_URL), **kwargs)
+        _install_read_only(engine)
+        return engine
+    engine = create_engine(SYNC_DATABASE_URL, **kwargs)
+    if IS_SQLITE:
+        install_sqlite_profile(engine, SQLITE_STORAGE_PROFILE)
+    return engine
@@ -0,0 +1,209 @@
+# database/fsm_storage.py
+"""Хранилище FSM aiogram в SQLite (таблица fsm_states).
+
+Состояние и данные форм живут в памяти процесса и только догоняются на диск: изменения
+копятся и раз в FSM_FLUSH_INTERVAL_SECONDS уходят одной операцией очереди записи, сколько бы
+update_data ни сделали шаги формы. При остановке бота и перед перезапуском из панели
+разработчика накопленное дописывается сразу (close / flush), поэтому персонал продолжает
+заполнение формы с того же шага.
+
+Данные формы сериализуются в JSON в момент set_data: несериализуемое значение падает
+в хендлере, который его положил, а не позже при записи на диск.
+
+При восстановлении БД из бекапа (restoring) память, наоборот, отбрасывается: иначе
+накопленные изменения переписали бы восстановленную таблицу.
+"""
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import FSM_CACHE_SIZE, FSM_FLUSH_INTERVAL_SECONDS
+from utils import worker_ipc
+from .models import FSMRecord, get_kg_time
+from .session import ReadSessionLocal
+from .write_queue import submit_write
+
+logger = logging.getLogger(__name__)
+
+_EMPTY_DATA = "{}"
+# Строк в одном INSERT: 4 параметра на строку, лимит SQLite на параметры запроса не задевается
+_ROWS_PER_STATEMENT = 500
+
+
+@dataclass
+class _Entry:
+    state: str | None = None
+    data: str = _EMPTY_DATA
+    # Растёт при каждом изменении: запись считается сохранённой, только если после
+    # снимка для сброса её больше не меняли
+    version: int = 0
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(
+        self,
+        flush_interval: float = FSM_FLUSH_INTERVAL_SECONDS,
+        max_entries: int = FSM_CACHE_SIZE,
+        key_builder: KeyBuilder | None = None,
+    ):
+        self._flush_interval = max(0.0, flush_interval)
+        self._max_entries = max(1, max_entries)
+        self._key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._dirty: set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: asyncio.Task | None = None
+        self.stats = {"changes": 0, "flushes": 0, "rows_written": 0, "loads": 0}
+
+    async def _entry(self, key: StorageKey) -> tuple[str, _Entry]:
+        record_key = self._key_builder.build(key)
+        entry = self._entries.get(record_key)
+        if entry is None:
+            self.stats["loads"] += 1
+            async with ReadSessionLocal() as session:
+                row = (await session.execute(
+                    select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == record_key)
+                )).one_or_none()
+            # Пока шло чтение, значение могло появиться в памяти — оно новее прочитанного
+            entry = self._entries.setdefault(record_key, _Entry(row.state, row.data) if row else _Entry())
+            self._evict()
+        self._entries.move_to_end(record_key)
+        return record_key, entry
+
+    def _evict(self) -> None:
+        # Из памяти уходят только записи, уже сохранённые на диск
+        excess = len(self._entries) - self._max_entries
+        if excess <= 0:
+            return
+        for record_key in list(self._entries):
+            if record_key not in self._dirty:
+                del self._entries[record_key]
+                excess -= 1
+                if not excess:
+                    return
+
+    def _changed(self, record_key: str, entry: _Entry) -> None:
+        entry.version += 1
+        self.stats["changes"] += 1
+        # Запись могла быть вытеснена, пока её читали, — грязная должна остаться в памяти
+        self._entries[record_key] = entry
+        self._dirty.add(record_key)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(), name="fsm-storage-flush")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record_key, entry = await self._entry(key)
+        entry.state = state.state if isinstance(state, State) else state
+        self._changed(record_key, entry)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        _, entry = await self._entry(key)
+        return entry.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            raise TypeError(f"Data must be a dict, not {type(data).__name__}")
+        encoded = json.dumps(data, ensure_ascii=False)
+        record_key, entry = await self._entry(key)
+        entry.data = encoded
+        self._changed(record_key, entry)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, entry = await self._entry(key)
+        # Каждый раз новый словарь: правки вызывающего не попадают в хранилище мимо set_data
+        return json.loads(entry.data)
+
+    async def _flush_later(self) -> None:
+        while self._dirty:
+            await asyncio.sleep(self._flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                # Записи остались грязными — повторим на следующем круге
+                logger.exception("FSM storage flush failed")
+
+    async def flush(self) -> None:
+        """Сохраняет все накопленные изменения; возвращается после коммита."""
+        async with self._flush_lock:
+            if not self._dirty:
+                return
+            snapshot = {record_key: self._entries[record_key] for record_key in self._dirty}
+            versions = {record_key: entry.version for record_key, entry in snapshot.items()}
+            now = get_kg_time()
+            rows = [
+                {"key": record_key, "state": entry.state, "data": entry.data, "updated_at": now}
+                for record_key, entry in snapshot.items()
+                if entry.state is not None or entry.data != _EMPTY_DATA
+            ]
+            # state.clear() — строка больше не нужна
+            cleared = [record_key for record_key, entry in snapshot.items()
+                       if entry.state is None and entry.data == _EMPTY_DATA]
+
+            async def write(session: AsyncSession) -> None:
+                for start in range(0, len(rows), _ROWS_PER_STATEMENT):
+                    stmt = insert(FSMRecord).values(rows[start:start + _ROWS_PER_STATEMENT])
+                    await session.execute(stmt.on_conflict_do_update(
+                        index_elements=[FSMRecord.key],
+                        set_={"state": stmt.excluded.state, "data": stmt.excluded.data,
+                              "updated_at": stmt.excluded.updated_at},
+                    ))
+                for start in range(0, len(cleared), _ROWS_PER_STATEMENT):
+                    chunk = cleared[start:start + _ROWS_PER_STATEMENT]
+                    await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(chunk)))
+
+            await submit_write(write)
+
+            for record_key, version in versions.items():
+                if snapshot[record_key].version == version:
+                    self._dirty.discard(record_key)
+            self.stats["flushes"] += 1
+            self.stats["rows_written"] += len(snapshot)
+            self._evict()
+
+    def _forget(self) -> None:
+        # Несохранённые изменения тоже: источник истины теперь таблица на диске
+        self._entries.clear()
+        self._dirty.clear()
+
+    @asynccontextmanager
+    async def restoring(self) -> AsyncIterator[None]:
+        """Блок, в котором БД заменяется целиком (восстановление из бекапа).
+
+        Пока блок выполняется, накопленное не пишется на диск; после него состояние в памяти
+        отбрасывается — здесь и в остальных воркерах — и читается заново из таблицы.
+        """
+        async with self._flush_lock:
+            yield
+            self._forget()
+        worker_ipc.publish("fsm_storage", None)
+
+    async def close(self) -> None:
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __bool__(self) -> bool:
+        # Dispatcher берёт storage or MemoryStorage(): без этого пустое хранилище (len 0)
+        # считалось бы ложным и диспетчер молча держал бы FSM в памяти
+        return True
+
+
+fsm_storage = SQLiteStorage()
+worker_ipc.subscribe("fsm_storage", lambda _: fsm_storage._forget())
@@ -1,11 +1,14 @@
+import logging
+
 from sqlalchemy.ext.asyncio import AsyncEngine
 
 from .engine import async_engine
-from .base import Base
-from .models import Person, Vision
-  # ОБЯЗАТЕЛЬНО: чтобы модели зарегистрировались
+from .migrations import run_migrations
+
+logger = logging.getLogger(__name__)
 
 
 async def init_db(engine: AsyncEngine = async_engine) -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+    # Схема ведётся версионными миграциями (database/migrations.py), а не create_all
+    version = await run_migrations(engine)
+    logger.info("Схема БД актуальна, версия %s", version)
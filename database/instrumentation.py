@@ -0,0 +1,122 @@
+# database/instrumentation.py
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque
+
+from sqlalchemy import Engine, event
+
+logger = logging.getLogger(__name__)
+
+# Хендлер aiogram, в контексте которого выполняется запрос; ставит MetricsMiddleware
+current_handler: ContextVar[str] = ContextVar("current_handler", default="background")
+# Счётчик запросов текущего вызова хендлера — для поиска N+1
+_call_queries: ContextVar[list[int] | None] = ContextVar("call_queries", default=None)
+
+# Верхние границы корзин гистограммы, мс; последняя корзина — всё, что дольше
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000)
+_PARAMS_PREVIEW_CHARS = 300
+_STATEMENT_PREVIEW_CHARS = 500
+
+
+@dataclass
+class HandlerSQLStats:
+    calls: int = 0
+    queries: int = 0
+    total_ms: float = 0.0
+    # Запросы, выполненные прямо в вызовах хендлера (без операций, ушедших в очередь записи)
+    queries_in_calls: int = 0
+    max_queries_per_call: int = 0
+
+    @property
+    def queries_per_call(self) -> float:
+        return self.queries_in_calls / self.calls if self.calls else 0.0
+
+
+@dataclass
+class SlowQuery:
+    at: float
+    handler: str
+    duration_ms: float
+    statement: str
+    params: str
+
+
+@dataclass
+class SQLMetrics:
+    slow_query_ms: float
+    histogram: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+    handlers: dict[str, HandlerSQLStats] = field(default_factory=dict)
+    slow_queries: Deque[SlowQuery] = field(default_factory=lambda: deque(maxlen=50))
+
+    def record(self, statement: str, parameters: Any, duration_ms: float) -> None:
+        handler = current_handler.get()
+        self.histogram[bisect_left(LATENCY_BUCKETS_MS, duration_ms)] += 1
+        stats = self.handlers.setdefault(handler, HandlerSQLStats())
+        stats.queries += 1
+        stats.total_ms += duration_ms
+        counter = _call_queries.get()
+        if counter is not None:
+            counter[0] += 1
+
+        if duration_ms >= self.slow_query_ms:
+            params = repr(parameters)[:_PARAMS_PREVIEW_CHARS]
+            statement = " ".join(statement.split())[:_STATEMENT_PREVIEW_CHARS]
+            self.slow_queries.append(SlowQuery(time.time(), handler, duration_ms, statement, params))
+            logger.warning("Slow SQL %.1f ms in %s: %s | params=%s", duration_ms, handler, statement, params)
+
+    def begin_call(self, handler: str) -> tuple[Any, Any]:
+        return current_handler.set(handler), _call_queries.set([0])
+
+    def end_call(self, tokens: tuple[Any, Any]) -> None:
+        handler = current_handler.get()
+        queries = _call_queries.get()[0]
+        handler_token, counter_token = tokens
+        current_handler.reset(handler_token)
+        _call_queries.reset(counter_token)
+
+        stats = self.handlers.setdefault(handler, HandlerSQLStats())
+        stats.calls += 1
+        stats.queries_in_calls += queries
+        stats.max_queries_per_call = max(stats.max_queries_per_call, queries)
+
+    def percentile_bucket(self, q: float) -> str:
+        """Корзина гистограммы, в которую попадает q-й процентиль, — для панели разработчика."""
+        total = sum(self.histogram)
+        if not total:
+            return "—"
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen >= total * q:
+                break
+        if index < len(LATENCY_BUCKETS_MS):
+            return f"≤{LATENCY_BUCKETS_MS[index]} мс"
+        return f">{LATENCY_BUCKETS_MS[-1]} мс"
+
+    def reset(self) -> None:
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.handlers.clear()
+        self.slow_queries.clear()
+
+
+def install_sql_metrics(engine: Engine, metrics: SQLMetrics) -> None:
+    """Замеряет каждый запрос движка через before/after_cursor_execute."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        started_at = conn.info["query_started_at"].pop()
+        metrics.record(statement, parameters, (time.perf_counter() - started_at) * 1000)
+
+    @event.listens_for(engine, "handle_error")
+    def _failed(exception_context) -> None:
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started_at"):
+            conn.info["query_started_at"].pop()
@@ -0,0 +1,275 @@
+# database/migrations.py
+"""Версионные миграции схемы.
+
+Номер последней применённой миграции хранится в таблице schema_version. При старте бота
+run_migrations применяет все миграции с большим номером по порядку: сначала DDL одной
+транзакцией, затем заполнение данных (backfill) короткими транзакциями по
+MIGRATION_BACKFILL_CHUNK строк, чтобы не держать блокировку записи на всю таблицу.
+Версия фиксируется только после backfill — прерванная миграция повторится целиком.
+
+Миграции описывают схему явно и не читают текущие модели: модель меняется, а применённая
+миграция — нет. Миграция 1 создаёт схему на момент перехода на миграции, остальное добавляют
+следующие; новая колонка, индекс или таблица — новая миграция. DDL миграций идемпотентен
+(add_column_if_missing, IF NOT EXISTS): БД, созданные до миграций через create_all, уже
+содержат часть схемы.
+"""
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Callable
+
+from sqlalchemy import (
+    BigInteger, Column, Computed, Connection, Date, DateTime, Float, ForeignKey, Integer, MetaData, String, Table,
+    Text, func, inspect, text,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from config import MIGRATION_BACKFILL_CHUNK
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Backfill:
+    """UPDATE <table> SET <assignments> для строк, подходящих под <pending>, пачками по первичному ключу."""
+    table: str
+    assignments: str
+    pending: str
+    key: str = "id"
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+    backfills: tuple[Backfill, ...] = ()
+
+
+def add_column_if_missing(conn: Connection, table: str, column: str, ddl: str) -> None:
+    if column not in {c["name"] for c in inspect(conn).get_columns(table)}:
+        conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+
+# Схема миграции 1 — снимок, а не модели: правки database/models.py её не меняют
+_BASELINE = MetaData()
+
+Table(
+    "persons", _BASELINE,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("telegram_id", Integer, unique=True, nullable=True, index=True),
+    Column("username", String, nullable=True),
+    Column("first_name", String, nullable=True),
+    Column("last_name", String, nullable=True),
+    Column(
+        "full_name", String,
+        Computed("TRIM(COALESCE(TRIM(first_name), '') || ' ' || COALESCE(TRIM(last_name), ''))", persisted=True),
+        nullable=True, index=True,
+    ),
+    Column("phone", String, unique=True, nullable=True, index=True),
+    Column("age", Integer, nullable=True),
+    Column("role", String, nullable=False, index=True),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Column("updated_at", DateTime(timezone=True), nullable=False),
+    Column("last_visit_date", Date, nullable=True),
+)
+
+Table(
+    "visions", _BASELINE,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("person_id", ForeignKey("persons.id", ondelete="CASCADE"), nullable=False, index=True),
+    Column("visit_date", Date, nullable=False, index=True),
+    Column("sph_r", Float, nullable=True),
+    Column("cyl_r", Float, nullable=True),
+    Column("axis_r", Integer, nullable=True),
+    Column("sph_l", Float, nullable=True),
+    Column("cyl_l", Float, nullable=True),
+    Column("axis_l", Integer, nullable=True),
+    Column("pd", Float, nullable=True),
+    Column("lens_type", String, nullable=True),
+    Column("frame_model", String, nullable=True),
+    Column("note", String, nullable=True),
+    Column("created_at", DateTime(timezone=True), server_default=func.now(), nullable=False),
+)
+
+Table(
+    "bot_contents", _BASELINE,
+    Column("key", String(30), primary_key=True),
+    Column("value", Text, nullable=False),
+)
+
+Table(
+    "export_watermarks", _BASELINE,
+    Column("owner_id", BigInteger, primary_key=True),
+    Column("export_key", String(50), primary_key=True),
+    Column("exported_at", DateTime(timezone=True), nullable=False),
+)
+
+Table(
+    "data_version", _BASELINE,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, nullable=False),
+)
+
+Table(
+    "export_artifacts", _BASELINE,
+    Column("export_key", String(50), primary_key=True),
+    Column("format_key", String(20), primary_key=True),
+    Column("data_version", Integer, nullable=False),
+    Column("file_id", String, nullable=False),
+)
+
+
+def _create_tables(conn: Connection) -> None:
+    _BASELINE.create_all(conn)
+
+
+def _visions_updated_at(conn: Connection) -> None:
+    add_column_if_missing(conn, "visions", "updated_at", "DATETIME")
+
+
+# Индексы, добавленные после исходной схемы: (имя, таблица, колонки)
+_ADDED_INDEXES = (
+    ("ix_persons_created_at", "persons", "created_at"),
+    ("ix_persons_updated_at", "persons", "updated_at"),
+    ("ix_persons_last_visit_date", "persons", "last_visit_date"),
+    ("ix_persons_role_full_name", "persons", "role, full_name"),
+    ("ix_visions_updated_at", "visions", "updated_at"),
+    ("ix_visions_person_id_visit_date", "visions", "person_id, visit_date DESC, id DESC"),
+)
+
+
+def _create_model_indexes(conn: Connection) -> None:
+    for name, table, columns in _ADDED_INDEXES:
+        conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def _data_version_triggers(conn: Connection) -> None:
+    # Любая запись в persons/visions двигает счётчик версии данных (кэш выгрузок сверяется с ним)
+    conn.exec_driver_sql("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+    for table_name in ("persons", "visions"):
+        for operation in ("INSERT", "UPDATE", "DELETE"):
+            conn.exec_driver_sql(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table_name}_{operation.lower()}_data_version "
+                f"AFTER {operation} ON {table_name} "
+                "BEGIN UPDATE data_version SET version = version + 1 WHERE id = 1; END"
+            )
+
+
+def latest_vision_sql(person_id: str) -> str:
+    """Подзапрос id последней записи зрения клиента; person_id — SQL-выражение."""
+    # Тот же порядок, что у индекса ix_visions_person_id_visit_date — выборка без сортировки
+    return (
+        f"(SELECT id FROM visions WHERE person_id = {person_id} "
+        "ORDER BY visit_date DESC, id DESC LIMIT 1)"
+    )
+
+
+def _vision_count_sql(person_id: str) -> str:
+    return f"(SELECT COUNT(*) FROM visions WHERE person_id = {person_id})"
+
+
+def _person_vision_summary(conn: Connection) -> None:
+    add_column_if_missing(conn, "persons", "vision_count", "INTEGER NOT NULL DEFAULT 0")
+    add_column_if_missing(conn, "persons", "latest_vision_id", "INTEGER")
+    # Сводка меняется в той же транзакции, что и записи зрения, каким бы путём они ни писались
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS trg_visions_insert_person_summary AFTER INSERT ON visions BEGIN "
+        "UPDATE persons SET vision_count = vision_count + 1, "
+        f"latest_vision_id = {latest_vision_sql('NEW.person_id')} WHERE id = NEW.person_id; END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS trg_visions_delete_person_summary AFTER DELETE ON visions BEGIN "
+        "UPDATE persons SET vision_count = vision_count - 1, "
+        f"latest_vision_id = {latest_vision_sql('OLD.person_id')} WHERE id = OLD.person_id; END"
+    )
+    conn.exec_driver_sql(
+        "CREATE TRIGGER IF NOT EXISTS trg_visions_update_person_summary "
+        "AFTER UPDATE OF person_id, visit_date ON visions BEGIN "
+        f"UPDATE persons SET vision_count = {_vision_count_sql('persons.id')}, "
+        f"latest_vision_id = {latest_vision_sql('persons.id')} "
+        "WHERE id IN (OLD.person_id, NEW.person_id); END"
+    )
+
+
+def _fsm_states(conn: Connection) -> None:
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS fsm_states ("
+        "key VARCHAR NOT NULL PRIMARY KEY, state VARCHAR, data TEXT NOT NULL, updated_at DATETIME NOT NULL)"
+    )
+
+
+MIGRATIONS: tuple[Migration, ...] = (
+    Migration(1, "create tables", _create_tables),
+    Migration(
+        2,
+        "visions.updated_at",
+        _visions_updated_at,
+        backfills=(Backfill("visions", "updated_at = created_at", "updated_at IS NULL"),),
+    ),
+    Migration(3, "model indexes", _create_model_indexes),
+    Migration(4, "data_version triggers", _data_version_triggers),
+    Migration(
+        5,
+        "persons vision summary",
+        _person_vision_summary,
+        backfills=(
+            Backfill(
+                "persons",
+                f"vision_count = {_vision_count_sql('persons.id')}, "
+                f"latest_vision_id = {latest_vision_sql('persons.id')}",
+                f"vision_count != {_vision_count_sql('persons.id')} "
+                f"OR latest_vision_id IS NOT {latest_vision_sql('persons.id')}",
+            ),
+        ),
+    ),
+    Migration(6, "fsm_states", _fsm_states),
+)
+
+
+def _ensure_version_table(conn: Connection) -> int:
+    conn.exec_driver_sql(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INTEGER PRIMARY KEY, name VARCHAR NOT NULL, applied_at DATETIME DEFAULT CURRENT_TIMESTAMP)"
+    )
+    return conn.exec_driver_sql("SELECT COALESCE(MAX(version), 0) FROM schema_version").scalar()
+
+
+async def _run_backfill(engine: AsyncEngine, backfill: Backfill, chunk: int) -> int:
+    statement = text(
+        f"UPDATE {backfill.table} SET {backfill.assignments} WHERE {backfill.key} IN ("
+        f"SELECT {backfill.key} FROM {backfill.table} WHERE {backfill.pending} LIMIT :chunk)"
+    )
+    total = 0
+    while True:
+        async with engine.begin() as conn:
+            updated = (await conn.execute(statement, {"chunk": chunk})).rowcount
+        total += updated
+        if updated < chunk:
+            return total
+        # Между пачками блокировка записи свободна — другие соединения успевают записать своё
+        await asyncio.sleep(0)
+
+
+async def run_migrations(engine: AsyncEngine, chunk: int = MIGRATION_BACKFILL_CHUNK) -> int:
+    """Применяет недостающие миграции и возвращает итоговую версию схемы."""
+    async with engine.begin() as conn:
+        current = await conn.run_sync(_ensure_version_table)
+
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+        logger.info("Applying migration %s: %s", migration.version, migration.name)
+        async with engine.begin() as conn:
+            await conn.run_sync(migration.upgrade)
+        for backfill in migration.backfills:
+            updated = await _run_backfill(engine, backfill, chunk)
+            logger.info("Backfilled %s rows in %s (%s)", updated, backfill.table, backfill.assignments)
+        async with engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO schema_version (version, name) VALUES (:version, :name)"),
+                {"version": migration.version, "name": migration.name},
+            )
+        current = migration.version
+
+    return current
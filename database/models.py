@@ -1,6 +1,6 @@
 from datetime import datetime, timezone, timedelta, date
 from typing import Optional
-from sqlalchemy import BigInteger, Boolean, Column, Computed, Date, DateTime, Float, Index, Integer, String, ForeignKey, Text, func
+from sqlalchemy import BigInteger, Boolean, Column, Computed, Date, DateTime, Float, Index, Integer, String, ForeignKey, Text, func, text
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from database.base import Base
@@ -44,21 +44,35 @@ class Person(Base):
     created_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=get_kg_time, 
-        nullable=False
+        nullable=False,
+        index=True
     )
 
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
         default=get_kg_time,
         onupdate=get_kg_time,
-        nullable=False
+        nullable=False,
+        index=True
     )
 
-    last_visit_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True)
+    last_visit_date: Mapped[Optional[date]] = mapped_column(Date, nullable=True, index=True)
+
+    # Сводка по записям зрения для карточки профиля; ведут триггеры БД (см. database/migrations.py)
+    vision_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+    # Без внешнего ключа: persons и visions ссылались бы друг на друга
+    latest_vision_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
 
     visions: Mapped[list["Vision"]] = relationship(
         "Vision", back_populates="person", cascade="all, delete-orphan"
     )
+
+    __table_args__ = (
+        # Список админов: фильтр по роли и сортировка по имени без временной сортировки
+        Index("ix_persons_role_full_name", "role", "full_name"),
+    )
+
+
 class Vision(Base):
     __tablename__ = "visions"
 
@@ -91,11 +105,25 @@ class Vision(Base):
         nullable=False
     )
 
+    # Время последнего изменения — для инкрементальных выгрузок
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=get_kg_time,
+        onupdate=get_kg_time,
+        nullable=False,
+        index=True
+    )
+
     person: Mapped["Person"] = relationship(
         "Person",
         back_populates="visions"
     )
 
+    __table_args__ = (
+        # Записи клиента от новых к старым: карточка профиля, список записей, последняя запись в выгрузке
+        Index("ix_visions_person_id_visit_date", "person_id", text("visit_date DESC"), text("id DESC")),
+    )
+
 
 class BotContent(Base):
     __tablename__ = "bot_contents"
@@ -104,4 +132,38 @@ class BotContent(Base):
     value: Mapped[str] = mapped_column(Text, nullable=False)
 
 
+class ExportWatermark(Base):
+    """Момент, по состоянию на который владелец уже получил выгрузку (для дельта-выгрузок)."""
+    __tablename__ = "export_watermarks"
+
+    owner_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    export_key: Mapped[str] = mapped_column(String(50), primary_key=True)
+    exported_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False)
+
+
+class DataVersion(Base):
+    """Счётчик изменений persons/visions — увеличивается триггерами (см. database/migrations.py)."""
+    __tablename__ = "data_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+class ExportArtifact(Base):
+    """Последний отправленный файл выгрузки: его file_id переиспользуется, пока данные не менялись."""
+    __tablename__ = "export_artifacts"
+
+    export_key: Mapped[str] = mapped_column(String(50), primary_key=True)
+    format_key: Mapped[str] = mapped_column(String(20), primary_key=True)
+    data_version: Mapped[int] = mapped_column(Integer, nullable=False)
+    file_id: Mapped[str] = mapped_column(String, nullable=False)
+
+
+class FSMRecord(Base):
+    """Состояние FSM и данные формы пользователя — переживают перезапуск (см. database/fsm_storage.py)."""
+    __tablename__ = "fsm_states"
 
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    state: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    data: Mapped[str] = mapped_column(Text, nullable=False, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=False, default=get_kg_time)
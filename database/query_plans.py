@@ -0,0 +1,166 @@
+# database/query_plans.py
+"""Проверка планов горячих запросов.
+
+Каждый запрос из роутеров и выгрузок прогоняется через EXPLAIN QUERY PLAN на засеянной
+временной БД со схемой бота. Составные запросы берутся из тех же функций, что вызывают
+хендлеры (client_search_query, person_visions_query, пейджер, выгрузки), — проверяется
+ровно тот SQL, что выполняется. Полный проход по таблице (SCAN) или сортировка во временном
+B-дереве (USE TEMP B-TREE) считаются регрессией, если запрос не помечен как допускающий их.
+Код возврата ненулевой при любой регрессии — проверку можно ставить в CI или перед релизом.
+
+    python -m database.query_plans --verbose
+"""
+import argparse
+import asyncio
+import sys
+import tempfile
+from dataclasses import dataclass
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable
+
+from sqlalchemy import Connection, Engine, Select, create_engine, func, literal_column, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from database.base import Base
+from database.cache import person_visions_query
+from database.migrations import latest_vision_sql, run_migrations
+from database.models import FSMRecord, Person, Vision
+from services.client_search import client_search_query
+from services.exports import EXPORT_SPECS, ExportFilters, build_query
+from services.pdf_cards import cards_query
+from services.vision_pager import first_page_query, neighbour_query
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    name: str
+    build: Callable[[], Select]
+    # Таблицы, которые запрос законно читает целиком (выгрузки, поиск по подстроке)
+    allow_scan: tuple[str, ...] = ()
+    allow_temp_btree: bool = False
+
+
+HOT_QUERIES: tuple[HotQuery, ...] = (
+    HotQuery("role check by telegram_id", lambda: select(Person.role).where(Person.telegram_id == 1)),
+    HotQuery("registration lookup by telegram_id", lambda: select(Person).where(Person.telegram_id == 1)),
+    HotQuery("lookup by phone", lambda: select(Person).where(Person.phone == "996700000001")),
+    HotQuery("admins list", lambda: select(Person).where(Person.role == "admin").order_by(Person.full_name)),
+    # LIKE '%...%' не использует индекс — поиск по подстроке читает persons целиком.
+    # Цифры, похожие и на telegram_id, и на телефон, включают все три ветки условия
+    HotQuery(
+        "client search",
+        lambda: client_search_query("0700000001", "996700000001"),
+        allow_scan=("persons",),
+    ),
+    HotQuery("profile vision list", lambda: person_visions_query(1)),
+    # Подзапрос триггеров сводки в persons — выполняется на каждую вставку и удаление записи
+    HotQuery(
+        "vision summary latest_vision_id",
+        lambda: select(literal_column(latest_vision_sql("1"))),
+    ),
+    HotQuery("vision pager first page", lambda: first_page_query(1)),
+    HotQuery("vision pager older", lambda: neighbour_query(1, "older")),
+    HotQuery("vision pager newer", lambda: neighbour_query(1, "newer")),
+    HotQuery("client pdf cards", lambda: cards_query(0, None, 1)),
+    HotQuery(
+        "fsm state load",
+        lambda: select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == "fsm:1:1:1:default"),
+    ),
+    HotQuery("db stats visions count", lambda: select(func.count(Vision.id)), allow_scan=("visions",)),
+    HotQuery("db stats persons by role", lambda: select(func.count(Person.id)).where(Person.role == "owner")),
+    *(
+        HotQuery(f"export {spec.key}", lambda spec=spec: build_query(spec, ExportFilters(), None),
+                 allow_scan=("persons", "visions"))
+        for spec in EXPORT_SPECS.values()
+    ),
+    # Без гистограмм значений (stat4) SQLite не знает, насколько узок диапазон updated_at > ?,
+    # и выбирает проход в порядке id вместо индекса с досортировкой — сортировку всё равно запрещаем
+    *(
+        HotQuery(f"delta export {spec.key}", lambda spec=spec: build_query(spec, ExportFilters(), date(2025, 1, 1)),
+                 allow_scan=("persons", "visions"))
+        for spec in EXPORT_SPECS.values()
+    ),
+)
+
+
+def _seed(conn: Connection, persons: int, visions_per_person: int) -> None:
+    conn.execute(Person.__table__.insert(), [
+        {"telegram_id": i, "first_name": f"Имя{i}", "last_name": "Фамилия", "phone": f"+996{i:09d}",
+         "role": "admin" if i % 500 == 0 else "client"}
+        for i in range(1, persons + 1)
+    ])
+    conn.execute(Vision.__table__.insert(), [
+        {"person_id": p, "visit_date": date(2023, 1, 1) + timedelta(days=(p * 7 + v * 90) % 900), "sph_r": -1.0}
+        for p in range(1, persons + 1)
+        for v in range(visions_per_person)
+    ])
+    # Статистика для планировщика, как на живой БД после ANALYZE/optimize
+    conn.exec_driver_sql("ANALYZE")
+
+
+async def _migrate(url: str) -> None:
+    # Схема та же, что получает бот при старте
+    engine = create_async_engine(url)
+    await run_migrations(engine)
+    await engine.dispose()
+
+
+def prepare_database(path: Path, persons: int = 5000, visions_per_person: int = 4) -> Engine:
+    """БД со схемой бота и синтетическими данными; возвращает синхронный движок к ней."""
+    asyncio.run(_migrate(f"sqlite+aiosqlite:///{path}"))
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        _seed(conn, persons, visions_per_person)
+    return engine
+
+
+def explain(conn: Connection, query: Select) -> list[str]:
+    compiled = query.compile(dialect=conn.dialect)
+    params = compiled.construct_params()
+    positional = tuple(params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", positional).all()
+    return [row[-1] for row in rows]
+
+
+def plan_problems(hot_query: HotQuery, plan: list[str]) -> list[str]:
+    problems = []
+    for detail in plan:
+        words = detail.split()
+        if words[0] == "SCAN" and words[1] in Base.metadata.tables and words[1] not in hot_query.allow_scan:
+            problems.append(detail)
+        elif "USE TEMP B-TREE" in detail and not hot_query.allow_temp_btree:
+            problems.append(detail)
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persons", type=int, default=5000)
+    parser.add_argument("--visions", type=int, default=4)
+    parser.add_argument("--verbose", action="store_true", help="печатать план каждого запроса")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = prepare_database(Path(tmp) / "plans.db", args.persons, args.visions)
+
+        with engine.connect() as conn:
+            for hot_query in HOT_QUERIES:
+                plan = explain(conn, hot_query.build())
+                problems = plan_problems(hot_query, plan)
+                failures += bool(problems)
+                print(f"{'FAIL' if problems else 'ok':<5}{hot_query.name}")
+                for detail in problems:
+                    print(f"       {detail}")
+                if args.verbose and not problems:
+                    for detail in plan:
+                        print(f"       {detail}")
+        engine.dispose()
+
+    print(f"\n{len(HOT_QUERIES) - failures}/{len(HOT_QUERIES)} запросов без регрессий")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 from typing import AsyncGenerator
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from .engine import async_engine
+from .engine import async_engine, read_engine
 
 
 AsyncSessionLocal = async_sessionmaker(
@@ -11,6 +11,14 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+# Сессии только для чтения: выгрузки, статистика, поиск
+ReadSessionLocal = async_sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+)
+
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
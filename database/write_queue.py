@@ -0,0 +1,137 @@
+# database/write_queue.py
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import WRITE_BATCH_MAX_OPS
+from database.instrumentation import current_handler
+from database.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+WriteOp = Callable[[AsyncSession], Awaitable[T]]
+
+
+class WriteQueue:
+    """Единственный писатель в SQLite.
+
+    Хендлеры передают операции записи (async-функции от сессии) в submit(); задача-писатель
+    выполняет всё, что накопилось в очереди, одной транзакцией (до WRITE_BATCH_MAX_OPS операций)
+    и после коммита отдаёт каждому вызывающему результат его операции. Если операция падает,
+    пачка откатывается и операции повторяются по одной — ошибка достаётся только её автору.
+    """
+
+    def __init__(self, session_factory: async_sessionmaker[AsyncSession], max_batch: int):
+        self._session_factory = session_factory
+        self._max_batch = max(1, max_batch)
+        self._queue: asyncio.Queue[tuple[WriteOp, asyncio.Future, str] | None] | None = None
+        self._task: asyncio.Task | None = None
+        self.stats = {"batches": 0, "ops": 0, "max_batch": 0, "retried_batches": 0}
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run(), name="sqlite-write-queue")
+
+    async def stop(self) -> None:
+        """Дописывает уже поставленные операции и останавливает писателя."""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, op: WriteOp[T]) -> T:
+        if not self.running:
+            # Писатель не запущен (инициализация БД, скрипты) — пишем своей транзакцией
+            return await self._execute_alone(op)
+        future = asyncio.get_running_loop().create_future()
+        # Имя хендлера переносится в задачу-писателя, чтобы его запросы засчитывались ему
+        await self._queue.put((op, future, current_handler.get()))
+        return await future
+
+    async def _execute_alone(self, op: WriteOp[T]) -> T:
+        async with self._session_factory() as session:
+            result = await op(session)
+            await session.commit()
+            return result
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch = [item]
+            # Всё, что пришло, пока шёл прошлый коммит, уходит одной транзакцией
+            while len(batch) < self._max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            batch = [(op, future, handler) for op, future, handler in batch if not future.cancelled()]
+            if batch:
+                await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: list[tuple[WriteOp, asyncio.Future, str]]) -> None:
+        self.stats["batches"] += 1
+        self.stats["ops"] += len(batch)
+        self.stats["max_batch"] = max(self.stats["max_batch"], len(batch))
+
+        try:
+            async with self._session_factory() as session:
+                results = [await self._run_op(op, session, handler) for op, _, handler in batch]
+                await session.commit()
+        except Exception as e:
+            if len(batch) == 1:
+                _, future, _ = batch[0]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            logger.warning("Write batch of %s ops failed, retrying one by one: %s", len(batch), e)
+            self.stats["retried_batches"] += 1
+            for op, future, handler in batch:
+                await self._commit_one(op, future, handler)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    @staticmethod
+    async def _run_op(op: WriteOp[T], session: AsyncSession, handler: str) -> T:
+        token = current_handler.set(handler)
+        try:
+            return await op(session)
+        finally:
+            current_handler.reset(token)
+
+    async def _commit_one(self, op: WriteOp, future: asyncio.Future, handler: str) -> None:
+        token = current_handler.set(handler)
+        try:
+            result: Any = await self._execute_alone(op)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            current_handler.reset(token)
+
+
+write_queue = WriteQueue(AsyncSessionLocal, WRITE_BATCH_MAX_OPS)
+
+
+async def submit_write(op: WriteOp[T]) -> T:
+    return await write_queue.submit(op)
@@ -54,6 +54,8 @@ class OwnerClientsStates(StatesGroup):
 # Новые состояния (добавьте в forms_fsm.py)
 class OwnerExportStates(StatesGroup):
     export_menu = State()  # подменю выгрузок
+    waiting_visit_range = State()         # ввод диапазона дат визита
+    waiting_registration_range = State()  # ввод диапазона дат регистрации
 
 
 # Состояния администратора (Admin)
@@ -3,14 +3,16 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
-from sqlalchemy import select, or_
+from sqlalchemy import select
 
 from database.models import Person, Vision
-from database.session import AsyncSessionLocal
+from database.cache import get_person
+from database.session import AsyncSessionLocal, ReadSessionLocal
 from config import OWNER_IDS
 from forms.forms_fsm import AdminMainStates, AdminBroadcastStates
 from handlers.owner.crud.clients_router import show_client_profile
 from keyboards.admin_kb import get_admin_main_keyboard  # если клавиатура админа отдельная
+from services.client_search import client_search_query
 
 admin_broadcast_router = Router()
 
@@ -105,29 +107,9 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
         await message.answer("Введите запрос для поиска.")
         return
 
-    async with AsyncSessionLocal() as session:
-        conditions = []
-
-        # По telegram_id
-        if query.isdigit() and len(query) > 8:  # telegram_id обычно длиннее
-            conditions.append(Person.telegram_id == int(query))
-
-        # По телефону
-        normalized = normalize_phone(query)
-        if normalized:
-            conditions.append(Person.phone == normalized)
-
-        # По имени/фамилии
-        if query:
-            conditions.append(or_(
-                Person.first_name.ilike(f"%{query}%"),
-                Person.last_name.ilike(f"%{query}%"),
-                Person.full_name.ilike(f"%{query}%")
-            ))
-
-        result = await session.execute(
-            select(Person).where(or_(*conditions)).limit(15)
-        )
+    async with ReadSessionLocal() as session:
+        # telegram_id обычно длиннее 8 цифр — короче ищем только по телефону и имени
+        result = await session.execute(client_search_query(query, normalize_phone(query), min_id_length=9))
         persons = result.scalars().all()
 
     if not persons:
@@ -157,14 +139,11 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
     )
 # Показ профиля клиента
 async def show_profile(trigger, person: Person, state: FSMContext, bot: Bot):
-    async with AsyncSessionLocal() as session:
-        last_vision = await session.execute(
-            select(Vision)
-            .where(Vision.person_id == person.id)
-            .order_by(Vision.visit_date.desc())
-            .limit(1)
-        )
-        last_vision = last_vision.scalar_one_or_none()
+    # Сводка в persons: последняя запись — одна строка по первичному ключу, остальные не читаем
+    last_vision = None
+    if person.latest_vision_id is not None:
+        async with ReadSessionLocal() as session:
+            last_vision = await session.get(Vision, person.latest_vision_id)
 
     profile_text = f"👤 <b>Профиль клиента</b>\n\n"
     profile_text += f"ФИО: {person.full_name or '—'}\n"
@@ -204,8 +183,7 @@ async def show_profile(trigger, person: Person, state: FSMContext, bot: Bot):
 @admin_broadcast_router.callback_query(F.data.startswith("admin_profile_"))
 async def select_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
     person_id = int(callback.data.split("_")[2])
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
+    person = await get_person(person_id)
     if person:
         await show_client_profile(callback, person, state, bot)  # ← callback как trigger
     await callback.answer()
@@ -233,8 +211,7 @@ async def cancel_send(callback: CallbackQuery, state: FSMContext, bot: Bot):
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await show_profile(callback, person, state, bot)
 
@@ -246,8 +223,7 @@ async def send_message_to_client(message: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
     person_id = data.get("person_id")
 
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
+    person = await get_person(person_id)
 
     if not person or not person.telegram_id:
         await message.answer("❌ Ошибка: клиент не найден или нет Telegram ID.")
@@ -3,13 +3,16 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
-from sqlalchemy import select, or_
+from sqlalchemy import select
 
 from database.models import Person, Vision
-from database.session import AsyncSessionLocal
+from database.cache import get_person
+from database.session import AsyncSessionLocal, ReadSessionLocal
 from config import OWNER_IDS
 from forms.forms_fsm import AdminClientsStates, AdminMainStates
 from keyboards.admin_kb import get_admin_main_keyboard
+from keyboards.callbacks import ADMIN_VISION_LIST
+from services.client_search import client_search_query
 
 admin_clients_router = Router()
 
@@ -83,26 +86,8 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
 
     query = message.text.strip()
 
-    async with AsyncSessionLocal() as session:
-        conditions = []
-
-        if query.isdigit():
-            conditions.append(Person.telegram_id == int(query))
-
-        normalized = normalize_phone(query)
-        if normalized:
-            conditions.append(Person.phone == normalized)
-
-        if query:
-            conditions.append(or_(
-                Person.first_name.ilike(f"%{query}%"),
-                Person.last_name.ilike(f"%{query}%"),
-                Person.full_name.ilike(f"%{query}%")
-            ))
-
-        result = await session.execute(
-            select(Person).where(or_(*conditions)).limit(15)
-        )
+    async with ReadSessionLocal() as session:
+        result = await session.execute(client_search_query(query, normalize_phone(query)))
         persons = result.scalars().all()
 
     if not persons:
@@ -132,14 +117,11 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
 
 # Показ профиля клиента (краткий формат + ваши кнопки)
 async def admin_show_profile(trigger, person: Person, state: FSMContext, bot: Bot):
-    async with AsyncSessionLocal() as session:
-        last_vision = await session.execute(
-            select(Vision)
-            .where(Vision.person_id == person.id)
-            .order_by(Vision.visit_date.desc())
-            .limit(1)
-        )
-        last_vision = last_vision.scalar_one_or_none()
+    # Сводка в persons: последняя запись — одна строка по первичному ключу, остальные не читаем
+    last_vision = None
+    if person.latest_vision_id is not None:
+        async with ReadSessionLocal() as session:
+            last_vision = await session.get(Vision, person.latest_vision_id)
 
     profile_text = "<b>Профиль клиента:</b>\n\n"
     profile_text += f"ФИО: {person.full_name or '—'}\n"
@@ -166,7 +148,7 @@ async def admin_show_profile(trigger, person: Person, state: FSMContext, bot: Bo
     kb = [
         [InlineKeyboardButton(text="✏ Редактировать данные", callback_data=f"admin_edit_client_{person.id}")],
         [InlineKeyboardButton(text="➕ Добавить новую запись зрения", callback_data=f"admin_add_vision_{person.id}")],
-        [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=f"admin_view_all_visions_{person.id}")],
+        [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=ADMIN_VISION_LIST.pack(person.id))],
         [InlineKeyboardButton(text="◀ Назад к поиску", callback_data="admin_back_to_search")],
         [InlineKeyboardButton(text="◀ В админ-меню", callback_data="admin_back_to_menu")],
     ]
@@ -193,8 +175,7 @@ async def admin_show_profile(trigger, person: Person, state: FSMContext, bot: Bo
 @admin_clients_router.callback_query(F.data.startswith("admin_client_profile_"))
 async def select_admin_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
     person_id = int(callback.data.split("_")[3])
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
+    person = await get_person(person_id)
     if person:
         await admin_show_profile(callback, person, state, bot)
     await callback.answer()
@@ -243,8 +224,7 @@ async def admin_cancel_edit_client(callback: CallbackQuery, state: FSMContext, b
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await admin_show_profile(callback, person, state, bot)
 
@@ -311,7 +291,7 @@ async def admin_process_edit_client(message: Message, state: FSMContext, bot: Bo
         kb = [
             [InlineKeyboardButton(text="✏ Редактировать данные", callback_data=f"admin_edit_client_{person_id}")],
             [InlineKeyboardButton(text="➕ Добавить новую запись зрения", callback_data=f"admin_add_vision_{person_id}")],
-            [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=f"admin_view_all_visions_{person_id}")],
+            [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=ADMIN_VISION_LIST.pack(person_id))],
             [InlineKeyboardButton(text="◀ Назад к поиску", callback_data="admin_back_to_search")],
             [InlineKeyboardButton(text="◀ В админ-меню", callback_data="admin_back_to_menu")],
         ]
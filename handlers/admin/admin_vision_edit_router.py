@@ -4,11 +4,20 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
 from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Person, Vision
+from database.cache import CACHE_KEYS_FROM_RETURNING, get_person, invalidate_persons
 from database.session import AsyncSessionLocal
+from database.write_queue import submit_write
 from config import OWNER_IDS
 from forms.forms_fsm import AdminClientsStates
+from services.vision_pager import VisionPage, first_vision_page, neighbour_vision_page
+from keyboards.callbacks import (
+    ADMIN_VISION_BACK_TO_PROFILE, ADMIN_VISION_DELETE, ADMIN_VISION_DELETE_CONFIRM, ADMIN_VISION_EDIT,
+    ADMIN_VISION_LIST, ADMIN_VISION_PAGE,
+)
+from utils.callback_codec import callback_table
 from datetime import date
 
 # Импорт функции показа профиля админа
@@ -28,34 +37,26 @@ async def has_admin_access(user_id: int) -> bool:
         return role in ("admin", "owner")
 
 # Просмотр всех записей — показываем первую (последнюю по дате)
-@admin_vision_edit_router.callback_query(F.data.startswith("admin_view_all_visions_"))
-async def admin_view_all_visions(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callback_table.handler(ADMIN_VISION_LIST)
+async def admin_view_all_visions(callback: CallbackQuery, state: FSMContext, bot: Bot, person_id: int):
     if not await has_admin_access(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    person_id = int(callback.data.split("_")[4])
+    page = await first_vision_page(person_id)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Vision)
-            .where(Vision.person_id == person_id)
-            .order_by(Vision.visit_date.desc())
-        )
-        visions = result.scalars().all()
-
-    if not visions:
+    if page is None:
         await callback.answer("У клиента нет записей зрения.", show_alert=True)
         return
 
-    # Сохраняем список ID и текущий индекс
-    await state.update_data(visions_ids=[v.id for v in visions], current_vision_index=0, person_id=person_id)
-    await admin_show_vision_record(callback, 0, visions, bot, state)
+    # Список ID не храним: кнопки листания несут курсор на показанную запись
+    await state.update_data(person_id=person_id)
+    await admin_show_vision_record(callback, page, bot, state)
     await callback.answer()
 
 # Показ одной записи с пагинацией
-async def admin_show_vision_record(trigger, index: int, visions: list[Vision], bot: Bot, state: FSMContext):
-    v = visions[index]
+async def admin_show_vision_record(trigger, page: VisionPage, bot: Bot, state: FSMContext):
+    v = page.vision
 
     text = f"<b>Запись зрения от {v.visit_date}</b>\n\n"
     text += f"Правая: SPH {v.sph_r or '—'} | CYL {v.cyl_r or '—'} | AXIS {v.axis_r or '—'}\n"
@@ -65,16 +66,16 @@ async def admin_show_vision_record(trigger, index: int, visions: list[Vision], b
     text += f"Модель оправы: {v.frame_model or '—'}\n"
     if v.note:
         text += f"Примечание: {v.note}\n"
-    text += f"\nЗапись {index + 1} из {len(visions)}"
+    text += f"\nЗапись {page.index + 1} из {page.total}"
 
     kb = [
         [
-            InlineKeyboardButton(text="◀", callback_data=f"admin_vision_prev_{index}"),
-            InlineKeyboardButton(text="▶", callback_data=f"admin_vision_next_{index}"),
+            InlineKeyboardButton(text="◀", callback_data=ADMIN_VISION_PAGE.pack(v.id, page.index, 0)),
+            InlineKeyboardButton(text="▶", callback_data=ADMIN_VISION_PAGE.pack(v.id, page.index, 1)),
         ],
-        [InlineKeyboardButton(text="✏ Редактировать эту запись", callback_data=f"admin_edit_this_vision_{v.id}")],
-        [InlineKeyboardButton(text="🗑 Удалить эту запись", callback_data=f"admin_delete_this_vision_{v.id}")],
-        [InlineKeyboardButton(text="◀ Назад в профиль", callback_data=f"admin_back_to_profile_{v.person_id}")],
+        [InlineKeyboardButton(text="✏ Редактировать эту запись", callback_data=ADMIN_VISION_EDIT.pack(v.id))],
+        [InlineKeyboardButton(text="🗑 Удалить эту запись", callback_data=ADMIN_VISION_DELETE.pack(v.id))],
+        [InlineKeyboardButton(text="◀ Назад в профиль", callback_data=ADMIN_VISION_BACK_TO_PROFILE.pack(v.person_id))],
     ]
 
     if isinstance(trigger, Message):
@@ -82,40 +83,38 @@ async def admin_show_vision_record(trigger, index: int, visions: list[Vision], b
     else:
         await trigger.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
 
-# Навигация предыдущая/следующая
-@admin_vision_edit_router.callback_query(F.data.startswith("admin_vision_prev_") | F.data.startswith("admin_vision_next_"))
-async def admin_navigate_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
+# Навигация предыдущая/следующая: кнопка несёт id и позицию показанной записи
+@callback_table.handler(ADMIN_VISION_PAGE)
+async def admin_navigate_vision(callback: CallbackQuery, state: FSMContext, bot: Bot,
+                                vision_id: int, index: int, older: int):
     if not await has_admin_access(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    data = await state.get_data()
-    visions_ids = data.get("visions_ids", [])
-    current_index = int(callback.data.split("_")[3])
-
-    if "prev" in callback.data:
-        new_index = max(0, current_index - 1)
-    else:
-        new_index = min(len(visions_ids) - 1, current_index + 1)
-
-    async with AsyncSessionLocal() as session:
-        visions = [await session.get(Vision, vid) for vid in visions_ids]
+    page = await neighbour_vision_page(vision_id, index, "older" if older else "newer")
+    if page is None:
+        # Запись удалили, пока она была на экране — начинаем с самой новой
+        data = await state.get_data()
+        page = await first_vision_page(data["person_id"]) if data.get("person_id") else None
+        if page is None:
+            await callback.answer("Записи не найдены.", show_alert=True)
+            return
+    elif page.vision.id == vision_id:
+        await callback.answer("Это последняя запись." if older else "Это первая запись.")
+        return
 
-    await admin_show_vision_record(callback, new_index, visions, bot, state)
-    await state.update_data(current_vision_index=new_index)
+    await admin_show_vision_record(callback, page, bot, state)
     await callback.answer()
 
 # Удаление записи
-@admin_vision_edit_router.callback_query(F.data.startswith("admin_delete_this_vision_"))
-async def admin_confirm_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callback_table.handler(ADMIN_VISION_DELETE)
+async def admin_confirm_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot, vision_id: int):
     if not await has_admin_access(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    vision_id = int(callback.data.split("_")[4])
-
     kb = [
-        [InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"admin_confirm_delete_vision_{vision_id}")],
+        [InlineKeyboardButton(text="✅ Да, удалить", callback_data=ADMIN_VISION_DELETE_CONFIRM.pack(vision_id))],
         [InlineKeyboardButton(text="❌ Нет, отменить", callback_data="admin_cancel_delete_vision")],
     ]
 
@@ -127,27 +126,30 @@ async def admin_confirm_delete_vision(callback: CallbackQuery, state: FSMContext
     await callback.answer()
 
 # Подтверждение удаления
-@admin_vision_edit_router.callback_query(F.data.startswith("admin_confirm_delete_vision_"))
-async def admin_process_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callback_table.handler(ADMIN_VISION_DELETE_CONFIRM)
+async def admin_process_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot, vision_id: int):
     if not await has_admin_access(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    vision_id = int(callback.data.split("_")[4])
     data = await state.get_data()
     person_id = data.get("person_id")
 
-    async with AsyncSessionLocal() as session:
-        await session.execute(delete(Vision).where(Vision.id == vision_id))
-        await session.commit()
+    async def delete_vision(session: AsyncSession) -> None:
+        deleted = await session.scalars(
+            delete(Vision).where(Vision.id == vision_id)
+            .returning(Vision.person_id).execution_options(**CACHE_KEYS_FROM_RETURNING)
+        )
+        invalidate_persons(session, deleted.all())
+
+    await submit_write(delete_vision)
 
     await callback.answer("✅ Запись удалена!", show_alert=True)
 
     # Возврат в профиль
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
-        if person:
-            await admin_show_profile(callback, person, state, bot)
+    person = await get_person(person_id)
+    if person:
+        await admin_show_profile(callback, person, state, bot)
 
 # Отмена удаления
 @admin_vision_edit_router.callback_query(F.data == "admin_cancel_delete_vision")
@@ -155,37 +157,32 @@ async def admin_cancel_delete_vision(callback: CallbackQuery, state: FSMContext,
     await callback.answer("Удаление отменено", show_alert=True)
 
 # Кнопка "Назад в профиль" — перехват
-@admin_vision_edit_router.callback_query(F.data.startswith("admin_back_to_profile_"))
-async def admin_back_to_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callback_table.handler(ADMIN_VISION_BACK_TO_PROFILE)
+async def admin_back_to_profile(callback: CallbackQuery, state: FSMContext, bot: Bot, person_id: int):
     if not await has_admin_access(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    person_id = int(callback.data.split("_")[4])
-
     try:
         await callback.message.delete()
     except TelegramBadRequest:
         pass
 
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
-        if not person:
-            await callback.answer("Клиент не найден.", show_alert=True)
-            return
+    person = await get_person(person_id)
+    if not person:
+        await callback.answer("Клиент не найден.", show_alert=True)
+        return
 
     await admin_show_profile(callback, person, state, bot)
     await callback.answer("Возврат в профиль")
 
 # Редактирование записи — начало
-@admin_vision_edit_router.callback_query(F.data.startswith("admin_edit_this_vision_"))
-async def admin_start_edit_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callback_table.handler(ADMIN_VISION_EDIT)
+async def admin_start_edit_vision(callback: CallbackQuery, state: FSMContext, bot: Bot, vision_id: int):
     if not await has_admin_access(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    vision_id = int(callback.data.split("_")[4])
-
     async with AsyncSessionLocal() as session:
         vision = await session.get(Vision, vision_id)
         if not vision:
@@ -210,6 +207,15 @@ async def admin_start_edit_vision(callback: CallbackQuery, state: FSMContext, bo
     await state.set_state(AdminClientsStates.waiting_sph_cyl_axis_edit)
     await callback.answer()
 
+def _vision_updater(vision_id: int, changes: dict):
+    """Операция очереди записи: применяет changes к записи зрения и возвращает её."""
+    async def update(session: AsyncSession) -> Vision:
+        vision = await session.get(Vision, vision_id)
+        for field, value in changes.items():
+            setattr(vision, field, value)
+        return vision
+    return update
+
 # Шаг 1 редактирования: SPH, CYL, AXIS
 @admin_vision_edit_router.message(AdminClientsStates.waiting_sph_cyl_axis_edit)
 async def admin_process_sph_cyl_axis_edit(message: Message, state: FSMContext, bot: Bot):
@@ -220,26 +226,27 @@ async def admin_process_sph_cyl_axis_edit(message: Message, state: FSMContext, b
     data = await state.get_data()
     vision_id = data["vision_id"]
 
-    async with AsyncSessionLocal() as session:
-        vision = await session.get(Vision, vision_id)
+    changes = {}
+    if text:
+        values = text.split()
+        if len(values) != 6:
+            await message.answer(
+                "❌ Неверный формат. Нужно ровно 6 значений или пустое сообщение для пропуска."
+            )
+            return
 
-        if text:
-            values = text.split()
-            if len(values) != 6:
-                await message.answer(
-                    "❌ Неверный формат. Нужно ровно 6 значений или пустое сообщение для пропуска."
-                )
-                return
-
-            try:
-                vision.sph_r, vision.cyl_r, vision.axis_r = map(float, values[:3])
-                vision.sph_l, vision.cyl_l, vision.axis_l = map(float, values[3:])
-                vision.axis_r = int(vision.axis_r)
-                vision.axis_l = int(vision.axis_l)
-                await session.commit()
-            except ValueError:
-                await message.answer("❌ Все значения должны быть числами. Повторите.")
-                return
+        try:
+            sph_r, cyl_r, axis_r = map(float, values[:3])
+            sph_l, cyl_l, axis_l = map(float, values[3:])
+        except ValueError:
+            await message.answer("❌ Все значения должны быть числами. Повторите.")
+            return
+        changes = dict(
+            sph_r=sph_r, cyl_r=cyl_r, axis_r=int(axis_r),
+            sph_l=sph_l, cyl_l=cyl_l, axis_l=int(axis_l),
+        )
+
+    vision = await submit_write(_vision_updater(vision_id, changes))
 
     current_values = f"Текущие: PD {vision.pd or '—'} | Lens: {vision.lens_type or '—'} | Frame: {vision.frame_model or '—'}\n"
 
@@ -261,28 +268,26 @@ async def admin_process_pd_lens_frame_edit(message: Message, state: FSMContext,
     data = await state.get_data()
     vision_id = data["vision_id"]
 
-    async with AsyncSessionLocal() as session:
-        vision = await session.get(Vision, vision_id)
-
-        if text:
-            parts = text.split(maxsplit=2)
-            if len(parts) < 1:
-                await message.answer("❌ Укажите хотя бы PD или пустое сообщение для пропуска.")
-                return
+    changes = {}
+    if text:
+        parts = text.split(maxsplit=2)
+        if len(parts) < 1:
+            await message.answer("❌ Укажите хотя бы PD или пустое сообщение для пропуска.")
+            return
 
-            try:
-                vision.pd = float(parts[0])
-            except ValueError:
-                await message.answer("❌ PD должен быть числом. Повторите.")
-                return
+        try:
+            changes["pd"] = float(parts[0])
+        except ValueError:
+            await message.answer("❌ PD должен быть числом. Повторите.")
+            return
 
-            if len(parts) >= 2:
-                vision.lens_type = parts[1] or None
+        if len(parts) >= 2:
+            changes["lens_type"] = parts[1] or None
 
-            if len(parts) >= 3:
-                vision.frame_model = parts[2] or None
+        if len(parts) >= 3:
+            changes["frame_model"] = parts[2] or None
 
-            await session.commit()
+    vision = await submit_write(_vision_updater(vision_id, changes))
 
     current_note = f"Текущий: {vision.note or '—'}\n"
 
@@ -305,14 +310,13 @@ async def admin_process_note_edit(message: Message, state: FSMContext, bot: Bot)
     vision_id = data["vision_id"]
     person_id = data["person_id"]
 
-    async with AsyncSessionLocal() as session:
+    async def save_note(session: AsyncSession) -> Person:
         vision = await session.get(Vision, vision_id)
         if text:
             vision.note = text
-            await session.commit()
+        return await session.get(Person, person_id)
 
-        person = await session.get(Person, person_id)
-        await session.refresh(person)
+    person = await submit_write(save_note)
 
     await message.answer("✅ Запись обновлена!")
 
@@ -327,17 +331,13 @@ async def admin_cancel_edit_to_list(callback: CallbackQuery, state: FSMContext,
         return
 
     data = await state.get_data()
-    visions_ids = data.get("visions_ids", [])
     person_id = data.get("person_id")
+    page = await first_vision_page(person_id) if person_id else None
 
-    if not visions_ids or not person_id:
+    if page is None:
         await callback.answer("Данные не найдены.", show_alert=True)
         await state.clear()
         return
 
-    async with AsyncSessionLocal() as session:
-        visions = [await session.get(Vision, vid) for vid in visions_ids]
-
-    await admin_show_vision_record(callback, 0, visions, bot, state)
-    await state.update_data(current_vision_index=0)
+    await admin_show_vision_record(callback, page, bot, state)
     await callback.answer("Редактирование отменено. Возврат к списку записей.")
\ No newline at end of file
@@ -4,9 +4,12 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Person, Vision
+from database.cache import get_person
 from database.session import AsyncSessionLocal
+from database.write_queue import submit_write
 from config import OWNER_IDS
 from forms.forms_fsm import AdminClientsStates  # новые состояния для админа
 from datetime import date
@@ -65,8 +68,7 @@ async def admin_cancel_add_vision(callback: CallbackQuery, state: FSMContext, bo
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await admin_show_profile(callback, person, state, bot)
 
@@ -160,12 +162,10 @@ async def admin_process_note_and_save(message: Message, state: FSMContext, bot:
     data = await state.get_data()
     person_id = data["person_id"]
 
-    async with AsyncSessionLocal() as session:
+    async def save_vision(session: AsyncSession) -> bool:
         person = await session.get(Person, person_id)
         if not person:
-            await message.answer("❌ Клиент не найден.")
-            await state.clear()
-            return
+            return False
 
         new_vision = Vision(
             person_id=person_id,
@@ -185,12 +185,16 @@ async def admin_process_note_and_save(message: Message, state: FSMContext, bot:
 
         # Обновляем последний визит у клиента
         person.last_visit_date = date.today()
+        return True
 
-        await session.commit()
-        await session.refresh(person)  # Перезагружаем person после commit, чтобы избежать DetachedInstanceError
+    if not await submit_write(save_vision):
+        await message.answer("❌ Клиент не найден.")
+        await state.clear()
+        return
 
     await message.answer("✅ Новая запись зрения успешно добавлена!")
 
-    # Возврат в профиль
+    # Возврат в профиль: сводку по записям пересчитали триггеры, читаем клиента заново после коммита
+    person = await get_person(person_id)
     await admin_show_profile(message, person, state, bot)
     await state.set_state(AdminClientsStates.viewing_profile)
\ No newline at end of file
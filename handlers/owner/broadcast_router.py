@@ -3,19 +3,25 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 import asyncio
+import logging
 
-from sqlalchemy import select, or_
+from sqlalchemy import select
 
 from database.models import Person, Vision
-from database.session import AsyncSessionLocal
+from database.cache import get_person, get_person_visions
+from database.session import AsyncSessionLocal, ReadSessionLocal
 from config import OWNER_IDS
 from forms.forms_fsm import OwnerBroadcastStates, OwnerMainStates
 from keyboards.owner_kb import get_owner_main_keyboard, get_broadcast_submenu_keyboard
 
 from utils.broadcast_monitor import start as broadcast_start, mark_sent as broadcast_mark_sent, finish as broadcast_finish, status as broadcast_status
 from utils.audit import write_audit_event
+from services.client_search import client_search_query
 
 owner_broadcast_router = Router()
+logger = logging.getLogger(__name__)
+# Ссылки на фоновые задачи рассылок, чтобы их не собрал сборщик мусора
+_broadcast_tasks: set[asyncio.Task] = set()
 
 def is_owner(user_id: int) -> bool:
     return user_id in OWNER_IDS
@@ -152,6 +158,63 @@ async def process_broadcast_text(message: Message, state: FSMContext, bot: Bot):
         reply_markup=confirm_kb
     )
 
+async def _send_broadcast(bot: Bot, owner_id: int, text: str, count: int, state: FSMContext) -> None:
+    sent = 0
+    errors = 0
+    try:
+        progress_message = await bot.send_message(
+            owner_id,
+            f"📢 Рассылка начата...\nОтправлено: 0 из {count}"
+        )
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Person).where(Person.telegram_id.is_not(None))
+            )
+            recipients = result.scalars().all()
+
+        for person in recipients:
+            try:
+                await bot.send_message(person.telegram_id, text)
+                sent += 1
+                broadcast_mark_sent(ok=True)
+            except Exception:
+                errors += 1
+                broadcast_mark_sent(ok=False)
+
+            await asyncio.sleep(1.05)  # Безопасная пауза
+
+            if broadcast_status.cancel_requested:
+                break
+
+
+            if sent % 20 == 0 or sent == count:
+                try:
+                    await bot.edit_message_text(
+                        chat_id=owner_id,
+                        message_id=progress_message.message_id,
+                        text=f"📢 Рассылка в процессе...\nОтправлено: {sent} из {count}\nОшибок: {errors}"
+                    )
+                except TelegramBadRequest:
+                    pass
+
+        write_audit_event(owner_id, "owner", "broadcast_all_finish", {"sent": sent, "errors": errors})
+
+        cancelled_note = "\n⛔ Остановлена вручную" if broadcast_status.cancel_requested else ""
+
+        # Итог тоже внутри try: ошибка здесь иначе осталась бы непрочитанным исключением задачи
+        await bot.send_message(
+            owner_id,
+            f"✅ Рассылка завершена!\nУспешно: {sent}\nОшибок: {errors}{cancelled_note}",
+            reply_markup=get_broadcast_submenu_keyboard()
+        )
+        await state.set_state(OwnerBroadcastStates.broadcast_menu)
+    except Exception:
+        logger.exception("Broadcast failed after %s messages", sent)
+    finally:
+        broadcast_finish()
+
+
 # Подтверждение рассылки всем
 @owner_broadcast_router.callback_query(F.data.startswith("broadcast_confirm_"))
 async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot):
@@ -180,58 +243,18 @@ async def confirm_broadcast(callback: CallbackQuery, state: FSMContext, bot: Bot
         await callback.answer()
         return
 
+    if broadcast_status.running:
+        await callback.answer("Рассылка уже идёт", show_alert=True)
+        return
+
     # Запуск рассылки
     broadcast_start(total=count, requested_by=callback.from_user.id)
     write_audit_event(callback.from_user.id, "owner", "broadcast_all_start", {"total": count})
-    progress_message = await bot.send_message(
-        callback.from_user.id,
-        f"📢 Рассылка начата...\nОтправлено: 0 из {count}"
-    )
-
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Person).where(Person.telegram_id.is_not(None))
-        )
-        recipients = result.scalars().all()
-
-    sent = 0
-    errors = 0
-
-    for person in recipients:
-        try:
-            await bot.send_message(person.telegram_id, text)
-            sent += 1
-            broadcast_mark_sent(ok=True)
-        except Exception:
-            errors += 1
-            broadcast_mark_sent(ok=False)
-
-        await asyncio.sleep(1.05)  # Безопасная пауза
-
-        if broadcast_status.cancel_requested:
-            break
-
-
-        if sent % 20 == 0 or sent == count:
-            try:
-                await bot.edit_message_text(
-                    chat_id=callback.from_user.id,
-                    message_id=progress_message.message_id,
-                    text=f"📢 Рассылка в процессе...\nОтправлено: {sent} из {count}\nОшибок: {errors}"
-                )
-            except TelegramBadRequest:
-                pass
-    broadcast_finish()
-    write_audit_event(callback.from_user.id, "owner", "broadcast_all_finish", {"sent": sent, "errors": errors})
-
-    cancelled_note = "\n⛔ Остановлена вручную" if broadcast_status.cancel_requested else ""
-
-    await bot.send_message(
-        callback.from_user.id,
-        f"✅ Рассылка завершена!\nУспешно: {sent}\nОшибок: {errors}{cancelled_note}",
-        reply_markup=get_broadcast_submenu_keyboard()
-    )
-    await state.set_state(OwnerBroadcastStates.broadcast_menu)
+    # Рассылка идёт фоновой задачей: кнопки владельца (в том числе остановка рассылки
+    # в панели разработчика) не ждут, пока она закончится
+    task = asyncio.create_task(_send_broadcast(bot, callback.from_user.id, text, count, state))
+    _broadcast_tasks.add(task)
+    task.add_done_callback(_broadcast_tasks.discard)
     await callback.answer()
 
 # Отмена поиска — возврат в подменю рассылок
@@ -262,26 +285,8 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
 
     query = message.text.strip()
 
-    async with AsyncSessionLocal() as session:
-        conditions = []
-
-        if query.isdigit():
-            conditions.append(Person.telegram_id == int(query))
-
-        normalized = normalize_phone(query)
-        if normalized:
-            conditions.append(Person.phone == normalized)
-
-        if query:
-            conditions.append(or_(
-                Person.first_name.ilike(f"%{query}%"),
-                Person.last_name.ilike(f"%{query}%"),
-                Person.full_name.ilike(f"%{query}%")
-            ))
-
-        result = await session.execute(
-            select(Person).where(or_(*conditions)).limit(20)
-        )
+    async with ReadSessionLocal() as session:
+        result = await session.execute(client_search_query(query, normalize_phone(query), limit=20))
         persons = result.scalars().all()
 
     if not persons:
@@ -312,11 +317,7 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
 
 # Показ профиля (остальной код без изменений, оставляю как у тебя)
 async def show_profile(trigger, person: Person, state: FSMContext, bot: Bot):
-    async with AsyncSessionLocal() as session:
-        visions_result = await session.execute(
-            select(Vision).where(Vision.person_id == person.id).order_by(Vision.visit_date.desc()).limit(5)
-        )
-        visions = visions_result.scalars().all()
+    visions = (await get_person_visions(person.id))[:5]
 
     profile_text = f"👤 <b>Профиль клиента</b>\n\n"
     profile_text += f"ФИО: {person.full_name or 'Не указано'}\n"
@@ -357,8 +358,7 @@ async def show_profile(trigger, person: Person, state: FSMContext, bot: Bot):
 @owner_broadcast_router.callback_query(F.data.startswith("profile_"))
 async def select_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
     person_id = int(callback.data.split("_")[1])
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
+    person = await get_person(person_id)
     if person:
         await show_profile(callback, person, state, bot)
     await callback.answer()
@@ -383,8 +383,7 @@ async def back_to_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
     person_id = data.get("person_id")
     
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await show_profile(callback, person, state, bot)
     await callback.answer()
@@ -395,8 +394,7 @@ async def send_message_to_client(message: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
     person_id = data.get("person_id")
 
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
+    person = await get_person(person_id)
 
     if not person or not person.telegram_id:
         await message.answer("❌ Ошибка: клиент не найден или нет Telegram ID.")
@@ -4,9 +4,10 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import BotContent
-from database.session import AsyncSessionLocal
+from database.write_queue import submit_write
 from config import OWNER_IDS, SECTION_NAMES
 from forms.forms_fsm import OwnerContentStates, OwnerMainStates
 from keyboards.client_kb import get_client_keyboard
@@ -64,7 +65,7 @@ async def process_edit_or_cancel(message: Message, state: FSMContext):
     edit_key = data["edit_key"]
     new_text = message.text.strip()
 
-    async with AsyncSessionLocal() as session:
+    async def save_content(session: AsyncSession) -> None:
         result = await session.execute(select(BotContent).where(BotContent.key == edit_key))
         row = result.scalar_one_or_none()
 
@@ -74,7 +75,7 @@ async def process_edit_or_cancel(message: Message, state: FSMContext):
             row = BotContent(key=edit_key, value=new_text)
             session.add(row)
 
-        await session.commit()
+    await submit_write(save_content)
 
     clear_content_cache()
 
@@ -3,13 +3,14 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
-from sqlalchemy import select, or_
-
 from database.models import Person, Vision
-from database.session import AsyncSessionLocal
+from database.cache import get_person
+from database.session import AsyncSessionLocal, ReadSessionLocal
 from config import OWNER_IDS
 from forms.forms_fsm import OwnerClientsStates, OwnerMainStates
 from keyboards.owner_kb import get_owner_main_keyboard
+from keyboards.callbacks import VISION_LIST
+from services.client_search import client_search_query
 
 owner_clients_router = Router()
 
@@ -52,26 +53,8 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
 
     query = message.text.strip()
 
-    async with AsyncSessionLocal() as session:
-        conditions = []
-
-        if query.isdigit():
-            conditions.append(Person.telegram_id == int(query))
-
-        normalized = normalize_phone(query)
-        if normalized:
-            conditions.append(Person.phone == normalized)
-
-        if query:
-            conditions.append(or_(
-                Person.first_name.ilike(f"%{query}%"),
-                Person.last_name.ilike(f"%{query}%"),
-                Person.full_name.ilike(f"%{query}%")
-            ))
-
-        result = await session.execute(
-            select(Person).where(or_(*conditions)).limit(15)
-        )
+    async with ReadSessionLocal() as session:
+        result = await session.execute(client_search_query(query, normalize_phone(query)))
         persons = result.scalars().all()
 
     if not persons:
@@ -101,21 +84,11 @@ async def process_search(message: Message, state: FSMContext, bot: Bot):
 
 # Показ профиля клиента — всегда новое сообщение
 async def show_client_profile(trigger, person: Person, state: FSMContext, bot: Bot):
-    async with AsyncSessionLocal() as session:
-        last_vision = await session.execute(
-            select(Vision)
-            .where(Vision.person_id == person.id)
-            .order_by(Vision.visit_date.desc())
-            .limit(1)
-        )
-        last_vision = last_vision.scalar_one_or_none()
-
-        all_visions = await session.execute(
-            select(Vision)
-            .where(Vision.person_id == person.id)
-            .order_by(Vision.visit_date.desc())
-        )
-        all_visions = all_visions.scalars().all()
+    # Сводка в persons: последняя запись — одна строка по первичному ключу, остальные не читаем
+    last_vision = None
+    if person.latest_vision_id is not None:
+        async with ReadSessionLocal() as session:
+            last_vision = await session.get(Vision, person.latest_vision_id)
 
     profile_text = f"👤 <b>Профиль клиента</b>\n\n"
     profile_text += f"ФИО: {person.full_name or '—'}\n"
@@ -139,12 +112,12 @@ async def show_client_profile(trigger, person: Person, state: FSMContext, bot: B
     else:
         profile_text += "<i>Записей зрения пока нет</i>\n"
 
-    profile_text += f"\nВсего записей зрения: {len(all_visions)}\n"
+    profile_text += f"\nВсего записей зрения: {person.vision_count}\n"
 
     kb = [
         [InlineKeyboardButton(text="✏ Редактировать данные", callback_data=f"edit_client_{person.id}")],
         [InlineKeyboardButton(text="➕ Добавить новую запись зрения", callback_data=f"add_vision_{person.id}")],
-        [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=f"view_all_visions_{person.id}")],
+        [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=VISION_LIST.pack(person.id))],
         [InlineKeyboardButton(text="◀ Назад к поиску", callback_data="back_to_clients_search")],
         [InlineKeyboardButton(text="🏠 Главная панель", callback_data="to_main_panel")],
     ]
@@ -170,8 +143,7 @@ async def show_client_profile(trigger, person: Person, state: FSMContext, bot: B
 @owner_clients_router.callback_query(F.data.startswith("client_profile_"))
 async def select_client_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
     person_id = int(callback.data.split("_")[2])
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
+    person = await get_person(person_id)
     if person:
         await show_client_profile(callback, person, state, bot)
     await callback.answer()
@@ -218,8 +190,7 @@ async def cancel_edit_client(callback: CallbackQuery, state: FSMContext, bot: Bo
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await show_client_profile(callback, person, state, bot)
 
@@ -285,7 +256,7 @@ async def process_edit_client(message: Message, state: FSMContext, bot: Bot):
         kb = [
             [InlineKeyboardButton(text="✏ Редактировать данные", callback_data=f"edit_client_{person_id}")],
             [InlineKeyboardButton(text="➕ Добавить новую запись зрения", callback_data=f"add_vision_{person_id}")],
-            [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=f"view_all_visions_{person_id}")],
+            [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=VISION_LIST.pack(person_id))],
             [InlineKeyboardButton(text="◀ Назад к поиску", callback_data="back_to_clients_search")],
             [InlineKeyboardButton(text="🏠 Главная панель", callback_data="to_main_panel")],
         ]
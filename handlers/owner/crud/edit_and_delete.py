@@ -7,9 +7,16 @@ from aiogram.exceptions import TelegramBadRequest
 from sqlalchemy import select, delete
 
 from database.models import Person, Vision
+from database.cache import CACHE_KEYS_FROM_RETURNING, get_person, invalidate_persons
 from database.session import AsyncSessionLocal
 from config import OWNER_IDS
 from forms.forms_fsm import OwnerClientsStates  # добавьте новые состояния
+from services.vision_pager import VisionPage, first_vision_page, neighbour_vision_page
+from keyboards.callbacks import (
+    VISION_BACK_TO_PROFILE, VISION_CLIENT_PDF, VISION_DELETE, VISION_DELETE_CONFIRM, VISION_EDIT, VISION_LIST,
+    VISION_PAGE, VISION_PDF,
+)
+from utils.callback_codec import callback_table
 from datetime import date
 
 from handlers.owner.crud.clients_router import show_client_profile
@@ -22,30 +29,22 @@ def is_owner(user_id: int) -> bool:
 
 
 # Просмотр всех записей — показываем первую (последнюю по дате)
-@owner_vision_edit_router.callback_query(F.data.startswith("view_all_visions_"))
-async def view_all_visions(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    person_id = int(callback.data.split("_")[3])
+@callback_table.handler(VISION_LIST)
+async def view_all_visions(callback: CallbackQuery, state: FSMContext, bot: Bot, person_id: int):
+    page = await first_vision_page(person_id)
 
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(
-            select(Vision)
-            .where(Vision.person_id == person_id)
-            .order_by(Vision.visit_date.desc())
-        )
-        visions = result.scalars().all()
-
-    if not visions:
+    if page is None:
         await callback.answer("У клиента нет записей зрения.", show_alert=True)
         return
 
     # Показываем первую запись (index 0 = latest)
-    await state.update_data(visions_ids=[v.id for v in visions], current_vision_index=0, person_id=person_id)
-    await show_vision_record(callback, 0, visions, bot, state)
+    await state.update_data(person_id=person_id)
+    await show_vision_record(callback, page, bot, state)
     await callback.answer()
 
 # Показ одной записи с пагинацией
-async def show_vision_record(trigger, index: int, visions: list[Vision], bot: Bot, state: FSMContext):
-    v = visions[index]
+async def show_vision_record(trigger, page: VisionPage, bot: Bot, state: FSMContext):
+    v = page.vision
 
     text = f"<b>Запись зрения от {v.visit_date}</b>\n\n"
     text += f"Правая: SPH {v.sph_r or '—'} | CYL {v.cyl_r or '—'} | AXIS {v.axis_r or '—'}\n"
@@ -55,17 +54,18 @@ async def show_vision_record(trigger, index: int, visions: list[Vision], bot: Bo
     text += f"Модель оправы: {v.frame_model or '—'}\n"
     if v.note:
         text += f"Примечание: {v.note}\n"
-    text += f"\nЗапись {index + 1} из {len(visions)}"
+    text += f"\nЗапись {page.index + 1} из {page.total}"
 
     kb = [
     [
-        InlineKeyboardButton(text="◀", callback_data=f"vision_prev_{index}"),
-        InlineKeyboardButton(text="▶", callback_data=f"vision_next_{index}"),
+        InlineKeyboardButton(text="◀", callback_data=VISION_PAGE.pack(v.id, page.index, 0)),
+        InlineKeyboardButton(text="▶", callback_data=VISION_PAGE.pack(v.id, page.index, 1)),
     ],
-    [InlineKeyboardButton(text="✏ Редактировать эту запись", callback_data=f"edit_this_vision_{v.id}")],
-    [InlineKeyboardButton(text="🗑 Удалить эту запись", callback_data=f"delete_this_vision_{v.id}")],
-    [InlineKeyboardButton(text="📄 Выгрузить в PDF", callback_data=f"export_pdf_{v.id}")],
-    [InlineKeyboardButton(text="◀ Назад в профиль", callback_data=f"back_to_profile_{visions[0].person_id}")],
+    [InlineKeyboardButton(text="✏ Редактировать эту запись", callback_data=VISION_EDIT.pack(v.id))],
+    [InlineKeyboardButton(text="🗑 Удалить эту запись", callback_data=VISION_DELETE.pack(v.id))],
+    [InlineKeyboardButton(text="📄 Выгрузить в PDF", callback_data=VISION_PDF.pack(v.id))],
+    [InlineKeyboardButton(text="📄 Все рецепты клиента в PDF", callback_data=VISION_CLIENT_PDF.pack(v.person_id))],
+    [InlineKeyboardButton(text="◀ Назад в профиль", callback_data=VISION_BACK_TO_PROFILE.pack(v.person_id))],
 ]
 
     if isinstance(trigger, Message):
@@ -73,32 +73,30 @@ async def show_vision_record(trigger, index: int, visions: list[Vision], bot: Bo
     else:
         await trigger.message.edit_text(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=kb))
 
-# Навигация предыдущая/следующая
-@owner_vision_edit_router.callback_query(F.data.startswith("vision_prev_") | F.data.startswith("vision_next_"))
-async def navigate_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    data = await state.get_data()
-    visions_ids = data.get("visions_ids", [])
-    current_index = int(callback.data.split("_")[2])
-
-    if "prev" in callback.data:
-        new_index = max(0, current_index - 1)
-    else:
-        new_index = min(len(visions_ids) - 1, current_index + 1)
-
-    async with AsyncSessionLocal() as session:
-        visions = [await session.get(Vision, vid) for vid in visions_ids]
+# Навигация предыдущая/следующая: кнопка несёт id и позицию показанной записи
+@callback_table.handler(VISION_PAGE)
+async def navigate_vision(callback: CallbackQuery, state: FSMContext, bot: Bot,
+                          vision_id: int, index: int, older: int):
+    page = await neighbour_vision_page(vision_id, index, "older" if older else "newer")
+    if page is None:
+        # Запись удалили, пока она была на экране — начинаем с самой новой
+        data = await state.get_data()
+        page = await first_vision_page(data["person_id"]) if data.get("person_id") else None
+        if page is None:
+            await callback.answer("Записи не найдены.", show_alert=True)
+            return
+    elif page.vision.id == vision_id:
+        await callback.answer("Это последняя запись." if older else "Это первая запись.")
+        return
 
-    await show_vision_record(callback, new_index, visions, bot, state)
-    await state.update_data(current_vision_index=new_index)
+    await show_vision_record(callback, page, bot, state)
     await callback.answer()
 
 # Удаление записи
-@owner_vision_edit_router.callback_query(F.data.startswith("delete_this_vision_"))
-async def confirm_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    vision_id = int(callback.data.split("_")[3])
-
+@callback_table.handler(VISION_DELETE)
+async def confirm_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot, vision_id: int):
     kb = [
-        [InlineKeyboardButton(text="✅ Да, удалить", callback_data=f"confirm_delete_vision_{vision_id}")],
+        [InlineKeyboardButton(text="✅ Да, удалить", callback_data=VISION_DELETE_CONFIRM.pack(vision_id))],
         [InlineKeyboardButton(text="❌ Нет, отменить", callback_data="cancel_delete_vision")],
     ]
 
@@ -110,23 +108,25 @@ async def confirm_delete_vision(callback: CallbackQuery, state: FSMContext, bot:
     await callback.answer()
 
 # Подтверждение удаления
-@owner_vision_edit_router.callback_query(F.data.startswith("confirm_delete_vision_"))
-async def process_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    vision_id = int(callback.data.split("_")[3])
+@callback_table.handler(VISION_DELETE_CONFIRM)
+async def process_delete_vision(callback: CallbackQuery, state: FSMContext, bot: Bot, vision_id: int):
     data = await state.get_data()
     person_id = data.get("person_id")
 
     async with AsyncSessionLocal() as session:
-        await session.execute(delete(Vision).where(Vision.id == vision_id))
+        deleted = await session.scalars(
+            delete(Vision).where(Vision.id == vision_id)
+            .returning(Vision.person_id).execution_options(**CACHE_KEYS_FROM_RETURNING)
+        )
+        invalidate_persons(session, deleted.all())
         await session.commit()
 
     await callback.answer("✅ Запись удалена!", show_alert=True)
 
     # Возврат в профиль
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
-        if person:
-            await show_client_profile(callback, person, state, bot)
+    person = await get_person(person_id)
+    if person:
+        await show_client_profile(callback, person, state, bot)
 
 # Отмена удаления
 @owner_vision_edit_router.callback_query(F.data == "cancel_delete_vision")
@@ -134,10 +134,8 @@ async def cancel_delete_vision(callback: CallbackQuery, state: FSMContext, bot:
     await callback.answer("Удаление отменено", show_alert=True)
 
 # Редактирование записи
-@owner_vision_edit_router.callback_query(F.data.startswith("edit_this_vision_"))
-async def start_edit_vision(callback: CallbackQuery, state: FSMContext, bot: Bot):
-    vision_id = int(callback.data.split("_")[3])
-
+@callback_table.handler(VISION_EDIT)
+async def start_edit_vision(callback: CallbackQuery, state: FSMContext, bot: Bot, vision_id: int):
     async with AsyncSessionLocal() as session:
         vision = await session.get(Vision, vision_id)
         if not vision:
@@ -274,8 +272,7 @@ async def cancel_edit_client(callback: CallbackQuery, state: FSMContext, bot: Bo
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await show_client_profile(callback, person, state, bot)
 
@@ -289,8 +286,7 @@ async def cancel_edit_vision(callback: CallbackQuery, state: FSMContext, bot: Bo
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             await show_client_profile(callback, person, state, bot)
 
@@ -298,26 +294,21 @@ async def cancel_edit_vision(callback: CallbackQuery, state: FSMContext, bot: Bo
 
 
 # Хендлер для кнопки "Назад в профиль" (добавьте в конец файла)
-@owner_vision_edit_router.callback_query(F.data.startswith("back_to_profile_"))
-async def back_to_profile(callback: CallbackQuery, state: FSMContext, bot: Bot):
+@callback_table.handler(VISION_BACK_TO_PROFILE)
+async def back_to_profile(callback: CallbackQuery, state: FSMContext, bot: Bot, person_id: int):
     if not is_owner(callback.from_user.id):
         await callback.answer("Доступ запрещён", show_alert=True)
         return
 
-    # Извлекаем person_id из callback_data
-    # back_to_profile_123 → 123
-    person_id = int(callback.data.split("_")[3])
-
     try:
         await callback.message.delete()
     except TelegramBadRequest:
         pass  # сообщение уже удалено — нормально
 
-    async with AsyncSessionLocal() as session:
-        person = await session.get(Person, person_id)
-        if not person:
-            await callback.answer("Клиент не найден.", show_alert=True)
-            return
+    person = await get_person(person_id)
+    if not person:
+        await callback.answer("Клиент не найден.", show_alert=True)
+        return
 
     # Возврат в профиль (используем существующую функцию)
     await show_client_profile(callback, person, state, bot)
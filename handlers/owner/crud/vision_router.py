@@ -7,11 +7,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.models import Person, Vision
-from database.session import AsyncSessionLocal
+from database.cache import get_person
+from database.write_queue import submit_write
 from config import OWNER_IDS
 from forms.forms_fsm import OwnerClientsStates  # добавьте новые состояния в forms_fsm.py
+from keyboards.callbacks import VISION_LIST
 from datetime import date
 
 from handlers.owner.crud.clients_router import show_client_profile 
@@ -55,8 +58,7 @@ async def cancel_add_vision(callback: CallbackQuery, state: FSMContext, bot: Bot
     person_id = data.get("person_id")
 
     if person_id:
-        async with AsyncSessionLocal() as session:
-            person = await session.get(Person, person_id)
+        person = await get_person(person_id)
         if person:
             from handlers.owner.crud.clients_router  import show_client_profile  # импорт функции профиля
             await show_client_profile(callback, person, state, bot)
@@ -150,13 +152,11 @@ async def process_note_and_save(message: Message, state: FSMContext, bot: Bot):
     data = await state.get_data()
     person_id = data["person_id"]
 
-    # === Важно: всё в одной сессии до commit ===
-    async with AsyncSessionLocal() as session:
+    # Запись и обновление клиента — одна операция очереди записи, коммитится вместе с соседними
+    async def save_vision(session: AsyncSession) -> dict | None:
         person = await session.get(Person, person_id)
         if not person:
-            await message.answer("❌ Клиент не найден.")
-            await state.clear()
-            return
+            return None
 
         # Создаём новую запись
         new_vision = Vision(
@@ -178,34 +178,40 @@ async def process_note_and_save(message: Message, state: FSMContext, bot: Bot):
         # Обновляем последний визит
         person.last_visit_date = date.today()
 
-        await session.commit()
-
         # Сохраняем нужные данные ДО выхода из сессии
-        full_name = person.full_name or '—'
-        age = person.age or '—'
-        phone = person.phone or '—'
-        telegram_id = person.telegram_id or '—'
-        role = person.role
-        reg_date = person.created_at.date() if person.created_at else '—'
-        last_visit = person.last_visit_date or '—'
+        return {
+            "full_name": person.full_name or '—',
+            "age": person.age or '—',
+            "phone": person.phone or '—',
+            "telegram_id": person.telegram_id or '—',
+            "role": person.role,
+            "reg_date": person.created_at.date() if person.created_at else '—',
+            "last_visit": person.last_visit_date or '—',
+        }
+
+    profile = await submit_write(save_vision)
+    if profile is None:
+        await message.answer("❌ Клиент не найден.")
+        await state.clear()
+        return
 
     # === Теперь формируем профиль из сохранённых переменных ===
     await message.answer("✅ Новая запись зрения успешно добавлена!")
 
     profile_text = f"👤 <b>Профиль клиента</b>\n\n"
-    profile_text += f"ФИО: {full_name}\n"
-    profile_text += f"Возраст: {age}\n"
-    profile_text += f"Телефон: {phone}\n"
-    profile_text += f"Telegram ID: {telegram_id}\n"
-    profile_text += f"Роль: {role}\n"
-    profile_text += f"Дата регистрации: {reg_date}\n"
-    profile_text += f"Последний визит: {last_visit}\n\n"
+    profile_text += f"ФИО: {profile['full_name']}\n"
+    profile_text += f"Возраст: {profile['age']}\n"
+    profile_text += f"Телефон: {profile['phone']}\n"
+    profile_text += f"Telegram ID: {profile['telegram_id']}\n"
+    profile_text += f"Роль: {profile['role']}\n"
+    profile_text += f"Дата регистрации: {profile['reg_date']}\n"
+    profile_text += f"Последний визит: {profile['last_visit']}\n\n"
     profile_text += "<i>Запись зрения добавлена успешно</i>"
 
     kb = [
         [InlineKeyboardButton(text="✏ Редактировать данные", callback_data=f"edit_client_{person_id}")],
         [InlineKeyboardButton(text="➕ Добавить новую запись зрения", callback_data=f"add_vision_{person_id}")],
-        [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=f"view_all_visions_{person_id}")],
+        [InlineKeyboardButton(text="📜 Просмотреть все записи зрения", callback_data=VISION_LIST.pack(person_id))],
         [InlineKeyboardButton(text="◀ Назад к поиску", callback_data="back_to_clients_search")],
         [InlineKeyboardButton(text="🏠 Главная панель", callback_data="to_main_panel")],
     ]
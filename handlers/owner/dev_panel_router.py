@@ -1,7 +1,7 @@
 import asyncio
+import html
 import logging
 import os
-import shutil
 import sys
 import time
 
@@ -14,23 +14,30 @@ from pathlib import Path
 
 from aiogram import F, Router
 from aiogram.filters import Command
-from aiogram.types import BufferedInputFile, CallbackQuery, FSInputFile, Message
+from aiogram.types import BufferedInputFile, CallbackQuery, Message
 from sqlalchemy import func, select
 
 from config import AUTO_BACKUP_INTERVAL_HOURS, AUTO_BACKUP_TARGET_IDS, OWNER_IDS
+from database.cache import clear_entity_cache, person_cache, vision_list_cache
+from database.fsm_storage import fsm_storage
+from database.engine import IS_SQLITE, SQLITE_STORAGE_PROFILE, async_engine, sql_metrics
+from database.instrumentation import LATENCY_BUCKETS_MS
 from database.models import Person, Vision
-from database.session import AsyncSessionLocal
+from database.sqlite_profile import read_sqlite_pragmas
+from database.session import ReadSessionLocal
+from database.write_queue import write_queue
 from keyboards.owner_kb import get_dev_panel_keyboard, get_owner_main_keyboard
 from middlewares.metrics import metrics_registry
+from utils import worker_ipc
 from utils.audit import AUDIT_LOG_PATH, write_audit_event
-from utils.backup_service import create_backup_file, get_latest_backup
+from utils.backup_service import create_backup_file, get_latest_backup, restore_backup_file
 from utils.broadcast_monitor import request_cancel as broadcast_request_cancel, snapshot as broadcast_snapshot
+from utils.file_parts import send_document_parts
 
 
 dev_panel_router = Router()
 START_TIME = time.monotonic()
 logger = logging.getLogger(__name__)
-DB_PATH = Path("data") / "database.db"
 
 
 def is_owner(user_id: int) -> bool:
@@ -82,6 +89,16 @@ async def _guard_owner(callback: CallbackQuery) -> bool:
 
 async def _restart_process() -> None:
     await asyncio.sleep(1)
+    if worker_ipc.worker_index is not None:
+        # Воркер не перезапускает себя сам: главный процесс останавливает всех и стартует заново
+        worker_ipc.request_restart()
+        return
+    # execv не выполняет finally в bot.py — дописываем FSM и очередь записи сами
+    try:
+        await fsm_storage.close()
+        await write_queue.stop()
+    except Exception:
+        logger.exception("Failed to flush pending writes before restart")
     os.execv(sys.executable, [sys.executable, *sys.argv])
 
 
@@ -141,7 +158,7 @@ async def dev_db_stats(callback: CallbackQuery):
     if not await _guard_owner(callback):
         return
 
-    async with AsyncSessionLocal() as session:
+    async with ReadSessionLocal() as session:
         users_count = await session.scalar(select(func.count(Person.id)))
         visions_count = await session.scalar(select(func.count(Vision.id)))
         owners_count = await session.scalar(select(func.count(Person.id)).where(Person.role == "owner"))
@@ -158,6 +175,67 @@ async def dev_db_stats(callback: CallbackQuery):
     await callback.answer()
 
 
+@dev_panel_router.callback_query(F.data == "dev_sqlite_profile")
+async def dev_sqlite_profile(callback: CallbackQuery):
+    if not await _guard_owner(callback):
+        return
+
+    if not IS_SQLITE:
+        await callback.message.answer("БД не SQLite — профиль не применяется.", reply_markup=get_dev_panel_keyboard())
+        await callback.answer()
+        return
+
+    async with async_engine.connect() as conn:
+        actual = await conn.run_sync(read_sqlite_pragmas)
+
+    configured = dict(SQLITE_STORAGE_PROFILE.pragmas())
+    lines = [
+        f"• {name}: <b>{value}</b>" + (f" (профиль: {configured[name]})" if name in configured else "")
+        for name, value in actual.items()
+    ]
+    await callback.message.answer(
+        f"🗄 <b>Профиль SQLite: {SQLITE_STORAGE_PROFILE.name}</b>\n" + "\n".join(lines),
+        reply_markup=get_dev_panel_keyboard(),
+    )
+    await callback.answer()
+
+
+@dev_panel_router.callback_query(F.data == "dev_sql_stats")
+async def dev_sql_stats(callback: CallbackQuery):
+    if not await _guard_owner(callback):
+        return
+
+    total = sum(sql_metrics.histogram)
+    bucket_labels = [f"≤{bound}" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}"]
+    histogram = " · ".join(f"{label}: {count}" for label, count in zip(bucket_labels, sql_metrics.histogram) if count)
+
+    top = sorted(sql_metrics.handlers.items(), key=lambda item: item[1].total_ms, reverse=True)[:10]
+    handler_lines = [
+        f"• <code>{html.escape(name)}</code>: {stats.queries} запр., {stats.total_ms:.0f} мс"
+        + (f", {stats.queries_per_call:.1f}/вызов (макс {stats.max_queries_per_call})" if stats.calls else "")
+        for name, stats in top
+    ]
+    slow_lines = [
+        f"• {datetime.fromtimestamp(slow.at).strftime('%H:%M:%S')} {slow.duration_ms:.0f} мс "
+        f"<code>{html.escape(slow.handler)}</code>\n  <code>{html.escape(slow.statement[:200])}</code>"
+        for slow in list(sql_metrics.slow_queries)[-5:]
+    ]
+
+    text = (
+        "🐢 <b>SQL-метрики</b>\n"
+        f"• Запросов: <b>{total}</b>, p50 {sql_metrics.percentile_bucket(0.5)}, p95 {sql_metrics.percentile_bucket(0.95)}\n"
+        f"• Гистограмма, мс: {histogram or '—'}\n"
+        f"• Кэш клиентов: {len(person_cache)} шт., попаданий {person_cache.hits} / промахов {person_cache.misses}\n"
+        f"• Кэш записей зрения: {len(vision_list_cache)} шт., попаданий {vision_list_cache.hits} / промахов {vision_list_cache.misses}\n"
+        f"• FSM: {len(fsm_storage)} в памяти, изменений {fsm_storage.stats['changes']}, "
+        f"записано строк {fsm_storage.stats['rows_written']} за {fsm_storage.stats['flushes']} сбросов\n\n"
+        "<b>Хендлеры по времени в БД:</b>\n" + ("\n".join(handler_lines) or "—") + "\n\n"
+        f"<b>Медленные запросы (≥{sql_metrics.slow_query_ms:.0f} мс):</b>\n" + ("\n".join(slow_lines) or "—")
+    )
+    await callback.message.answer(text[:4000], reply_markup=get_dev_panel_keyboard())
+    await callback.answer()
+
+
 @dev_panel_router.callback_query(F.data == "dev_broadcast_status")
 async def dev_broadcast_status(callback: CallbackQuery):
     if not await _guard_owner(callback):
@@ -268,7 +346,7 @@ async def dev_backup_db(callback: CallbackQuery):
         return
 
     try:
-        backup_path = create_backup_file()
+        backup_path = await create_backup_file()
     except FileNotFoundError:
         await callback.message.answer("Файл БД не найден.", reply_markup=get_dev_panel_keyboard())
         await callback.answer()
@@ -276,7 +354,7 @@ async def dev_backup_db(callback: CallbackQuery):
 
     write_audit_event(callback.from_user.id, "owner", "db_backup_created", {"file": str(backup_path)})
     await callback.message.answer(f"✅ Backup создан: <code>{backup_path}</code>", reply_markup=get_dev_panel_keyboard())
-    await callback.message.answer_document(document=FSInputFile(backup_path), caption="💾 Backup БД")
+    await send_document_parts(callback.bot, callback.message.chat.id, backup_path, backup_path.name, caption="💾 Backup БД")
     await callback.answer()
 
 
@@ -291,7 +369,9 @@ async def dev_download_latest_backup(callback: CallbackQuery):
         await callback.answer()
         return
 
-    await callback.message.answer_document(document=FSInputFile(latest), caption=f"📦 Последний backup: {latest.name}")
+    await send_document_parts(
+        callback.bot, callback.message.chat.id, latest, latest.name, caption=f"📦 Последний backup: {latest.name}"
+    )
     await callback.answer()
 
 
@@ -306,7 +386,10 @@ async def dev_restore_last_backup(callback: CallbackQuery):
         await callback.answer()
         return
 
-    shutil.copy2(latest, DB_PATH)
+    # Формы FSM в памяти не должны переписать восстановленную таблицу fsm_states
+    async with fsm_storage.restoring():
+        await restore_backup_file(latest)
+    clear_entity_cache()
     write_audit_event(callback.from_user.id, "owner", "db_restore_from_backup", {"file": str(latest)})
     await callback.message.answer(
         f"♻ Восстановлено из: <code>{latest}</code>\nРекомендуется перезапустить бота.",
@@ -1,25 +1,290 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
 from aiogram import Router, F, Bot
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, BufferedInputFile
+from aiogram.filters import StateFilter
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.exceptions import TelegramBadRequest
 
-from sqlalchemy import select, or_, func, and_
-from sqlalchemy.orm import joinedload
-
-from database.models import Person, Vision
-from database.session import AsyncSessionLocal
 from config import OWNER_IDS
+from database.models import get_kg_time
 from forms.forms_fsm import OwnerExportStates, OwnerMainStates
-from keyboards.owner_kb import get_owner_main_keyboard, get_export_submenu_keyboard
-import pandas as pd
-from io import BytesIO
+from keyboards.callbacks import VISION_CLIENT_PDF, VISION_PDF
+from keyboards.owner_kb import (
+    get_owner_main_keyboard,
+    get_export_submenu_keyboard,
+    get_export_filters_keyboard,
+    get_export_columns_keyboard,
+    get_export_cancel_keyboard,
+)
+from services.export_delivery import PDF_EXPORT_KEY, deliver_export, deliver_pdf_export
+from services.export_jobs import ExportCancelled, ExportTimeout, ProgressReporter
+from services.export_watermarks import get_export_watermark, save_export_watermark
+from services.exports import (
+    DEFAULT_EXPORT_FORMAT,
+    EXPORT_COLUMN_CHOICES,
+    EXPORT_FORMATS,
+    EXPORT_SPECS,
+    ExportFilters,
+    ExportFormat,
+    ExportSpec,
+    parse_date_range,
+)
+from utils.callback_codec import callback_table
 
 owner_export_router = Router()
+logger = logging.getLogger(__name__)
+
+# Идущие выгрузки: id владельца → событие отмены (одна выгрузка на владельца)
+_running_exports: dict[int, asyncio.Event] = {}
+# Ссылки на фоновые задачи выгрузок, чтобы их не собрал сборщик мусора
+_export_tasks: set[asyncio.Task] = set()
 
 def is_owner(user_id: int) -> bool:
     return user_id in OWNER_IDS
 
 
+def _progress_editor(message: Message, text: str, unit: str = "Обработано строк"):
+    # Вызывается не чаще раза в EXPORT_PROGRESS_INTERVAL_SECONDS — лимиты на edit не превышаются
+    async def report_progress(done: int) -> None:
+        try:
+            await message.edit_text(f"{text}\n{unit}: {done}", reply_markup=get_export_cancel_keyboard())
+        except TelegramBadRequest:
+            pass
+    return report_progress
+
+
+def _start_export(user_id: int, job: Callable[[asyncio.Event], Awaitable[None]]) -> bool:
+    """Запускает выгрузку фоновой задачей. False — у владельца уже идёт выгрузка.
+
+    Хендлер не ждёт выгрузку: иначе нажатие «Отмена» встало бы в очередь за ней
+    (в многопроцессном режиме обновления одного пользователя выполняются по порядку).
+    """
+    if user_id in _running_exports:
+        return False
+    # Событие занимается до первого await: второе нажатие не проскочит проверку выше
+    cancel = asyncio.Event()
+    _running_exports[user_id] = cancel
+
+    async def run() -> None:
+        try:
+            await job(cancel)
+        except Exception:
+            logger.exception("Export failed for owner %s", user_id)
+        finally:
+            _running_exports.pop(user_id, None)
+
+    task = asyncio.create_task(run(), name=f"export-{user_id}")
+    _export_tasks.add(task)
+    task.add_done_callback(_export_tasks.discard)
+    return True
+
+
+async def _run_with_progress(
+    bot: Bot,
+    user_id: int,
+    cancel: asyncio.Event,
+    progress_text: str,
+    run: Callable[[ProgressReporter, asyncio.Event], Awaitable[None]],
+    unit: str = "Обработано строк",
+) -> bool:
+    """Выгрузка с сообщением о прогрессе и кнопкой отмены. False — отменена или прервана."""
+    progress_message = await bot.send_message(user_id, progress_text, reply_markup=get_export_cancel_keyboard())
+    result_text = None
+    try:
+        await run(_progress_editor(progress_message, progress_text, unit), cancel)
+        return True
+    except ExportTimeout:
+        result_text = f"{progress_text}\n⏱ Выгрузка прервана: превышено время ожидания."
+        return False
+    except ExportCancelled:
+        result_text = f"{progress_text}\n⛔ Выгрузка отменена."
+        return False
+    finally:
+        try:
+            if result_text is None:
+                await progress_message.edit_reply_markup(reply_markup=None)
+            else:
+                await progress_message.edit_text(result_text)
+        except TelegramBadRequest:
+            pass
+
+
+async def _send_export_menu(bot: Bot, user_id: int, format_key: str, delta: bool) -> None:
+    await bot.send_message(
+        user_id,
+        "📊 <b>Выгрузки данных</b>\n\nВыберите формат и тип выгрузки:",
+        reply_markup=get_export_submenu_keyboard(format_key, delta)
+    )
+
+
+async def _export_table(
+    bot: Bot,
+    user_id: int,
+    spec: ExportSpec,
+    fmt: ExportFormat,
+    delta: bool,
+    filters: ExportFilters,
+    cancel: asyncio.Event,
+) -> None:
+    # Дельта-выгрузка: только строки, изменённые после прошлой выгрузки этого владельца
+    since = await get_export_watermark(user_id, spec.key) if delta else None
+    started_at = get_kg_time()
+
+    completed = await _run_with_progress(
+        bot,
+        user_id,
+        cancel,
+        spec.progress_text.format(format=fmt.label),
+        lambda on_progress, cancel: deliver_export(
+            bot, user_id, spec, fmt,
+            since=since, on_progress=on_progress, filters=filters, cancel=cancel,
+        ),
+    )
+
+    # Выгрузка с диапазонами дат содержит не все изменения — отметку не сдвигаем
+    if completed and not filters.limits_rows:
+        await save_export_watermark(user_id, spec.key, started_at)
+
+    await _send_export_menu(bot, user_id, fmt.key, delta)
+
+
+async def _export_all_pdf(bot: Bot, user_id: int, fmt: ExportFormat, delta: bool, cancel: asyncio.Event) -> None:
+    await _run_with_progress(
+        bot,
+        user_id,
+        cancel,
+        "📄 Генерирую PDF со всеми рецептами...",
+        lambda on_progress, cancel: deliver_pdf_export(
+            bot, user_id, on_progress=on_progress, cancel=cancel
+        ),
+        unit="Страниц",
+    )
+    await _send_export_menu(bot, user_id, fmt.key, delta)
+
+
+def _filters_text(filters: ExportFilters) -> str:
+    return (
+        "⚙ <b>Фильтры выгрузок</b>\n\n"
+        f"{filters.describe()}\n\n"
+        "Фильтры применяются ко всем табличным выгрузкам."
+    )
+
+
+async def _edit_menu(callback: CallbackQuery, text: str, reply_markup: InlineKeyboardMarkup) -> None:
+    try:
+        await callback.message.edit_text(text, reply_markup=reply_markup)
+    except TelegramBadRequest:
+        pass
+
+
+def _toggle_column(selected: list[str], key: str) -> list[str]:
+    all_keys = list(EXPORT_COLUMN_CHOICES)
+    current = selected or all_keys
+    if key in current:
+        # Хотя бы одна колонка должна остаться
+        updated = [k for k in current if k != key] or current
+    else:
+        updated = [k for k in all_keys if k in current or k == key]
+    return [] if updated == all_keys else updated
+
+
+async def _handle_filters_action(callback: CallbackQuery, state: FSMContext, action: str) -> None:
+    data = await state.get_data()
+    filters = ExportFilters.from_state(data.get("export_filters"))
+
+    if action == "export_filters_back":
+        await _edit_menu(
+            callback,
+            "📊 <b>Выгрузки данных</b>\n\nВыберите формат и тип выгрузки:",
+            get_export_submenu_keyboard(data.get("export_format", DEFAULT_EXPORT_FORMAT), data.get("export_delta", False)),
+        )
+    elif action in ("export_filter_visit", "export_filter_registered"):
+        await state.set_state(
+            OwnerExportStates.waiting_visit_range if action == "export_filter_visit"
+            else OwnerExportStates.waiting_registration_range
+        )
+        await _edit_menu(
+            callback,
+            "Введите диапазон дат в формате <code>ДД.ММ.ГГГГ-ДД.ММ.ГГГГ</code>.\n"
+            "Любую границу можно не указывать (<code>01.01.2025-</code>), "
+            "<code>-</code> — без ограничения.",
+            InlineKeyboardMarkup(inline_keyboard=[
+                [InlineKeyboardButton(text="◀ Отмена", callback_data="export_filters")],
+            ]),
+        )
+    elif action.startswith(("export_col_", "export_cols_all", "export_columns")):
+        columns = list(filters.columns)
+        if action.startswith("export_col_"):
+            key = action.removeprefix("export_col_")
+            if key in EXPORT_COLUMN_CHOICES:
+                columns = _toggle_column(columns, key)
+        elif action == "export_cols_all":
+            columns = []
+        filters = ExportFilters.from_state({**filters.to_state(), "columns": columns})
+        await state.update_data(export_filters=filters.to_state())
+        await _edit_menu(
+            callback,
+            "🧾 <b>Колонки выгрузок</b>\n\nОтмеченные колонки попадут в файл "
+            "(в каждой выгрузке — те из них, что в ней есть).",
+            get_export_columns_keyboard(list(EXPORT_COLUMN_CHOICES.items()), columns),
+        )
+    else:
+        if action == "export_filters_reset":
+            filters = ExportFilters()
+            await state.update_data(export_filters=filters.to_state())
+        await state.set_state(OwnerExportStates.export_menu)
+        await _edit_menu(callback, _filters_text(filters), get_export_filters_keyboard())
+
+    await callback.answer()
+
+
+async def _start_cards_pdf(callback: CallbackQuery, bot: Bot, progress_text: str, **target: int) -> None:
+    # target — vision_id одной записи или person_id клиента, см. deliver_pdf_export
+    user_id = callback.from_user.id
+    if not is_owner(user_id):
+        await callback.answer("Доступ запрещён", show_alert=True)
+        return
+
+    job = lambda cancel: _run_with_progress(
+        bot,
+        user_id,
+        cancel,
+        progress_text,
+        lambda on_progress, cancel: deliver_pdf_export(
+            bot, user_id, on_progress=on_progress, cancel=cancel, **target
+        ),
+        unit="Страниц",
+    )
+    if not _start_export(user_id, job):
+        await callback.answer("Дождитесь окончания текущей выгрузки или отмените её", show_alert=True)
+        return
+    await callback.answer()
+
+
+# PDF с карточкой одной записи — кнопка «Выгрузить в PDF» в просмотре записи зрения
+@callback_table.handler(VISION_PDF)
+async def export_vision_pdf(callback: CallbackQuery, bot: Bot, vision_id: int):
+    await _start_cards_pdf(callback, bot, "📄 Генерирую PDF...", vision_id=vision_id)
+
+
+# PDF со всеми записями клиента — кнопка в просмотре записи зрения
+@callback_table.handler(VISION_CLIENT_PDF)
+async def export_client_pdf(callback: CallbackQuery, bot: Bot, person_id: int):
+    await _start_cards_pdf(callback, bot, "📄 Генерирую PDF с рецептами клиента...", person_id=person_id)
+
+
+@owner_export_router.callback_query(F.data == "export_cancel")
+async def export_cancel(callback: CallbackQuery):
+    cancel = _running_exports.get(callback.from_user.id)
+    if cancel is None:
+        await callback.answer("Нет активной выгрузки")
+        return
+    cancel.set()
+    await callback.answer("Отменяю выгрузку...")
+
 
 @owner_export_router.callback_query(OwnerExportStates.export_menu, F.data.startswith("export_"))
 async def export_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
@@ -28,152 +293,54 @@ async def export_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
         return
 
     action = callback.data
+    if action.startswith(("export_filter", "export_col")):
+        await _handle_filters_action(callback, state, action)
+        return
+
+    data = await state.get_data()
+    format_key = data.get("export_format", DEFAULT_EXPORT_FORMAT)
+    delta = data.get("export_delta", False)
+    filters = ExportFilters.from_state(data.get("export_filters"))
+
+    # Переключатели формата и режима (всё / только изменения) — только обновляем клавиатуру
+    if action.startswith(("export_format_", "export_mode_")):
+        if action.startswith("export_format_"):
+            requested = action.removeprefix("export_format_")
+            if requested in EXPORT_FORMATS:
+                format_key = requested
+        else:
+            delta = action == "export_mode_delta"
+        await state.update_data(export_format=format_key, export_delta=delta)
+        try:
+            await callback.message.edit_reply_markup(reply_markup=get_export_submenu_keyboard(format_key, delta))
+        except TelegramBadRequest:
+            pass
+        await callback.answer()
+        return
+
+    fmt = EXPORT_FORMATS[format_key]
+    spec = EXPORT_SPECS.get(action)
+    if spec is not None or action == PDF_EXPORT_KEY:
+        if spec is not None:
+            job = lambda cancel: _export_table(bot, callback.from_user.id, spec, fmt, delta, filters, cancel)
+        else:
+            job = lambda cancel: _export_all_pdf(bot, callback.from_user.id, fmt, delta, cancel)
+        if not _start_export(callback.from_user.id, job):
+            await callback.answer("Дождитесь окончания текущей выгрузки или отмените её", show_alert=True)
+            return
+        try:
+            await callback.message.delete()
+        except TelegramBadRequest:
+            pass
+        await callback.answer()
+        return
 
     try:
         await callback.message.delete()
     except TelegramBadRequest:
         pass
 
-    if action == "export_all_clients":
-        await bot.send_message(callback.from_user.id, "📊 Генерирую Excel с клиентами...")
-
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(select(Person))
-            persons = result.scalars().all()
-
-        data = {
-            'ID': [p.id for p in persons],
-            'ФИО': [p.full_name or '—' for p in persons],
-            'Имя': [p.first_name or '—' for p in persons],
-            'Фамилия': [p.last_name or '—' for p in persons],
-            'Возраст': [p.age or '—' for p in persons],
-            'Телефон': [p.phone or '—' for p in persons],
-            'Telegram ID': [p.telegram_id or '—' for p in persons],
-            'Роль': [p.role for p in persons],
-            'Дата регистрации': [p.created_at.date() if p.created_at else '—' for p in persons],
-            'Последний визит': [p.last_visit_date or '—' for p in persons],
-        }
-
-        df = pd.DataFrame(data)
-        excel_buffer = BytesIO()
-        df.to_excel(excel_buffer, index=False, engine='openpyxl')
-        excel_buffer.seek(0)
-
-        await bot.send_document(
-            callback.from_user.id,
-            BufferedInputFile(excel_buffer.getvalue(), filename="clients.xlsx"),
-            caption="✅ Выгрузка всех клиентов в Excel готова!"
-        )
-
-    elif action == "export_all_visions":
-        await bot.send_message(callback.from_user.id, "📊 Генерирую Excel с записями зрения...")
-
-        async with AsyncSessionLocal() as session:
-            result = await session.execute(
-                select(Vision).options(joinedload(Vision.person))
-            )
-            visions = result.scalars().unique().all()
-
-        data = {
-            'Client ID': [v.person_id for v in visions],
-            'ФИО клиента': [v.person.full_name or '—' for v in visions],
-            'Дата визита': [v.visit_date for v in visions],
-            'SPH R': [v.sph_r or '—' for v in visions],
-            'CYL R': [v.cyl_r or '—' for v in visions],
-            'AXIS R': [v.axis_r or '—' for v in visions],
-            'SPH L': [v.sph_l or '—' for v in visions],
-            'CYL L': [v.cyl_l or '—' for v in visions],
-            'AXIS L': [v.axis_l or '—' for v in visions],
-            'PD': [v.pd or '—' for v in visions],
-            'Тип линз': [v.lens_type or '—' for v in visions],
-            'Модель оправы': [v.frame_model or '—' for v in visions],
-            'Примечание': [v.note or '—' for v in visions],
-        }
-
-        df = pd.DataFrame(data)
-        excel_buffer = BytesIO()
-        df.to_excel(excel_buffer, index=False, engine='openpyxl')
-        excel_buffer.seek(0)
-
-        await bot.send_document(
-            callback.from_user.id,
-            BufferedInputFile(excel_buffer.getvalue(), filename="visions.xlsx"),
-            caption="✅ Выгрузка всех записей зрения в Excel готова!"
-        )
-
-    elif action == "export_clients_last_vision":
-        await bot.send_message(callback.from_user.id, "📄 Генерирую Excel с клиентами и последними записями зрения...")
-    
-        async with AsyncSessionLocal() as session:
-            # Получаем всех клиентов
-            persons_result = await session.execute(select(Person))
-            persons = persons_result.scalars().all()
-    
-            # Для каждого клиента находим последнюю запись (коррелированный подзапрос)
-            data = []
-            for person in persons:
-                last_vision_result = await session.execute(
-                    select(Vision)
-                    .where(Vision.person_id == person.id)
-                    .order_by(Vision.visit_date.desc())
-                    .limit(1)
-                )
-                last_vision = last_vision_result.scalar_one_or_none()
-    
-                row = {
-                    'Client ID': person.id,
-                    'ФИО': person.full_name or '—',
-                    'Имя': person.first_name or '—',
-                    'Фамилия': person.last_name or '—',
-                    'Возраст': person.age or '—',
-                    'Телефон': person.phone or '—',
-                    'Telegram ID': person.telegram_id or '—',
-                    'Роль': person.role,
-                    'Дата регистрации': person.created_at.date() if person.created_at else '—',
-                    'Последний визит': person.last_visit_date or '—',
-                }
-    
-                if last_vision:
-                    row.update({
-                        'Дата последней записи зрения': last_vision.visit_date,
-                        'SPH R': last_vision.sph_r or '—',
-                        'CYL R': last_vision.cyl_r or '—',
-                        'AXIS R': last_vision.axis_r or '—',
-                        'SPH L': last_vision.sph_l or '—',
-                        'CYL L': last_vision.cyl_l or '—',
-                        'AXIS L': last_vision.axis_l or '—',
-                        'PD': last_vision.pd or '—',
-                        'Тип линз': last_vision.lens_type or '—',
-                        'Модель оправы': last_vision.frame_model or '—',
-                        'Примечание': last_vision.note or '—',
-                    })
-                else:
-                    row.update({
-                        'Дата последней записи зрения': '—',
-                        'SPH R': '—', 'CYL R': '—', 'AXIS R': '—',
-                        'SPH L': '—', 'CYL L': '—', 'AXIS L': '—',
-                        'PD': '—', 'Тип линз': '—', 'Модель оправы': '—', 'Примечание': '—',
-                    })
-    
-                data.append(row)
-    
-        df = pd.DataFrame(data)
-        excel_buffer = BytesIO()
-        df.to_excel(excel_buffer, index=False, engine='openpyxl')
-        excel_buffer.seek(0)
-    
-        await bot.send_document(
-            callback.from_user.id,
-            BufferedInputFile(excel_buffer.getvalue(), filename="clients_with_last_vision.xlsx"),
-            caption="✅ Выгрузка всех клиентов с последними записями зрения готова!"
-        )
-    
-        await bot.send_message(
-            callback.from_user.id,
-            "📊 <b>Выгрузки данных</b>\n\nВыберите тип выгрузки:",
-            reply_markup=get_export_submenu_keyboard()
-        )
-    elif action == "export_back":
+    if action == "export_back":
         await state.set_state(OwnerMainStates.main_menu)
         await bot.send_message(
             callback.from_user.id,
@@ -181,4 +348,39 @@ async def export_handler(callback: CallbackQuery, state: FSMContext, bot: Bot):
             reply_markup=get_owner_main_keyboard()
         )
 
-    await callback.answer()
\ No newline at end of file
+    await callback.answer()
+
+@owner_export_router.callback_query(
+    StateFilter(OwnerExportStates.waiting_visit_range, OwnerExportStates.waiting_registration_range),
+    F.data == "export_filters",
+)
+async def export_range_cancel(callback: CallbackQuery, state: FSMContext):
+    await _handle_filters_action(callback, state, callback.data)
+
+
+@owner_export_router.message(
+    StateFilter(OwnerExportStates.waiting_visit_range, OwnerExportStates.waiting_registration_range)
+)
+async def export_range_input(message: Message, state: FSMContext):
+    if not is_owner(message.from_user.id):
+        return
+
+    try:
+        start, end = parse_date_range(message.text or "")
+    except ValueError:
+        await message.answer("❌ Неверный формат. Пример: <code>01.01.2025-31.03.2025</code>")
+        return
+
+    data = await state.get_data()
+    filters = ExportFilters.from_state(data.get("export_filters")).to_state()
+    if await state.get_state() == OwnerExportStates.waiting_visit_range.state:
+        filters.update(visit_from=start and start.isoformat(), visit_to=end and end.isoformat())
+    else:
+        filters.update(registered_from=start and start.isoformat(), registered_to=end and end.isoformat())
+
+    await state.update_data(export_filters=filters)
+    await state.set_state(OwnerExportStates.export_menu)
+    await message.answer(
+        _filters_text(ExportFilters.from_state(filters)),
+        reply_markup=get_export_filters_keyboard(),
+    )
@@ -97,10 +97,11 @@ async def owner_menu_handler(callback: CallbackQuery, state: FSMContext, bot: Bo
         except TelegramBadRequest:
             pass
 
+        data = await state.get_data()
         await bot.send_message(
             callback.from_user.id,
-            "📊 <b>Выгрузки данных</b>\n\nВыберите тип выгрузки:",
-            reply_markup=get_export_submenu_keyboard()
+            "📊 <b>Выгрузки данных</b>\n\nВыберите формат и тип выгрузки:",
+            reply_markup=get_export_submenu_keyboard(data.get("export_format", "xlsx"), data.get("export_delta", False))
         )
         await state.set_state(OwnerExportStates.export_menu)
 
@@ -0,0 +1,50 @@
+# handlers/routers.py
+"""Роутеры бота в порядке подключения к диспетчеру (ВАЖНО: порядок!)."""
+from aiogram import Router
+
+from utils.callback_codec import callback_table
+
+from handlers.owner.dev_panel_router import dev_panel_router
+from handlers.start import start_router
+from handlers.client import client_router
+
+from handlers.owner.owner_main import owner_main_router
+from handlers.owner.client_button import owner_content_router
+from handlers.owner.admins_router import owner_admins_router
+from handlers.owner.broadcast_router import owner_broadcast_router
+from handlers.owner.crud.clients_router import owner_clients_router
+from handlers.owner.crud.vision_router import owner_vision_router
+from handlers.owner.crud.edit_and_delete import owner_vision_edit_router
+from handlers.owner.export_router import owner_export_router
+
+from handlers.admin.admin_main import admin_main_router
+from handlers.admin.admin_clients_router import admin_clients_router
+from handlers.admin.admin_broadcast_router import admin_broadcast_router
+from handlers.admin.admin_vision_edit_router import admin_vision_edit_router
+from handlers.admin.admin_vision_router import admin_vision_router
+
+ROUTERS: tuple[Router, ...] = (
+    # Сначала компактные callback_data: один поиск по префиксу до цепочек фильтров
+    callback_table.router,
+
+    # Потом владелец
+    owner_main_router,
+    owner_content_router,
+    owner_admins_router,
+    owner_broadcast_router,
+    owner_clients_router,
+    owner_vision_router,
+    owner_vision_edit_router,
+    owner_export_router,
+    dev_panel_router,
+
+    # Потом админы
+    admin_main_router,
+    admin_broadcast_router,
+    admin_clients_router,
+    admin_vision_edit_router,
+    admin_vision_router,
+
+    start_router,
+    client_router,
+)
@@ -0,0 +1,21 @@
+# keyboards/callbacks.py
+"""Действия кнопок в компактном формате callback_data (см. utils/callback_codec.py)."""
+from utils.callback_codec import callback_table
+
+# Записи зрения, панель владельца
+VISION_LIST = callback_table.action("vl", "person_id")
+VISION_PAGE = callback_table.action("vp", "vision_id", "index", "older")
+VISION_EDIT = callback_table.action("ve", "vision_id")
+VISION_DELETE = callback_table.action("vd", "vision_id")
+VISION_DELETE_CONFIRM = callback_table.action("vx", "vision_id")
+VISION_BACK_TO_PROFILE = callback_table.action("vb", "person_id")
+VISION_PDF = callback_table.action("vf", "vision_id")
+VISION_CLIENT_PDF = callback_table.action("vc", "person_id")
+
+# Записи зрения, панель администратора
+ADMIN_VISION_LIST = callback_table.action("avl", "person_id")
+ADMIN_VISION_PAGE = callback_table.action("avp", "vision_id", "index", "older")
+ADMIN_VISION_EDIT = callback_table.action("ave", "vision_id")
+ADMIN_VISION_DELETE = callback_table.action("avd", "vision_id")
+ADMIN_VISION_DELETE_CONFIRM = callback_table.action("avx", "vision_id")
+ADMIN_VISION_BACK_TO_PROFILE = callback_table.action("avb", "person_id")
@@ -56,20 +56,69 @@ def get_clients_submenu_keyboard():
     ])
 
 
-def get_export_submenu_keyboard():
+def get_export_submenu_keyboard(selected_format: str = "xlsx", delta: bool = False):
+    formats = [("xlsx", "Excel"), ("csv", "CSV.gz"), ("parquet", "Parquet")]
+    format_row = [
+        InlineKeyboardButton(
+            text=f"✅ {label}" if key == selected_format else label,
+            callback_data=f"export_format_{key}",
+        )
+        for key, label in formats
+    ]
+    mode_row = [
+        InlineKeyboardButton(text="✅ Всё" if not delta else "Всё", callback_data="export_mode_full"),
+        InlineKeyboardButton(text="✅ Только изменения" if delta else "Только изменения", callback_data="export_mode_delta"),
+    ]
     return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="📊 Выгрузить всех клиентов в Excel", callback_data="export_all_clients")],
-        [InlineKeyboardButton(text="📊 Выгрузить записи зрения в Excel", callback_data="export_all_visions")],
-        [InlineKeyboardButton(text="📄 Выгрузить клиентов + последние записи зрения (Excel)", callback_data="export_clients_last_vision")],
+        format_row,
+        mode_row,
+        [InlineKeyboardButton(text="📊 Выгрузить всех клиентов", callback_data="export_all_clients")],
+        [InlineKeyboardButton(text="📊 Выгрузить записи зрения", callback_data="export_all_visions")],
+        [InlineKeyboardButton(text="📄 Выгрузить клиентов + последние записи зрения", callback_data="export_clients_last_vision")],
+        [InlineKeyboardButton(text="📄 Все рецепты в PDF", callback_data="export_visions_pdf")],
+        [InlineKeyboardButton(text="⚙ Фильтры и колонки", callback_data="export_filters")],
         [InlineKeyboardButton(text="◀ Назад в главное меню", callback_data="export_back")],
     ])
 
 
+def get_export_cancel_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="✖ Отменить выгрузку", callback_data="export_cancel")],
+    ])
+
+
+def get_export_filters_keyboard():
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📅 Даты визита", callback_data="export_filter_visit")],
+        [InlineKeyboardButton(text="🗓 Даты регистрации", callback_data="export_filter_registered")],
+        [InlineKeyboardButton(text="🧾 Колонки", callback_data="export_columns")],
+        [InlineKeyboardButton(text="♻ Сбросить фильтры", callback_data="export_filters_reset")],
+        [InlineKeyboardButton(text="◀ Назад к выгрузкам", callback_data="export_filters_back")],
+    ])
+
+
+def get_export_columns_keyboard(choices: list[tuple[str, str]], selected: list[str]):
+    # Пустой выбор = все колонки
+    buttons = [
+        InlineKeyboardButton(
+            text=f"✅ {title}" if not selected or key in selected else title,
+            callback_data=f"export_col_{key}",
+        )
+        for key, title in choices
+    ]
+    rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+    rows.append([InlineKeyboardButton(text="Все колонки", callback_data="export_cols_all")])
+    rows.append([InlineKeyboardButton(text="◀ Назад к фильтрам", callback_data="export_filters")])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
 def get_dev_panel_keyboard():
     return InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="✅ Статус бота", callback_data="dev_status")],
         [InlineKeyboardButton(text="♻ Перезапуск бота", callback_data="dev_restart_bot")],
         [InlineKeyboardButton(text="📊 Статистика БД", callback_data="dev_db_stats")],
+        [InlineKeyboardButton(text="🗄 Профиль SQLite", callback_data="dev_sqlite_profile")],
+        [InlineKeyboardButton(text="🐢 SQL-метрики", callback_data="dev_sql_stats")],
         [InlineKeyboardButton(text="📨 Статус рассылки", callback_data="dev_broadcast_status")],
         [InlineKeyboardButton(text="⛔ Остановить рассылку", callback_data="dev_broadcast_stop")],
         [InlineKeyboardButton(text="🧪 Health-check логов", callback_data="dev_health_check")],
@@ -4,8 +4,11 @@ from collections import deque
 from typing import Any, Awaitable, Callable, Deque, Dict
 
 from aiogram import BaseMiddleware
+from aiogram.dispatcher.event.handler import HandlerObject
 from aiogram.types import TelegramObject
 
+from database.engine import sql_metrics
+
 
 class RuntimeMetrics:
     def __init__(self) -> None:
@@ -27,6 +30,16 @@ class RuntimeMetrics:
 metrics_registry = RuntimeMetrics()
 
 
+def _handler_name(data: Dict[str, Any]) -> str:
+    # Кнопки из таблицы префиксов идут через один диспетчер — берём хендлер, выбранный таблицей
+    handler_object: HandlerObject | None = data.get("callback_handler") or data.get("handler")
+    if handler_object is None:
+        return "unknown"
+    callback = handler_object.callback
+    module = getattr(callback, "__module__", "").rsplit(".", 1)[-1]
+    return f"{module}.{getattr(callback, '__qualname__', repr(callback))}"
+
+
 class MetricsMiddleware(BaseMiddleware):
     async def __call__(
         self,
@@ -35,4 +48,9 @@ class MetricsMiddleware(BaseMiddleware):
         data: Dict[str, Any],
     ) -> Any:
         await metrics_registry.mark_event()
-        return await handler(event, data)
+        # Запросы к БД внутри хендлера засчитываются ему — см. database/instrumentation.py
+        tokens = sql_metrics.begin_call(_handler_name(data))
+        try:
+            return await handler(event, data)
+        finally:
+            sql_metrics.end_call(tokens)
@@ -0,0 +1,29 @@
+# services/client_search.py
+"""Поиск клиентов в панелях владельца и админа: по telegram_id, телефону или подстроке имени.
+
+Запрос строится здесь, а не в каждом хендлере: проверка планов (database/query_plans.py)
+смотрит на тот же SQL, что выполняют роутеры.
+"""
+from sqlalchemy import Select, or_, select
+
+from database.models import Person
+
+
+def client_search_query(query: str, phone: str | None, limit: int = 15, min_id_length: int = 1) -> Select:
+    """phone — уже нормализованный телефон или None; min_id_length — с какой длины цифры считать telegram_id."""
+    conditions = []
+
+    if query.isdigit() and len(query) >= min_id_length:
+        conditions.append(Person.telegram_id == int(query))
+
+    if phone:
+        conditions.append(Person.phone == phone)
+
+    if query:
+        conditions.append(or_(
+            Person.first_name.ilike(f"%{query}%"),
+            Person.last_name.ilike(f"%{query}%"),
+            Person.full_name.ilike(f"%{query}%")
+        ))
+
+    return select(Person).where(or_(*conditions)).limit(limit)
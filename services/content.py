@@ -5,6 +5,7 @@ from typing import Dict
 from database.models import BotContent
 from database.session import AsyncSessionLocal
 from config import SECTION_NAMES
+from utils import worker_ipc
 # Глобальный кэш
 _content_cache: Dict[str, str] | None = None
 
@@ -24,11 +25,20 @@ async def get_content(key: str, default: str = "Информация време
     content = await get_bot_content()
     return content.get(key, default)
 
-def clear_content_cache() -> None:
+def _clear_local_content_cache(_: object = None) -> None:
     global _content_cache
     _content_cache = None
 
 
+def clear_content_cache() -> None:
+    _clear_local_content_cache()
+    # Остальные воркеры (UPDATE_WORKERS > 1) перечитают контент при следующем запросе
+    worker_ipc.publish("content_cache", None)
+
+
+worker_ipc.subscribe("content_cache", _clear_local_content_cache)
+
+
 
   # или откуда у вас SECTION_NAMES
 
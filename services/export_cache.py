@@ -0,0 +1,33 @@
+# services/export_cache.py
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+
+from database.models import DataVersion, ExportArtifact
+from database.session import AsyncSessionLocal
+
+
+async def get_data_version() -> int:
+    async with AsyncSessionLocal() as session:
+        version = await session.scalar(select(DataVersion.version).where(DataVersion.id == 1))
+        return version or 0
+
+
+async def get_cached_file_id(export_key: str, format_key: str, data_version: int) -> str | None:
+    async with AsyncSessionLocal() as session:
+        artifact = await session.get(ExportArtifact, (export_key, format_key))
+        if artifact is None or artifact.data_version != data_version:
+            return None
+        return artifact.file_id
+
+
+async def save_cached_file_id(export_key: str, format_key: str, data_version: int, file_id: str) -> None:
+    stmt = insert(ExportArtifact).values(
+        export_key=export_key, format_key=format_key, data_version=data_version, file_id=file_id
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExportArtifact.export_key, ExportArtifact.format_key],
+        set_={"data_version": stmt.excluded.data_version, "file_id": stmt.excluded.file_id},
+    )
+    async with AsyncSessionLocal() as session:
+        await session.execute(stmt)
+        await session.commit()
@@ -0,0 +1,132 @@
+# services/export_delivery.py
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from aiogram import Bot
+
+from services.export_cache import get_cached_file_id, get_data_version, save_cached_file_id
+from services.export_jobs import ProgressReporter, run_export_job, run_pdf_job
+from services.exports import ExportFilters, ExportFormat, ExportSpec, export_filename
+from utils.file_parts import send_document_parts
+
+logger = logging.getLogger(__name__)
+
+PDF_EXPORT_KEY = "export_visions_pdf"
+
+
+async def _deliver(
+    bot: Bot,
+    chat_id: int,
+    cache_key: tuple[str, str] | None,
+    filename: str,
+    caption: str,
+    build: Callable[[], Awaitable[tuple[Path, int]]],
+    empty_text: str | None = None,
+) -> None:
+    """Строит файл через build() и отправляет его.
+
+    С cache_key при неизменившихся данных файл не строится заново: повторно отправляется
+    file_id ранее загруженного файла. empty_text отправляется вместо пустого файла.
+    """
+    data_version = None
+    if cache_key is not None:
+        # Версию читаем до построения: изменения во время выгрузки инвалидируют запись кэша
+        data_version = await get_data_version()
+        file_id = await get_cached_file_id(*cache_key, data_version)
+        if file_id is not None:
+            logger.info("Export %s served from cache, data_version=%s", cache_key, data_version)
+            await bot.send_document(chat_id, file_id, caption=caption)
+            return
+
+    # Файл строится в отдельном процессе — event loop продолжает обслуживать клиентов
+    path, rows = await build()
+    try:
+        if empty_text is not None and rows == 0:
+            await bot.send_message(chat_id, empty_text)
+            return
+        messages = await send_document_parts(bot, chat_id, path, filename, caption=caption)
+    finally:
+        path.unlink(missing_ok=True)
+
+    # Кэшируем только файлы, ушедшие одним документом
+    if cache_key is not None and len(messages) == 1 and messages[0].document is not None:
+        await save_cached_file_id(*cache_key, data_version, messages[0].document.file_id)
+
+
+async def deliver_export(
+    bot: Bot,
+    chat_id: int,
+    spec: ExportSpec,
+    fmt: ExportFormat,
+    since: datetime | None = None,
+    on_progress: ProgressReporter | None = None,
+    filters: ExportFilters = ExportFilters(),
+    cancel: asyncio.Event | None = None,
+) -> None:
+    """Отправляет табличную выгрузку в чат. Кэшируются только полные выгрузки без фильтров."""
+    caption = spec.caption.format(format=fmt.label)
+    empty_text = None
+    if since is not None:
+        caption += f"\nТолько изменения с {since:%d.%m.%Y %H:%M}"
+        empty_text = f"Изменений с {since:%d.%m.%Y %H:%M} нет."
+    if not filters.is_empty:
+        caption += f"\n{filters.describe()}"
+        empty_text = empty_text or "Нет строк, подходящих под фильтры."
+    cacheable = since is None and filters.is_empty
+
+    await _deliver(
+        bot,
+        chat_id,
+        cache_key=(spec.key, fmt.key) if cacheable else None,
+        filename=export_filename(spec, fmt),
+        caption=caption,
+        build=lambda: run_export_job(spec, fmt, on_progress=on_progress, since=since, filters=filters, cancel=cancel),
+        empty_text=empty_text,
+    )
+
+
+async def deliver_pdf_export(
+    bot: Bot,
+    chat_id: int,
+    vision_id: int | None = None,
+    on_progress: ProgressReporter | None = None,
+    cancel: asyncio.Event | None = None,
+    person_id: int | None = None,
+) -> None:
+    """Отправляет PDF с карточкой одной записи зрения, с записями клиента или со всеми записями."""
+    if vision_id is not None:
+        await _deliver(
+            bot,
+            chat_id,
+            cache_key=None,
+            filename=f"prescription_{vision_id}.pdf",
+            caption="📄 Рецепт в PDF",
+            build=lambda: run_pdf_job(vision_id, on_progress=on_progress, cancel=cancel),
+            empty_text="Запись не найдена.",
+        )
+        return
+
+    if person_id is not None:
+        await _deliver(
+            bot,
+            chat_id,
+            cache_key=None,
+            filename=f"prescriptions_client_{person_id}.pdf",
+            caption="📄 Рецепты клиента в PDF",
+            build=lambda: run_pdf_job(person_id=person_id, on_progress=on_progress, cancel=cancel),
+            empty_text="У клиента нет записей зрения.",
+        )
+        return
+
+    await _deliver(
+        bot,
+        chat_id,
+        cache_key=(PDF_EXPORT_KEY, "pdf"),
+        filename="prescriptions.pdf",
+        caption="✅ Выгрузка всех рецептов в PDF готова!",
+        build=lambda: run_pdf_job(on_progress=on_progress, cancel=cancel),
+        empty_text="Записей зрения пока нет.",
+    )
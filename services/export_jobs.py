@@ -0,0 +1,318 @@
+# services/export_jobs.py
+import asyncio
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import Engine
+from sqlalchemy.orm import Session
+
+from config import EXPORT_PROGRESS_INTERVAL_SECONDS, EXPORT_TIMEOUT_SECONDS, EXPORT_WORKERS, PDF_PAGES_PER_PART
+from database.engine import create_sync_engine
+from database.session import ReadSessionLocal
+from services.exports import EXPORT_FORMATS, EXPORT_SPECS, ExportFilters, ExportFormat, ExportSpec, build_export
+from services.pdf_cards import merge_pdfs, part_bounds_query, render_cards
+
+logger = logging.getLogger(__name__)
+
+ProgressReporter = Callable[[int], Awaitable[None]]
+
+
+class ExportCancelled(Exception):
+    """Выгрузка остановлена пользователем; бросается и в воркере, и в основном процессе."""
+
+
+class ExportTimeout(ExportCancelled):
+    """Выгрузка не уложилась в EXPORT_TIMEOUT_SECONDS."""
+
+
+# spawn: дочерний процесс не наследует event loop и открытые соединения aiosqlite
+_mp_context = multiprocessing.get_context("spawn")
+_pool: ProcessPoolExecutor | None = None
+_free_slots: asyncio.Queue[int] | None = None
+# Счётчики обработанных строк и флаги отмены, по одному слоту на воркер (разделяемая память)
+_progress = None
+_cancel_flags = None
+_workers_count = max(1, EXPORT_WORKERS)
+
+# --- Код, выполняемый в процессе-воркере ---
+
+_worker_progress = None
+_worker_cancel_flags = None
+_worker_engine: Engine | None = None
+
+
+def _init_worker(progress, cancel_flags) -> None:
+    global _worker_progress, _worker_cancel_flags
+    _worker_progress = progress
+    _worker_cancel_flags = cancel_flags
+
+
+def _get_worker_engine() -> Engine:
+    global _worker_engine
+    if _worker_engine is None:
+        # Воркеры только читают — открываем файл в режиме ro
+        _worker_engine = create_sync_engine(read_only=True)
+    return _worker_engine
+
+
+def _progress_setter(slot: int) -> Callable[[int], None]:
+    # Вызывается после каждой пачки — здесь же воркер проверяет флаг отмены
+    def on_progress(rows: int) -> None:
+        if _worker_cancel_flags[slot]:
+            raise ExportCancelled()
+        _worker_progress[slot] = rows
+    return on_progress
+
+
+def _remove_on_failure(out_path: str) -> None:
+    # Основной процесс не ждёт отменённую задачу и удаляет файл сразу; воркер мог успеть
+    # создать его заново — убираем за собой
+    Path(out_path).unlink(missing_ok=True)
+
+
+def _run_export(
+    slot: int,
+    spec_key: str,
+    format_key: str,
+    out_path: str,
+    since: datetime | None,
+    filters: ExportFilters,
+) -> int:
+    spec = EXPORT_SPECS[spec_key]
+    fmt = EXPORT_FORMATS[format_key]
+    try:
+        with Session(_get_worker_engine()) as session, open(out_path, "wb") as fileobj:
+            return build_export(session, spec, fmt, fileobj, _progress_setter(slot), since, filters)
+    except BaseException:
+        _remove_on_failure(out_path)
+        raise
+
+
+def _render_pdf_part(slot: int, first_id: int, end_id: int | None, out_path: str, person_id: int | None) -> int:
+    try:
+        with Session(_get_worker_engine()) as session, open(out_path, "wb") as fileobj:
+            return render_cards(session, first_id, end_id, fileobj, _progress_setter(slot), person_id)
+    except BaseException:
+        _remove_on_failure(out_path)
+        raise
+
+
+def _merge_pdf_parts(slot: int, part_paths: list[str], out_path: str) -> None:
+    try:
+        merge_pdfs(part_paths, out_path, _progress_setter(slot))
+    except BaseException:
+        _remove_on_failure(out_path)
+        raise
+
+# --- Код основного процесса ---
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool, _progress, _cancel_flags
+    if _pool is None:
+        _progress = _mp_context.Array("q", _workers_count, lock=False)
+        _cancel_flags = _mp_context.Array("b", _workers_count, lock=False)
+        _pool = ProcessPoolExecutor(
+            max_workers=_workers_count,
+            mp_context=_mp_context,
+            initializer=_init_worker,
+            initargs=(_progress, _cancel_flags),
+        )
+    return _pool
+
+
+def _get_free_slots() -> asyncio.Queue[int]:
+    global _free_slots
+    if _free_slots is None:
+        _free_slots = asyncio.Queue()
+        for slot in range(_workers_count):
+            _free_slots.put_nowait(slot)
+    return _free_slots
+
+
+def _temp_path(suffix: str) -> Path:
+    fd, path = tempfile.mkstemp(prefix="export_", suffix=suffix)
+    os.close(fd)
+    return Path(path)
+
+
+def _deadline() -> float:
+    return asyncio.get_running_loop().time() + EXPORT_TIMEOUT_SECONDS
+
+
+async def _run_in_worker(
+    func: Callable[..., Any],
+    *args: Any,
+    on_progress: ProgressReporter | None = None,
+    cancel: asyncio.Event | None = None,
+    deadline: float | None = None,
+) -> Any:
+    """Выполняет func(slot, *args) в процессе-воркере, занимая свободный слот.
+
+    Пока воркер работает, раз в EXPORT_PROGRESS_INTERVAL_SECONDS вызывается on_progress
+    с числом обработанных строк из слота. При cancel.set(), по deadline (время loop.time())
+    или при отмене корутины воркеру выставляется флаг и управление сразу возвращается
+    вызывающему. Воркер бросает задачу после текущей пачки, а слот возвращается в очередь,
+    когда воркер действительно свободен.
+    """
+    free_slots = _get_free_slots()
+    slot = await free_slots.get()
+    future = None
+    try:
+        pool = _get_pool()
+        _progress[slot] = 0
+        _cancel_flags[slot] = 0
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(pool, func, slot, *args)
+
+        reported = 0
+        waiters = {future}
+        cancel_waiter = asyncio.ensure_future(cancel.wait()) if cancel is not None else None
+        if cancel_waiter is not None:
+            waiters.add(cancel_waiter)
+        try:
+            while True:
+                timeout = EXPORT_PROGRESS_INTERVAL_SECONDS
+                if deadline is not None:
+                    timeout = min(timeout, max(deadline - loop.time(), 0))
+                done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if future in done:
+                    break
+                if cancel_waiter in done:
+                    raise ExportCancelled()
+                if deadline is not None and loop.time() >= deadline:
+                    raise ExportTimeout()
+                rows = _progress[slot]
+                if on_progress is not None and rows != reported:
+                    reported = rows
+                    await on_progress(rows)
+        finally:
+            if cancel_waiter is not None:
+                cancel_waiter.cancel()
+
+        return future.result()
+    except BaseException:
+        if future is not None and not future.done():
+            # Не ждём воркер: слот освободит release ниже, когда задача действительно завершится
+            _cancel_flags[slot] = 1
+        raise
+    finally:
+        def release(done_future: asyncio.Future | None = None) -> None:
+            if done_future is not None and not done_future.cancelled():
+                done_future.exception()  # результат брошенной задачи не нужен — помечаем как прочитанный
+            free_slots.put_nowait(slot)
+
+        if future is None or future.done():
+            release(future)
+        else:
+            future.add_done_callback(release)
+
+
+async def run_export_job(
+    spec: ExportSpec,
+    fmt: ExportFormat,
+    on_progress: ProgressReporter | None = None,
+    since: datetime | None = None,
+    filters: ExportFilters = ExportFilters(),
+    cancel: asyncio.Event | None = None,
+) -> tuple[Path, int]:
+    """Строит выгрузку в отдельном процессе и возвращает путь к временному файлу.
+
+    since — выгрузить только строки, изменённые позже этого момента;
+    filters — диапазоны дат и набор колонок.
+    При отмене (cancel) или таймауте бросает ExportCancelled/ExportTimeout, файл удаляется.
+    Удалить файл после отправки — забота вызывающего.
+    """
+    out_path = _temp_path(f".{fmt.extension}")
+    try:
+        rows = await _run_in_worker(
+            _run_export, spec.key, fmt.key, str(out_path), since, filters,
+            on_progress=on_progress, cancel=cancel, deadline=_deadline(),
+        )
+    except BaseException:
+        out_path.unlink(missing_ok=True)
+        raise
+
+    logger.info("Export %s (%s) built in worker: %s rows", spec.key, fmt.key, rows)
+    return out_path, rows
+
+
+async def run_pdf_job(
+    vision_id: int | None = None,
+    on_progress: ProgressReporter | None = None,
+    cancel: asyncio.Event | None = None,
+    person_id: int | None = None,
+) -> tuple[Path, int]:
+    """PDF с карточками рецептов: одна запись (vision_id), записи клиента (person_id)
+    или все записи зрения.
+
+    Все записи делятся на части по PDF_PAGES_PER_PART страниц, части рисуются параллельно
+    во всех воркерах и затем склеиваются в один файл. Записи одного клиента рисуются одной частью.
+    """
+    if vision_id is not None:
+        bounds = [(vision_id, vision_id + 1)]
+    elif person_id is not None:
+        bounds = [(0, None)]
+    else:
+        async with ReadSessionLocal() as session:
+            starts = list(await session.scalars(part_bounds_query(PDF_PAGES_PER_PART)))
+        bounds = list(zip(starts, [*starts[1:], None])) or [(0, None)]
+
+    part_pages = [0] * len(bounds)
+
+    def part_reporter(index: int) -> ProgressReporter | None:
+        if on_progress is None:
+            return None
+
+        async def report(pages: int) -> None:
+            part_pages[index] = pages
+            await on_progress(sum(part_pages))
+        return report
+
+    deadline = _deadline()
+    part_paths = [_temp_path(".pdf") for _ in bounds]
+    out_path = _temp_path(".pdf")
+    parts = [
+        asyncio.ensure_future(_run_in_worker(
+            _render_pdf_part, first_id, end_id, str(path), person_id,
+            on_progress=part_reporter(i), cancel=cancel, deadline=deadline,
+        ))
+        for i, ((first_id, end_id), path) in enumerate(zip(bounds, part_paths))
+    ]
+    try:
+        try:
+            pages = sum(await asyncio.gather(*parts))
+        except BaseException:
+            # Одна часть упала или отменена — останавливаем остальные (свои файлы воркеры удалят сами)
+            for part in parts:
+                part.cancel()
+            await asyncio.gather(*parts, return_exceptions=True)
+            raise
+        if len(part_paths) == 1:
+            part_paths[0].replace(out_path)
+        else:
+            await _run_in_worker(
+                _merge_pdf_parts, [str(p) for p in part_paths], str(out_path), cancel=cancel, deadline=deadline
+            )
+    except BaseException:
+        out_path.unlink(missing_ok=True)
+        raise
+    finally:
+        for path in part_paths:
+            path.unlink(missing_ok=True)
+
+    logger.info("PDF export built in %s part(s): %s pages", len(bounds), pages)
+    return out_path, pages
+
+
+def shutdown_export_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
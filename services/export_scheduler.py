@@ -0,0 +1,135 @@
+# services/export_scheduler.py
+import asyncio
+import logging
+import random
+from dataclasses import dataclass
+from datetime import datetime, time, timedelta
+
+from aiogram import Bot
+
+from config import (
+    SCHEDULED_EXPORT_JITTER_MINUTES,
+    SCHEDULED_EXPORT_PEAK_HOURS,
+    SCHEDULED_EXPORT_TIME,
+    SCHEDULED_EXPORTS,
+)
+from database.models import get_kg_time
+from services.export_delivery import deliver_export
+from services.export_watermarks import get_export_watermark, save_export_watermark
+from services.exports import EXPORT_FORMATS, EXPORT_SPECS, ExportFormat, ExportSpec
+from utils import backup_service
+from utils.audit import write_audit_event
+
+logger = logging.getLogger(__name__)
+
+# Плановая выгрузка не стартует ближе этого к автобекапу — оба читают всю БД
+BACKUP_GUARD = timedelta(minutes=30)
+
+
+@dataclass(frozen=True)
+class ScheduledExport:
+    spec: ExportSpec
+    fmt: ExportFormat
+    delta: bool
+
+
+def parse_scheduled_exports(raw: str) -> list[ScheduledExport]:
+    jobs = []
+    for item in raw.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        spec_key, _, rest = item.partition(":")
+        format_key, _, mode = rest.partition(":")
+        if spec_key not in EXPORT_SPECS or format_key not in EXPORT_FORMATS or mode not in ("", "full", "delta"):
+            raise RuntimeError(f"Invalid scheduled export: {item}")
+        jobs.append(ScheduledExport(EXPORT_SPECS[spec_key], EXPORT_FORMATS[format_key], mode == "delta"))
+    return jobs
+
+
+def _parse_peak_hours(raw: str) -> tuple[int, int] | None:
+    if not raw.strip():
+        return None
+    start, _, end = raw.partition("-")
+    return int(start), int(end)
+
+
+def _in_peak(moment: datetime, peak: tuple[int, int]) -> bool:
+    start, end = peak
+    if start <= end:
+        return start <= moment.hour < end
+    return moment.hour >= start or moment.hour < end  # окно через полночь, например 22-6
+
+
+def next_run_at(now: datetime, rng: random.Random | None = None) -> datetime:
+    """Ближайший запуск: SCHEDULED_EXPORT_TIME + случайный сдвиг, вне пиковых часов и окна автобекапа."""
+    rng = rng or random.Random()
+    jitter = timedelta(minutes=SCHEDULED_EXPORT_JITTER_MINUTES)
+    at = time.fromisoformat(SCHEDULED_EXPORT_TIME)
+
+    run = now.replace(hour=at.hour, minute=at.minute, second=0, microsecond=0)
+    if run <= now:
+        run += timedelta(days=1)
+    run += rng.random() * jitter
+
+    peak = _parse_peak_hours(SCHEDULED_EXPORT_PEAK_HOURS)
+    # Сдвиг из окна бекапа может попасть в пиковые часы и наоборот — повторяем, пока оба условия не выполнены
+    for _ in range(4):
+        if peak is not None and _in_peak(run, peak):
+            peak_end = run.replace(hour=peak[1], minute=0, second=0, microsecond=0)
+            if peak_end <= run:
+                peak_end += timedelta(days=1)
+            run = peak_end + rng.random() * jitter
+            continue
+        backup_at = backup_service.next_auto_backup_at
+        if backup_at is not None and abs(run - backup_at) < BACKUP_GUARD:
+            run = backup_at + BACKUP_GUARD + rng.random() * jitter
+            continue
+        break
+    return run
+
+
+async def _run_scheduled_export(bot: Bot, owner_id: int, job: ScheduledExport) -> None:
+    since = await get_export_watermark(owner_id, job.spec.key) if job.delta else None
+    started_at = get_kg_time()
+    # Файл строится в пуле процессов выгрузок, как и ручные выгрузки
+    await deliver_export(bot, owner_id, job.spec, job.fmt, since=since)
+    # Отметка общая с ручными дельта-выгрузками владельца — полная плановая выгрузка её не двигает
+    if job.delta:
+        await save_export_watermark(owner_id, job.spec.key, started_at)
+
+
+async def scheduled_export_worker(bot: Bot, target_ids: list[int]) -> None:
+    try:
+        jobs = parse_scheduled_exports(SCHEDULED_EXPORTS)
+    except RuntimeError as e:
+        logger.error("Scheduled exports disabled: %s", e)
+        return
+    if not jobs:
+        return
+
+    logger.info(
+        "Scheduled export worker started: %s at %s, targets=%s",
+        [f"{job.spec.key}:{job.fmt.key}" for job in jobs], SCHEDULED_EXPORT_TIME, target_ids,
+    )
+
+    while True:
+        try:
+            run_at = next_run_at(get_kg_time())
+            logger.info("Next scheduled export at %s", run_at.isoformat())
+            await asyncio.sleep(max(0.0, (run_at - get_kg_time()).total_seconds()))
+
+            sent = []
+            for job in jobs:
+                for owner_id in target_ids:
+                    try:
+                        await _run_scheduled_export(bot, owner_id, job)
+                        sent.append(f"{job.spec.key}:{job.fmt.key}:{owner_id}")
+                    except Exception as e:
+                        logger.error("Scheduled export %s for %s failed: %s", job.spec.key, owner_id, e, exc_info=True)
+            write_audit_event(0, "system", "scheduled_exports_sent", {"exports": sent})
+        except asyncio.CancelledError:
+            logger.info("Scheduled export worker cancelled")
+            raise
+        except Exception as e:
+            logger.error("Scheduled export run failed: %s", e, exc_info=True)
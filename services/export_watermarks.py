@@ -0,0 +1,24 @@
+# services/export_watermarks.py
+from datetime import datetime
+
+from sqlalchemy.dialects.sqlite import insert
+
+from database.models import ExportWatermark
+from database.session import AsyncSessionLocal
+
+
+async def get_export_watermark(owner_id: int, export_key: str) -> datetime | None:
+    async with AsyncSessionLocal() as session:
+        watermark = await session.get(ExportWatermark, (owner_id, export_key))
+        return watermark.exported_at if watermark else None
+
+
+async def save_export_watermark(owner_id: int, export_key: str, exported_at: datetime) -> None:
+    stmt = insert(ExportWatermark).values(owner_id=owner_id, export_key=export_key, exported_at=exported_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ExportWatermark.owner_id, ExportWatermark.export_key],
+        set_={"exported_at": stmt.excluded.exported_at},
+    )
+    async with AsyncSessionLocal() as session:
+        await session.execute(stmt)
+        await session.commit()
@@ -0,0 +1,348 @@
+# services/exports.py
+import csv
+import gzip
+import io
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from typing import IO, Any, Callable, Iterable, Iterator, NamedTuple, Sequence
+
+import pandas as pd
+from openpyxl import Workbook
+from sqlalchemy import ColumnElement, Date, Select, and_, func, or_, select, type_coerce
+from sqlalchemy.orm import Session
+
+from config import EXPORT_CHUNK_SIZE
+from database.models import Person, Vision
+
+EMPTY = '—'
+
+
+class Column(NamedTuple):
+    key: str
+    title: str
+    kind: str  # int / float / str / date — нужен для типизированных форматов (Parquet)
+    expr: ColumnElement
+
+
+PERSON_COLUMNS = (
+    Column('full_name', 'ФИО', 'str', Person.full_name),
+    Column('first_name', 'Имя', 'str', Person.first_name),
+    Column('last_name', 'Фамилия', 'str', Person.last_name),
+    Column('age', 'Возраст', 'int', Person.age),
+    Column('phone', 'Телефон', 'str', Person.phone),
+    Column('telegram_id', 'Telegram ID', 'int', Person.telegram_id),
+    Column('role', 'Роль', 'str', Person.role),
+    Column('created_at', 'Дата регистрации', 'date', type_coerce(func.date(Person.created_at), Date)),
+    Column('last_visit_date', 'Последний визит', 'date', Person.last_visit_date),
+)
+VISION_COLUMNS = (
+    Column('sph_r', 'SPH R', 'float', Vision.sph_r),
+    Column('cyl_r', 'CYL R', 'float', Vision.cyl_r),
+    Column('axis_r', 'AXIS R', 'int', Vision.axis_r),
+    Column('sph_l', 'SPH L', 'float', Vision.sph_l),
+    Column('cyl_l', 'CYL L', 'float', Vision.cyl_l),
+    Column('axis_l', 'AXIS L', 'int', Vision.axis_l),
+    Column('pd', 'PD', 'float', Vision.pd),
+    Column('lens_type', 'Тип линз', 'str', Vision.lens_type),
+    Column('frame_model', 'Модель оправы', 'str', Vision.frame_model),
+    Column('note', 'Примечание', 'str', Vision.note),
+)
+
+FrameChunks = Iterable[pd.DataFrame]
+
+# Nullable-типы pandas: целые с пропусками не превращаются во float
+_FRAME_DTYPES = {"int": "Int64", "float": "Float64", "str": object, "date": object}
+
+
+@dataclass(frozen=True)
+class ExportFilters:
+    """Параметры выгрузки; все условия превращаются в WHERE и список колонок SELECT."""
+    visit_from: date | None = None
+    visit_to: date | None = None
+    registered_from: date | None = None
+    registered_to: date | None = None
+    columns: tuple[str, ...] = ()  # ключи Column; пусто — все колонки
+
+    @property
+    def is_empty(self) -> bool:
+        return self == ExportFilters()
+
+    @property
+    def limits_rows(self) -> bool:
+        return any((self.visit_from, self.visit_to, self.registered_from, self.registered_to))
+
+    def to_state(self) -> dict[str, Any]:
+        # Для FSM-данных: только JSON-совместимые значения
+        return {
+            "visit_from": self.visit_from.isoformat() if self.visit_from else None,
+            "visit_to": self.visit_to.isoformat() if self.visit_to else None,
+            "registered_from": self.registered_from.isoformat() if self.registered_from else None,
+            "registered_to": self.registered_to.isoformat() if self.registered_to else None,
+            "columns": list(self.columns),
+        }
+
+    @classmethod
+    def from_state(cls, data: dict[str, Any] | None) -> "ExportFilters":
+        if not data:
+            return cls()
+
+        def parse(value: str | None) -> date | None:
+            return date.fromisoformat(value) if value else None
+
+        return cls(
+            visit_from=parse(data.get("visit_from")),
+            visit_to=parse(data.get("visit_to")),
+            registered_from=parse(data.get("registered_from")),
+            registered_to=parse(data.get("registered_to")),
+            columns=tuple(data.get("columns") or ()),
+        )
+
+    def describe(self) -> str:
+        def period(start: date | None, end: date | None) -> str:
+            if start is None and end is None:
+                return "все"
+            return (f"{start:%d.%m.%Y}" if start else "…") + " – " + (f"{end:%d.%m.%Y}" if end else "…")
+
+        return (
+            f"Даты визита: {period(self.visit_from, self.visit_to)}\n"
+            f"Даты регистрации: {period(self.registered_from, self.registered_to)}\n"
+            f"Колонки: {len(self.columns) if self.columns else 'все'}"
+        )
+
+
+def parse_date_range(text: str) -> tuple[date | None, date | None]:
+    """«ДД.ММ.ГГГГ-ДД.ММ.ГГГГ»; любую границу можно опустить, «-» — без ограничений."""
+    start_text, sep, end_text = text.strip().partition("-")
+    if not sep:
+        raise ValueError("Date range must contain '-'")
+
+    def parse(value: str) -> date | None:
+        value = value.strip()
+        return datetime.strptime(value, "%d.%m.%Y").date() if value else None
+
+    start, end = parse(start_text), parse(end_text)
+    if start and end and start > end:
+        raise ValueError("Range start is after its end")
+    return start, end
+
+
+@dataclass(frozen=True)
+class ExportSpec:
+    key: str                                # callback_data кнопки выгрузки
+    basename: str
+    progress_text: str                      # {format} — название формата
+    caption: str
+    columns: tuple[Column, ...]
+    from_clause: Callable[[Select], Select]  # FROM/JOIN и сортировка для списка колонок
+    changed_since: Callable[[datetime], ColumnElement[bool]]
+    visit_date: ColumnElement               # колонка для фильтра по дате визита
+
+    def select_columns(self, keys: Sequence[str] = ()) -> tuple[Column, ...]:
+        if not keys:
+            return self.columns
+        selected = tuple(c for c in self.columns if c.key in keys)
+        return selected or self.columns
+
+
+@dataclass(frozen=True)
+class ExportFormat:
+    key: str
+    label: str
+    extension: str
+    write: Callable[[FrameChunks, Sequence[Column], IO[bytes]], None]
+
+
+# Последняя запись зрения на клиента одним проходом (оконная функция)
+_latest_vision = (
+    select(
+        Vision.id.label("vision_id"),
+        Vision.person_id.label("person_id"),
+        func.row_number().over(
+            partition_by=Vision.person_id,
+            order_by=(Vision.visit_date.desc(), Vision.id.desc()),
+        ).label("rn"),
+    )
+    .subquery()
+)
+
+
+EXPORT_SPECS: dict[str, ExportSpec] = {
+    spec.key: spec
+    for spec in (
+        ExportSpec(
+            key="export_all_clients",
+            basename="clients",
+            progress_text="📊 Генерирую {format} с клиентами...",
+            caption="✅ Выгрузка всех клиентов в {format} готова!",
+            columns=(Column('person_id', 'ID', 'int', Person.id), *PERSON_COLUMNS),
+            from_clause=lambda query: query.select_from(Person).order_by(Person.id),
+            changed_since=lambda since: Person.updated_at > since,
+            visit_date=Person.last_visit_date,
+        ),
+        ExportSpec(
+            key="export_all_visions",
+            basename="visions",
+            progress_text="📊 Генерирую {format} с записями зрения...",
+            caption="✅ Выгрузка всех записей зрения в {format} готова!",
+            columns=(
+                Column('person_id', 'Client ID', 'int', Vision.person_id),
+                Column('full_name', 'ФИО клиента', 'str', Person.full_name),
+                Column('visit_date', 'Дата визита', 'date', Vision.visit_date),
+                *VISION_COLUMNS,
+            ),
+            from_clause=lambda query: (
+                query.select_from(Vision)
+                .join(Person, Person.id == Vision.person_id)
+                .order_by(Vision.id)
+            ),
+            changed_since=lambda since: Vision.updated_at > since,
+            visit_date=Vision.visit_date,
+        ),
+        ExportSpec(
+            key="export_clients_last_vision",
+            basename="clients_with_last_vision",
+            progress_text="📄 Генерирую {format} с клиентами и последними записями зрения...",
+            caption="✅ Выгрузка всех клиентов с последними записями зрения в {format} готова!",
+            columns=(
+                Column('person_id', 'Client ID', 'int', Person.id),
+                *PERSON_COLUMNS,
+                Column('visit_date', 'Дата последней записи зрения', 'date', Vision.visit_date),
+                *VISION_COLUMNS,
+            ),
+            from_clause=lambda query: (
+                query.select_from(Person)
+                .outerjoin(_latest_vision, and_(_latest_vision.c.person_id == Person.id, _latest_vision.c.rn == 1))
+                .outerjoin(Vision, Vision.id == _latest_vision.c.vision_id)
+                .order_by(Person.id)
+            ),
+            changed_since=lambda since: or_(Person.updated_at > since, Vision.updated_at > since),
+            visit_date=Vision.visit_date,
+        ),
+    )
+}
+
+# Все колонки всех выгрузок (ключ → название) — для выбора набора колонок
+EXPORT_COLUMN_CHOICES: dict[str, str] = {}
+for _spec in EXPORT_SPECS.values():
+    for _column in _spec.columns:
+        EXPORT_COLUMN_CHOICES.setdefault(_column.key, _column.title)
+
+
+def write_xlsx(frames: FrameChunks, columns: Sequence[Column], fileobj: IO[bytes]) -> None:
+    """Пишет строки в write-only лист openpyxl: строки не копятся в памяти."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append([c.title for c in columns])
+    try:
+        for frame in frames:
+            # Пустые значения заменяются на всю пачку сразу, а не в цикле по ячейкам
+            for row in frame.astype(object).fillna(EMPTY).itertuples(index=False, name=None):
+                ws.append(row)
+    except BaseException:
+        ws.close()  # закрываем временный файл листа, недостроенная книга не сохраняется
+        raise
+    wb.save(fileobj)
+
+
+def write_csv_gz(frames: FrameChunks, columns: Sequence[Column], fileobj: IO[bytes]) -> None:
+    # utf-8-sig — чтобы Excel корректно открывал кириллицу; пустые значения — пустые ячейки
+    with gzip.GzipFile(fileobj=fileobj, mode="wb") as gz:
+        text = io.TextIOWrapper(gz, encoding="utf-8-sig", newline="")
+        csv.writer(text).writerow([c.title for c in columns])
+        for frame in frames:
+            frame.to_csv(text, header=False, index=False, lineterminator="\r\n")
+        text.flush()
+        text.detach()
+
+
+def write_parquet(frames: FrameChunks, columns: Sequence[Column], fileobj: IO[bytes]) -> None:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    arrow_types = {"int": pa.int64(), "float": pa.float64(), "str": pa.string(), "date": pa.date32()}
+    schema = pa.schema([(c.title, arrow_types[c.kind]) for c in columns])
+    with pq.ParquetWriter(fileobj, schema, compression="zstd") as writer:
+        for frame in frames:
+            arrays = [pa.array(frame[c.key], type=arrow_types[c.kind], from_pandas=True) for c in columns]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+
+
+EXPORT_FORMATS: dict[str, ExportFormat] = {
+    fmt.key: fmt
+    for fmt in (
+        ExportFormat(key="xlsx", label="Excel", extension="xlsx", write=write_xlsx),
+        ExportFormat(key="csv", label="CSV (gzip)", extension="csv.gz", write=write_csv_gz),
+        ExportFormat(key="parquet", label="Parquet", extension="parquet", write=write_parquet),
+    )
+}
+DEFAULT_EXPORT_FORMAT = "xlsx"
+
+
+def export_filename(spec: ExportSpec, fmt: ExportFormat) -> str:
+    return f"{spec.basename}.{fmt.extension}"
+
+
+ProgressCallback = Callable[[int], None]
+
+
+def build_query(spec: ExportSpec, filters: ExportFilters, since: datetime | None = None) -> Select:
+    columns = spec.select_columns(filters.columns)
+    query = spec.from_clause(select(*(c.expr for c in columns)))
+    if since is not None:
+        query = query.where(spec.changed_since(since))
+    if filters.visit_from is not None:
+        query = query.where(spec.visit_date >= filters.visit_from)
+    if filters.visit_to is not None:
+        query = query.where(spec.visit_date <= filters.visit_to)
+    # created_at хранится с временем — границы переводим в полуинтервал [from 00:00, to+1 00:00)
+    if filters.registered_from is not None:
+        query = query.where(Person.created_at >= datetime.combine(filters.registered_from, time.min))
+    if filters.registered_to is not None:
+        query = query.where(Person.created_at < datetime.combine(filters.registered_to + timedelta(days=1), time.min))
+    return query
+
+
+def chunk_frame(chunk: Sequence[Sequence[Any]], columns: Sequence[Column]) -> pd.DataFrame:
+    """Пачка кортежей из БД → DataFrame по колонкам с типами из Column.kind."""
+    values = list(zip(*chunk)) if chunk else [()] * len(columns)
+    return pd.DataFrame({
+        c.key: pd.array(column_values, dtype=_FRAME_DTYPES[c.kind])
+        for c, column_values in zip(columns, values)
+    })
+
+
+def iter_frames(
+    session: Session,
+    spec: ExportSpec,
+    filters: ExportFilters,
+    since: datetime | None = None,
+) -> Iterator[pd.DataFrame]:
+    # yield_per: курсор отдаёт строки пачками по EXPORT_CHUNK_SIZE, все форматы читают один поток.
+    # Выбираются только нужные колонки кортежами — без ORM-объектов и identity map
+    columns = spec.select_columns(filters.columns)
+    result = session.execute(build_query(spec, filters, since), execution_options={"yield_per": EXPORT_CHUNK_SIZE})
+    for partition in result.partitions():
+        yield chunk_frame(partition, columns)
+
+
+def build_export(
+    session: Session,
+    spec: ExportSpec,
+    fmt: ExportFormat,
+    fileobj: IO[bytes],
+    on_progress: ProgressCallback | None = None,
+    since: datetime | None = None,
+    filters: ExportFilters = ExportFilters(),
+) -> int:
+    count = 0
+
+    def tracked_frames() -> Iterator[pd.DataFrame]:
+        nonlocal count
+        for frame in iter_frames(session, spec, filters, since):
+            yield frame
+            count += len(frame)
+            if on_progress is not None:
+                on_progress(count)
+
+    fmt.write(tracked_frames(), spec.select_columns(filters.columns), fileobj)
+    return count
@@ -0,0 +1,162 @@
+# services/pdf_cards.py
+import logging
+from pathlib import Path
+from typing import IO, Callable, Sequence
+
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A5
+from reportlab.lib.units import mm
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Table, TableStyle
+from sqlalchemy import Select, func, select
+from sqlalchemy.orm import Session
+
+from config import EXPORT_CHUNK_SIZE, PDF_FONT_PATH
+from database.models import Person, Vision
+
+logger = logging.getLogger(__name__)
+
+FONT_NAME = "CardFont"
+_font_registered: str | None = None
+
+
+def _font() -> str:
+    # Встроенная Helvetica не содержит кириллицы — нужен TTF-шрифт (DejaVu в Docker-образе)
+    global _font_registered
+    if _font_registered is None:
+        if Path(PDF_FONT_PATH).exists():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, PDF_FONT_PATH))
+            _font_registered = FONT_NAME
+        else:
+            logger.warning("PDF font not found: %s, falling back to Helvetica", PDF_FONT_PATH)
+            _font_registered = "Helvetica"
+    return _font_registered
+
+
+def _fmt(value) -> str:
+    return '—' if value is None else str(value)
+
+
+def cards_query(first_id: int, end_id: int | None, person_id: int | None = None) -> Select:
+    """Записи зрения с id в [first_id, end_id) вместе с данными клиента, по порядку id.
+
+    person_id — только записи одного клиента.
+    """
+    query = (
+        select(Vision, Person.full_name, Person.phone)
+        .join(Person, Person.id == Vision.person_id)
+        .where(Vision.id >= first_id)
+        .order_by(Vision.id)
+    )
+    if end_id is not None:
+        query = query.where(Vision.id < end_id)
+    if person_id is not None:
+        query = query.where(Vision.person_id == person_id)
+    return query
+
+
+def part_bounds_query(pages_per_part: int) -> Select:
+    # Первый id каждой части: каждая pages_per_part-я запись по порядку id
+    numbered = select(
+        Vision.id,
+        func.row_number().over(order_by=Vision.id).label("rn"),
+    ).subquery()
+    return (
+        select(numbered.c.id)
+        .where((numbered.c.rn - 1) % pages_per_part == 0)
+        .order_by(numbered.c.id)
+    )
+
+
+def _draw_card(canvas: Canvas, vision: Vision, full_name: str | None, phone: str | None) -> None:
+    font = _font()
+    width, height = A5
+    x = 15 * mm
+    y = height - 20 * mm
+
+    canvas.setFont(font, 16)
+    canvas.drawString(x, y, "Рецепт на очки")
+    canvas.setFont(font, 10)
+    y -= 10 * mm
+    for line in (
+        f"Клиент: {full_name or '—'}",
+        f"Телефон: {phone or '—'}",
+        f"Дата визита: {vision.visit_date}",
+    ):
+        canvas.drawString(x, y, line)
+        y -= 6 * mm
+
+    table = Table(
+        [
+            ["", "SPH", "CYL", "AXIS"],
+            ["OD (правый)", _fmt(vision.sph_r), _fmt(vision.cyl_r), _fmt(vision.axis_r)],
+            ["OS (левый)", _fmt(vision.sph_l), _fmt(vision.cyl_l), _fmt(vision.axis_l)],
+        ],
+        colWidths=[35 * mm, 25 * mm, 25 * mm, 25 * mm],
+    )
+    table.setStyle(TableStyle([
+        ("FONT", (0, 0), (-1, -1), font, 10),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.whitesmoke),
+        ("ALIGN", (1, 0), (-1, -1), "CENTER"),
+    ]))
+    _, table_height = table.wrapOn(canvas, width - 2 * x, y)
+    y -= table_height
+    table.drawOn(canvas, x, y)
+    y -= 10 * mm
+
+    for line in (
+        f"PD: {_fmt(vision.pd)}",
+        f"Тип линз: {_fmt(vision.lens_type)}",
+        f"Модель оправы: {_fmt(vision.frame_model)}",
+    ):
+        canvas.drawString(x, y, line)
+        y -= 6 * mm
+    if vision.note:
+        canvas.drawString(x, y, f"Примечание: {vision.note}")
+
+    canvas.showPage()
+
+
+def render_cards(
+    session: Session,
+    first_id: int,
+    end_id: int | None,
+    fileobj: IO[bytes],
+    on_progress: Callable[[int], None] | None = None,
+    person_id: int | None = None,
+) -> int:
+    """Рисует по странице на запись зрения; строки читаются из БД пачками."""
+    canvas = Canvas(fileobj, pagesize=A5, pageCompression=1)
+    canvas.setTitle("Рецепты")
+    pages = 0
+    result = session.execute(cards_query(first_id, end_id, person_id), execution_options={"yield_per": EXPORT_CHUNK_SIZE})
+    for partition in result.partitions():
+        for row in partition:
+            _draw_card(canvas, row.Vision, row.full_name, row.phone)
+        pages += len(partition)
+        if on_progress is not None:
+            on_progress(pages)
+    if pages == 0:
+        canvas.showPage()
+    canvas.save()
+    return pages
+
+
+def merge_pdfs(
+    part_paths: Sequence[str],
+    out_path: str,
+    on_progress: Callable[[int], None] | None = None,
+) -> None:
+    """Склеивает части в один файл; on_progress(число склеенных частей) — после каждой части."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    for merged, part_path in enumerate(part_paths, start=1):
+        writer.append(part_path)
+        if on_progress is not None:
+            on_progress(merged)
+    with open(out_path, "wb") as fileobj:
+        writer.write(fileobj)
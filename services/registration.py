@@ -0,0 +1,95 @@
+# services/registration.py
+from dataclasses import dataclass
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from database.cache import CACHE_KEYS_FROM_RETURNING, invalidate_persons
+from database.models import Person, get_kg_time
+from database.session import ReadSessionLocal
+from database.write_queue import submit_write
+
+
+@dataclass(frozen=True)
+class Registration:
+    is_new: bool
+    has_phone: bool
+
+
+async def register_user(telegram_id: int, username: str | None, first_name: str | None,
+                        last_name: str | None) -> Registration:
+    """Регистрирует пользователя по /start; повторный /start без изменений — одно чтение и ноль записей."""
+    async with ReadSessionLocal() as session:
+        row = (await session.execute(
+            select(Person.username, Person.phone).where(Person.telegram_id == telegram_id)
+        )).one_or_none()
+
+    # Username хранится последний известный: пустой новый его не затирает
+    if row is not None and (username is None or username == row.username):
+        return Registration(is_new=False, has_phone=row.phone is not None)
+
+    created_at = get_kg_time()
+    # Вставка и обновление — два оператора в одной транзакции очереди записи: признак
+    # «новый клиент» — это сам факт, что вставка вернула строку, а не сравнение значений
+    insert_stmt = insert(Person).values(
+        telegram_id=telegram_id,
+        username=username,
+        first_name=first_name,
+        last_name=last_name,
+        role="client",
+        created_at=created_at,
+        updated_at=created_at,
+    ).on_conflict_do_nothing(index_elements=[Person.telegram_id]).returning(Person.id)
+    update_stmt = (
+        update(Person)
+        .where(
+            Person.telegram_id == telegram_id,
+            # Параллельный /start того же пользователя уже записал то же самое — строку не трогаем
+            Person.username.is_distinct_from(username),
+        )
+        .values(username=username, updated_at=created_at)
+        .returning(Person.id, Person.phone)
+        .execution_options(**CACHE_KEYS_FROM_RETURNING)
+    )
+
+    async def upsert(session: AsyncSession) -> Registration:
+        if await session.scalar(insert_stmt) is not None:
+            return Registration(is_new=True, has_phone=False)
+        returned = (await session.execute(update_stmt)).one_or_none() if username is not None else None
+        if returned is None:
+            phone = await session.scalar(select(Person.phone).where(Person.telegram_id == telegram_id))
+            return Registration(is_new=False, has_phone=phone is not None)
+        # Обновлён username существующего клиента — сбрасываем только его
+        invalidate_persons(session, [returned.id])
+        return Registration(is_new=False, has_phone=returned.phone is not None)
+
+    return await submit_write(upsert)
+
+
+async def save_phone(telegram_id: int, phone: str) -> bool:
+    """Привязывает телефон к пользователю; False — номер уже занят другим аккаунтом."""
+    other = aliased(Person)
+    # Проверка занятости и запись — один оператор: между ними не вклинится чужая регистрация
+    stmt = (
+        update(Person)
+        .where(
+            Person.telegram_id == telegram_id,
+            Person.phone.is_distinct_from(phone),
+            ~exists().where(other.phone == phone),
+        )
+        .values(phone=phone, updated_at=get_kg_time())
+        .returning(Person.id)
+        .execution_options(**CACHE_KEYS_FROM_RETURNING)
+    )
+
+    async def save(session: AsyncSession) -> bool:
+        person_id = await session.scalar(stmt)
+        if person_id is not None:
+            invalidate_persons(session, [person_id])
+            return True
+        owner = await session.scalar(select(Person.telegram_id).where(Person.phone == phone))
+        return owner == telegram_id
+
+    return await submit_write(save)
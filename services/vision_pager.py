@@ -0,0 +1,93 @@
+# services/vision_pager.py
+"""Постраничный просмотр записей зрения клиента по курсору.
+
+Записи идут от новых к старым в порядке индекса ix_visions_person_id_visit_date
+(person_id, visit_date DESC, id DESC). Кнопки ◀/▶ несут id показанной записи, а страница
+ищется сравнением пары (visit_date, id) с её значениями — один запрос по индексу на нажатие,
+без списка id в FSM и без чтения всех записей. Вместе с записью выбирается соседняя за ней
+(LIMIT на одну строку больше): так известно, есть ли куда листать дальше.
+"""
+from dataclasses import dataclass
+from typing import Literal
+
+from sqlalchemy import Select, select, tuple_
+from sqlalchemy.orm import aliased
+
+from database.models import Person, Vision
+from database.session import ReadSessionLocal
+
+Direction = Literal["newer", "older"]
+
+
+@dataclass(frozen=True)
+class VisionPage:
+    vision: Vision
+    index: int  # позиция записи от новых к старым, с нуля
+    total: int
+    has_newer: bool
+    has_older: bool
+
+
+def first_page_query(person_id: int) -> Select:
+    # Самая новая запись и следующая за ней; vision_count держат триггеры в persons
+    return (
+        select(Vision, Person.vision_count)
+        .join(Person, Person.id == Vision.person_id)
+        .where(Vision.person_id == person_id)
+        .order_by(Vision.visit_date.desc(), Vision.id.desc())
+        .limit(2)
+    )
+
+
+def neighbour_query(vision_id: int, direction: Direction) -> Select:
+    # Курсор и две записи за ним в сторону листания: первая строка подтверждает, что курсор
+    # ещё существует, вторая — искомая запись, третья — сосед для has_newer/has_older
+    cursor = aliased(Vision)
+    cursor_key = (
+        select(cursor.visit_date, cursor.id).where(cursor.id == vision_id).scalar_subquery()
+    )
+    key = tuple_(Vision.visit_date, Vision.id)
+    stmt = (
+        select(Vision, Person.vision_count)
+        .join(Person, Person.id == Vision.person_id)
+        .where(Vision.person_id == select(cursor.person_id).where(cursor.id == vision_id).scalar_subquery())
+    )
+    if direction == "older":
+        stmt = stmt.where(key <= cursor_key).order_by(Vision.visit_date.desc(), Vision.id.desc())
+    else:
+        stmt = stmt.where(key >= cursor_key).order_by(Vision.visit_date.asc(), Vision.id.asc())
+    return stmt.limit(3)
+
+
+async def first_vision_page(person_id: int) -> VisionPage | None:
+    """Самая новая запись клиента; None — записей нет."""
+    async with ReadSessionLocal() as session:
+        rows = (await session.execute(first_page_query(person_id))).all()
+    if not rows:
+        return None
+    vision, total = rows[0]
+    return VisionPage(vision=vision, index=0, total=total, has_newer=False, has_older=len(rows) > 1)
+
+
+async def neighbour_vision_page(vision_id: int, index: int, direction: Direction) -> VisionPage | None:
+    """Соседняя с vision_id запись (index — позиция vision_id на экране).
+
+    Если листать в эту сторону некуда, возвращается страница самой vision_id.
+    None — запись vision_id уже удалена, показывать надо первую страницу.
+    """
+    async with ReadSessionLocal() as session:
+        rows = (await session.execute(neighbour_query(vision_id, direction))).all()
+    if not rows or rows[0][0].id != vision_id:
+        return None
+    vision, total = rows[min(1, len(rows) - 1)]
+    if len(rows) == 1:
+        return VisionPage(vision=vision, index=index, total=total,
+                          has_newer=direction == "older" and index > 0,
+                          has_older=direction == "newer" and index < total - 1)
+    has_more = len(rows) > 2
+    # Позиция из кнопки могла устареть, если записи добавляли или удаляли, — держим её в границах
+    if direction == "older":
+        return VisionPage(vision=vision, index=min(index + 1, total - 1), total=total,
+                          has_newer=True, has_older=has_more)
+    return VisionPage(vision=vision, index=max(index - 1, 0), total=total,
+                      has_newer=has_more, has_older=True)
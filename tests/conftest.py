@@ -0,0 +1,12 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# config.py требует токен и владельцев при импорте; тестам они не нужны, а БД бота они не трогают
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("OWNER_IDS", "1")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{Path(tempfile.gettempdir()) / 'bot-tests.db'}")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
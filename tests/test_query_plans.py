@@ -0,0 +1,19 @@
+# tests/test_query_plans.py
+"""Планы горячих запросов без SCAN и TEMP B-TREE (см. database/query_plans.py)."""
+import pytest
+
+from database.query_plans import HOT_QUERIES, explain, plan_problems, prepare_database
+
+
+@pytest.fixture(scope="module")
+def plans_db(tmp_path_factory):
+    engine = prepare_database(tmp_path_factory.mktemp("plans") / "plans.db")
+    with engine.connect() as conn:
+        yield conn
+    engine.dispose()
+
+
+@pytest.mark.parametrize("hot_query", HOT_QUERIES, ids=[hot_query.name for hot_query in HOT_QUERIES])
+def test_hot_query_plan(plans_db, hot_query):
+    plan = explain(plans_db, hot_query.build())
+    assert plan_problems(hot_query, plan) == [], plan
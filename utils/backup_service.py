@@ -1,30 +1,49 @@
 import asyncio
 import logging
-from datetime import datetime
+import sqlite3
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from shutil import copy2
 
 from aiogram import Bot
-from aiogram.types import FSInputFile
 
 from utils.audit import write_audit_event
+from utils.file_parts import send_document_parts
 
 logger = logging.getLogger(__name__)
 DB_PATH = Path("data") / "database.db"
 BACKUP_DIR = Path("backups")
+# Время следующего автобекапа — по нему планировщик выгрузок обходит окно бекапа
+next_auto_backup_at: datetime | None = None
 
 
-def create_backup_file() -> Path:
+async def create_backup_file() -> Path:
     BACKUP_DIR.mkdir(parents=True, exist_ok=True)
     if not DB_PATH.exists():
         raise FileNotFoundError(f"DB file not found: {DB_PATH}")
 
     stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     backup_path = BACKUP_DIR / f"database_{stamp}.db"
-    copy2(DB_PATH, backup_path)
+    # Backup API вместо копирования файла: в режиме WAL часть данных ещё лежит в database.db-wal
+    await asyncio.to_thread(_copy_database, DB_PATH, backup_path)
     return backup_path
 
 
+async def restore_backup_file(backup_path: Path) -> None:
+    """Переписывает рабочую БД страницами из бекапа через соединение SQLite (WAL-файлы остаются согласованными)."""
+    await asyncio.to_thread(_copy_database, backup_path, DB_PATH)
+
+
+def _copy_database(source_path: Path, target_path: Path) -> None:
+    # Копирование всей БД занимает секунды — вызывается в отдельном потоке, event loop не ждёт
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(target_path)
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+
+
 def get_latest_backup() -> Path | None:
     BACKUP_DIR.mkdir(parents=True, exist_ok=True)
     backups = sorted(BACKUP_DIR.glob("database_*.db"), key=lambda p: p.stat().st_mtime, reverse=True)
@@ -32,16 +51,18 @@ def get_latest_backup() -> Path | None:
 
 
 async def auto_backup_worker(bot: Bot, target_ids: list[int], interval_hours: int) -> None:
+    global next_auto_backup_at
     interval_seconds = max(1, interval_hours) * 3600
     logger.info("Auto-backup worker started: every %s hours, targets=%s", interval_hours, target_ids)
 
     while True:
         try:
+            next_auto_backup_at = datetime.now(timezone.utc) + timedelta(seconds=interval_seconds)
             await asyncio.sleep(interval_seconds)
-            backup_path = create_backup_file()
+            backup_path = await create_backup_file()
             caption = f"💾 Автобекап БД: {backup_path.name}"
             for owner_id in target_ids:
-                await bot.send_document(owner_id, document=FSInputFile(backup_path), caption=caption)
+                await send_document_parts(bot, owner_id, backup_path, backup_path.name, caption=caption)
             write_audit_event(0, "system", "auto_backup_sent", {"file": str(backup_path), "targets": target_ids})
         except asyncio.CancelledError:
             logger.info("Auto-backup worker cancelled")
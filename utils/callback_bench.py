@@ -0,0 +1,78 @@
+# utils/callback_bench.py
+"""Микробенчмарк маршрутизации нажатий кнопок.
+
+Для каждого callback_data проходит роутеры в порядке handlers/routers.py так же, как
+диспетчер aiogram: фильтры хендлеров по очереди до первого совпадения. Печатает, сколько
+фильтров проверено и сколько микросекунд уходит на выбор хендлера. Кнопки из таблицы
+префиксов (utils/callback_codec.py) находятся первым же фильтром, старые — в конце цепочки.
+
+    python -m utils.callback_bench [--rounds 2000]
+"""
+import argparse
+import asyncio
+import time
+
+from aiogram import Router
+from aiogram.types import CallbackQuery, User
+
+from handlers.routers import ROUTERS
+from keyboards.callbacks import ADMIN_VISION_PAGE, VISION_LIST, VISION_PAGE
+from utils.callback_codec import callback_table
+
+SAMPLES: tuple[tuple[str, str], ...] = (
+    ("владелец: листание записи", VISION_PAGE.pack(12345, 7, 1)),
+    ("владелец: все записи клиента", VISION_LIST.pack(4321)),
+    ("админ: листание записи", ADMIN_VISION_PAGE.pack(12345, 7, 0)),
+    ("старый формат: отмена добавления (админ)", "admin_cancel_add_vision"),
+    ("старый формат: главная панель", "to_main_panel"),
+    ("нет хендлера", "unknown_button"),
+)
+
+
+def _walk(router: Router):
+    yield router
+    for sub_router in router.sub_routers:
+        yield from _walk(sub_router)
+
+
+async def route(callback: CallbackQuery) -> tuple[str | None, int]:
+    """Имя выбранного хендлера и число проверенных фильтров."""
+    checked = 0
+    for root in ROUTERS:
+        for router in _walk(root):
+            for handler in router.callback_query.handlers:
+                checked += 1
+                matched, data = await handler.check(callback, raw_state=None)
+                if matched:
+                    target = data.get("callback_handler", handler).callback
+                    return target.__qualname__, checked
+    return None, checked
+
+
+async def bench(rounds: int) -> None:
+    user = User(id=1, is_bot=False, first_name="bench")
+    print(f"{'кнопка':<42} {'байт':>4} {'фильтров':>9} {'мкс/нажатие':>12}  хендлер")
+    for title, data in SAMPLES:
+        callback = CallbackQuery(id="1", from_user=user, chat_instance="1", data=data)
+        name, checked = await route(callback)
+        started = time.perf_counter()
+        for _ in range(rounds):
+            await route(callback)
+        per_update_us = (time.perf_counter() - started) / rounds * 1e6
+        print(f"{title:<42} {len(data.encode()):>4} {checked:>9} {per_update_us:>12.1f}  {name or '—'}")
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        callback_table.resolve(VISION_PAGE.pack(12345, 7, 1))
+    print(f"\nупаковка + разбор компактного callback_data: "
+          f"{(time.perf_counter() - started) / rounds * 1e6:.2f} мкс")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=2000)
+    asyncio.run(bench(parser.parse_args().rounds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# utils/callback_codec.py
+"""Компактные callback_data и таблица их обработчиков.
+
+Формат: "<префикс>:<поле>.<поле>..." — целые поля в base36, например "vp:2n.4.1".
+Двоеточия в старых callback_data (вида "view_all_visions_12") нет, поэтому форматы не пересекаются,
+а поля разбираются по позиции, а не split("_")[n] с угадыванием номера части.
+
+Все действия регистрируются в одной таблице callback_table: префикс → (действие, хендлер).
+Её роутер подключается к диспетчеру первым и выбирает хендлер одним поиском в словаре,
+вместо прохода по цепочке фильтров F.data.startswith(...) всех роутеров (каждый такой фильтр
+aiogram вызывает через asyncio.to_thread — это десятки микросекунд на фильтр). Callback без
+двоеточия роутер пропускает дальше — старые кнопки работают как раньше.
+
+    python -m utils.callback_bench  — сколько стоит маршрутизация одного нажатия
+"""
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import HandlerObject
+from aiogram.types import CallbackQuery
+
+_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+_PREFIX_SEP = ":"
+_FIELD_SEP = "."
+# Ограничение Telegram на callback_data
+MAX_CALLBACK_DATA_BYTES = 64
+
+
+def encode_int(value: int) -> str:
+    if value < 0:
+        raise ValueError(f"Отрицательное значение в callback_data: {value}")
+    if value < 36:
+        return _DIGITS[value]
+    digits = []
+    while value:
+        value, rest = divmod(value, 36)
+        digits.append(_DIGITS[rest])
+    return "".join(reversed(digits))
+
+
+def decode_int(text: str) -> int:
+    return int(text, 36)
+
+
+@dataclass(frozen=True)
+class CallbackAction:
+    """Вид кнопки: префикс и имена целых полей, которые она несёт."""
+    prefix: str
+    fields: tuple[str, ...] = ()
+
+    def pack(self, *values: int) -> str:
+        if len(values) != len(self.fields):
+            raise ValueError(f"{self.prefix}: ожидалось полей {len(self.fields)}, передано {len(values)}")
+        data = self.prefix + _PREFIX_SEP + _FIELD_SEP.join(encode_int(int(v)) for v in values)
+        if len(data.encode()) > MAX_CALLBACK_DATA_BYTES:
+            raise ValueError(f"callback_data длиннее {MAX_CALLBACK_DATA_BYTES} байт: {data}")
+        return data
+
+    def unpack(self, payload: str) -> dict[str, int]:
+        parts = payload.split(_FIELD_SEP) if payload else []
+        if len(parts) != len(self.fields):
+            raise ValueError(f"{self.prefix}: ожидалось полей {len(self.fields)}, получено {len(parts)}")
+        return {name: decode_int(part) for name, part in zip(self.fields, parts)}
+
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class CallbackTable:
+    def __init__(self, name: str = "callback_table"):
+        self.router = Router(name=name)
+        self._actions: dict[str, CallbackAction] = {}
+        self._handlers: dict[str, HandlerObject] = {}
+        self.router.callback_query.register(self._dispatch, self._match)
+
+    def action(self, prefix: str, *fields: str) -> CallbackAction:
+        if not prefix or _PREFIX_SEP in prefix or _FIELD_SEP in prefix:
+            raise ValueError(f"Недопустимый префикс callback_data: {prefix!r}")
+        if prefix in self._actions:
+            raise ValueError(f"Префикс callback_data уже занят: {prefix!r}")
+        action = CallbackAction(prefix, fields)
+        self._actions[prefix] = action
+        return action
+
+    def handler(self, action: CallbackAction) -> Callable[[Handler], Handler]:
+        """Регистрирует хендлер действия; поля из callback_data приходят в него именованными аргументами."""
+        def register(callback: Handler) -> Handler:
+            if self._actions.get(action.prefix) is not action:
+                raise ValueError(f"Действие {action.prefix!r} создано не этой таблицей")
+            if action.prefix in self._handlers:
+                raise ValueError(f"Для {action.prefix!r} уже есть хендлер")
+            self._handlers[action.prefix] = HandlerObject(callback=callback)
+            return callback
+        return register
+
+    def resolve(self, data: str | None) -> tuple[HandlerObject, dict[str, int]] | None:
+        if not data:
+            return None
+        prefix, sep, payload = data.partition(_PREFIX_SEP)
+        if not sep:
+            return None
+        handler = self._handlers.get(prefix)
+        if handler is None:
+            return None
+        try:
+            return handler, self._actions[prefix].unpack(payload)
+        except ValueError:
+            return None
+
+    async def _match(self, callback: CallbackQuery) -> dict[str, Any] | bool:
+        # Корутина, а не обычная функция: синхронные фильтры aiogram гоняет через asyncio.to_thread
+        resolved = self.resolve(callback.data)
+        if resolved is None:
+            return False
+        handler, args = resolved
+        # callback_handler читает MetricsMiddleware, чтобы SQL-метрики шли на настоящий хендлер
+        return {"callback_handler": handler, "callback_args": args}
+
+    @staticmethod
+    async def _dispatch(callback: CallbackQuery, callback_handler: HandlerObject,
+                        callback_args: dict[str, int], **data: Any) -> Any:
+        return await callback_handler.call(callback, **data, **callback_args)
+
+
+callback_table = CallbackTable()
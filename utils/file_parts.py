@@ -0,0 +1,103 @@
+# utils/file_parts.py
+import asyncio
+import hashlib
+import json
+import math
+from pathlib import Path
+from typing import AsyncGenerator
+
+import aiofiles
+from aiogram import Bot
+from aiogram.types import BufferedInputFile, FSInputFile, InputFile, Message
+from aiogram.types.input_file import DEFAULT_CHUNK_SIZE
+
+from config import TELEGRAM_UPLOAD_LIMIT_BYTES
+from utils.join_parts import READ_CHUNK_SIZE
+
+
+class FileRangeInputFile(InputFile):
+    """Отдаёт в Bot API кусок файла [offset, offset + length), читая его с диска по частям."""
+
+    def __init__(self, path: Path, offset: int, length: int, filename: str, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        async with aiofiles.open(self.path, "rb") as f:
+            await f.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _hash_range(path: Path, offset: int, length: int, whole: "hashlib._Hash") -> str:
+    part = hashlib.sha256()
+    with path.open("rb") as f:
+        f.seek(offset)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            part.update(chunk)
+            whole.update(chunk)
+    return part.hexdigest()
+
+
+def part_name(filename: str, index: int) -> str:
+    return f"{filename}.part{index + 1:03d}"
+
+
+async def send_document_parts(
+    bot: Bot,
+    chat_id: int,
+    path: Path,
+    filename: str,
+    caption: str | None = None,
+    part_size: int = TELEGRAM_UPLOAD_LIMIT_BYTES,
+) -> list[Message]:
+    """Отправляет файл; если он больше лимита Bot API — нумерованными частями и манифестом.
+
+    Каждая часть хэшируется и сразу отправляется, файл целиком в память не читается.
+    Собрать обратно: python -m utils.join_parts <файл>.manifest.json
+    """
+    size = path.stat().st_size
+    if size <= part_size:
+        return [await bot.send_document(chat_id, FSInputFile(path, filename=filename), caption=caption)]
+
+    total = math.ceil(size / part_size)
+    whole = hashlib.sha256()
+    parts = []
+    messages = []
+    for index in range(total):
+        offset = index * part_size
+        length = min(part_size, size - offset)
+        digest = await asyncio.to_thread(_hash_range, path, offset, length, whole)
+        name = part_name(filename, index)
+        parts.append({"name": name, "size": length, "sha256": digest})
+
+        part_caption = f"🧩 Часть {index + 1}/{total}\nsha256: <code>{digest}</code>"
+        if caption and index == 0:
+            part_caption = f"{caption}\n{part_caption}"
+        messages.append(await bot.send_document(
+            chat_id, FileRangeInputFile(path, offset, length, filename=name), caption=part_caption
+        ))
+
+    manifest = {"filename": filename, "size": size, "sha256": whole.hexdigest(), "parts": parts}
+    messages.append(await bot.send_document(
+        chat_id,
+        BufferedInputFile(json.dumps(manifest, indent=2).encode("utf-8"), filename=f"{filename}.manifest.json"),
+        caption=(
+            f"🧩 {filename} ({size / (1024 * 1024):.1f} MB) разбит на {total} частей.\n"
+            "Сохраните части рядом с манифестом и выполните:\n"
+            f"<code>python -m utils.join_parts {filename}.manifest.json</code>"
+        ),
+    ))
+    return messages
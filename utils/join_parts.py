@@ -0,0 +1,47 @@
+# utils/join_parts.py
+"""Сборка файла, отправленного ботом частями (utils/file_parts.py).
+
+Запускается владельцем на своём компьютере, где нет окружения бота, поэтому модуль
+использует только стандартную библиотеку и не импортирует config:
+
+    python -m utils.join_parts <файл>.manifest.json
+"""
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+def join_file_parts(manifest_path: Path, out_path: Path | None = None) -> Path:
+    """Собирает файл из частей, лежащих рядом с манифестом, проверяя контрольные суммы."""
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    out_path = out_path or manifest_path.with_name(manifest["filename"])
+    whole = hashlib.sha256()
+    try:
+        with out_path.open("wb") as out:
+            for part in manifest["parts"]:
+                part_path = manifest_path.with_name(part["name"])
+                digest = hashlib.sha256()
+                with part_path.open("rb") as f:
+                    while chunk := f.read(READ_CHUNK_SIZE):
+                        digest.update(chunk)
+                        whole.update(chunk)
+                        out.write(chunk)
+                if digest.hexdigest() != part["sha256"]:
+                    raise ValueError(f"Checksum mismatch in {part['name']}")
+        if whole.hexdigest() != manifest["sha256"]:
+            raise ValueError(f"Checksum mismatch in assembled {manifest['filename']}")
+    except BaseException:
+        out_path.unlink(missing_ok=True)
+        raise
+    return out_path
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Usage: python -m utils.join_parts <file>.manifest.json", file=sys.stderr)
+        sys.exit(2)
+    print(join_file_parts(Path(sys.argv[1])))
@@ -0,0 +1,248 @@
+# utils/update_workers.py
+"""Многопроцессный приём обновлений (UPDATE_WORKERS > 1).
+
+Главный процесс только получает обновления (поллинг или webhook) и раскладывает их по
+процессам-воркерам: номер воркера выбирается по кольцу консистентного хеширования от id
+пользователя. Все обновления одного пользователя попадают в один воркер, и воркер выполняет
+их строго по очереди, поэтому шаги формы FSM и нажатия кнопок не обгоняют друг друга, а кэш
+FSM пользователя живёт в одном процессе. Разные пользователи обрабатываются параллельно —
+и внутри воркера, и на разных ядрах.
+
+Если число воркеров меняется между запусками, на другой воркер переезжает только около 1/N
+пользователей; их состояние FSM к этому моменту уже сброшено на диск при остановке.
+
+Обновления закреплённых пользователей (владельцев) минуют кольцо и всегда идут в воркер 0:
+состояние панели владельца в памяти — статус рассылки, идущие выгрузки, пул процессов
+выгрузок — одно на всех владельцев, как в однопроцессном режиме.
+"""
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+from typing import Any, Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.utils.backoff import Backoff, BackoffConfig
+
+from utils import worker_ipc
+
+logger = logging.getLogger(__name__)
+
+_RING_REPLICAS = 64
+_POLLING_TIMEOUT_SECONDS = 30
+_SUPERVISE_INTERVAL_SECONDS = 1.0
+_STOP_TIMEOUT_SECONDS = 30.0
+_POLLING_BACKOFF = BackoffConfig(min_delay=1.0, max_delay=5.0, factor=1.3, jitter=0.1)
+# Воркер закреплённых пользователей
+_PINNED_WORKER = 0
+
+UpdateHandler = Callable[[dict[str, Any]], Awaitable[Any]]
+
+
+def _hash(value: str) -> int:
+    # hash() у строк случайный в каждом процессе — кольцо должно совпадать между запусками
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    def __init__(self, nodes: list[int], replicas: int = _RING_REPLICAS):
+        points = sorted((_hash(f"{node}:{replica}"), node) for node in nodes for replica in range(replicas))
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node(self, key: int) -> int:
+        index = bisect.bisect(self._keys, _hash(str(key)))
+        return self._nodes[index % len(self._nodes)]
+
+
+def update_user_id(payload: dict[str, Any]) -> int:
+    """Id автора обновления; без автора — id чата, в крайнем случае update_id."""
+    for key, value in payload.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        author = value.get("from") or value.get("user")
+        if isinstance(author, dict) and "id" in author:
+            return author["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return payload.get("update_id", 0)
+
+
+class UpdateWorkers:
+    """Процессы-воркеры, их очереди и раздача обновлений по пользователям.
+
+    В очередь воркера пишет только главный процесс: сброс кэшей, который воркер рассылает
+    остальным (utils/worker_ipc.py), идёт через общую шину и пересылается отсюда.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        target: Callable[[int, Any, Any, Any], None],
+        pinned_user_ids: frozenset[int] = frozenset(),
+    ):
+        # spawn: воркер не наследует event loop, соединения БД и потоки главного процесса
+        self._context = multiprocessing.get_context("spawn")
+        self._target = target
+        self._queues: list[Any] = [None] * count
+        self._bus = self._context.Queue()
+        # Сколько обновлений доделал каждый воркер с последнего запуска
+        self._completed = self._context.Array("q", count, lock=False)
+        self._routed_at_spawn = [0] * count
+        self._processes: list[Any] = [None] * count
+        self._ring = HashRing(list(range(count)))
+        self._pinned = frozenset(pinned_user_ids)
+        self._stopping = False
+        self._forwarder: asyncio.Task | None = None
+        self.stats = {"routed": [0] * count, "restarts": 0, "lost": 0}
+
+    def start(self) -> None:
+        for index in range(len(self._queues)):
+            self._spawn(index)
+        self._forwarder = asyncio.create_task(self._forward_publishes(), name="update-workers-bus")
+        logger.info("Started %s update workers", len(self._queues))
+
+    def _spawn(self, index: int) -> None:
+        # Каждому процессу — новая очередь: упавший воркер мог умереть, держа блокировку
+        # чтения старой (он почти всё время ждёт в queue.get), и новый не прочитал бы из неё ничего
+        self._queues[index] = self._context.Queue()
+        self._completed[index] = 0
+        self._routed_at_spawn[index] = self.stats["routed"][index]
+        process = self._context.Process(
+            target=self._target, args=(index, self._queues[index], self._bus, self._completed),
+            name=f"update-worker-{index}", daemon=True,
+        )
+        process.start()
+        self._processes[index] = process
+
+    async def route(self, payload: dict[str, Any]) -> None:
+        # Без await внутри: задачи webhook-сервера кладут обновления в очереди в порядке прихода
+        user_id = update_user_id(payload)
+        index = _PINNED_WORKER if user_id in self._pinned else self._ring.node(user_id)
+        self._queues[index].put(("update", payload))
+        self.stats["routed"][index] += 1
+
+    async def _forward_publishes(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self._bus.get)
+            if message is None:
+                return
+            sender, channel, payload = message
+            for index, queue in enumerate(self._queues):
+                if index != sender:
+                    queue.put(("publish", channel, payload))
+
+    async def supervise(self) -> None:
+        """Поднимает заново упавших воркеров.
+
+        Обновления, которые упавший воркер не доделал, — и начатые, и ещё лежавшие в его
+        очереди — потеряны: очередь заменяется новой, а повторять начатые небезопасно (часть
+        действий могла выполниться). Их число пишется в лог и в stats["lost"].
+        """
+        while not self._stopping:
+            await asyncio.sleep(_SUPERVISE_INTERVAL_SECONDS)
+            for index, process in enumerate(self._processes):
+                if not self._stopping and not process.is_alive():
+                    # Процесс мёртв — его счётчик больше никто не меняет
+                    lost = self.stats["routed"][index] - self._routed_at_spawn[index] - self._completed[index]
+                    self.stats["lost"] += lost
+                    logger.error(
+                        "Update worker %s exited with code %s, restarting; updates lost: %s",
+                        index, process.exitcode, lost,
+                    )
+                    self.stats["restarts"] += 1
+                    self._discard_queue(self._queues[index])
+                    self._spawn(index)
+
+    @staticmethod
+    def _discard_queue(queue: Any) -> None:
+        # Фоновый поток очереди не ждёт, пока недочитанное уйдёт в канал, — читателя больше нет
+        queue.cancel_join_thread()
+        queue.close()
+
+    async def stop(self) -> None:
+        """Воркеры дорабатывают уже полученные обновления, сбрасывают FSM и очередь записи."""
+        self._stopping = True
+        for queue in self._queues:
+            queue.put(None)
+        for index, process in enumerate(self._processes):
+            await asyncio.to_thread(process.join, _STOP_TIMEOUT_SECONDS)
+            if process.is_alive():
+                logger.warning("Update worker %s did not stop in time, terminating", index)
+                process.terminate()
+                await asyncio.to_thread(process.join)
+        self._bus.put(None)
+        if self._forwarder is not None:
+            await self._forwarder
+        for queue in self._queues:
+            self._discard_queue(queue)
+        self._bus.close()
+        logger.info("Update workers stopped, routed: %s, lost: %s", self.stats["routed"], self.stats["lost"])
+
+
+async def poll_updates(bot: Bot, route: UpdateHandler, allowed_updates: list[str]) -> None:
+    """Поллинг главного процесса: обновления не обрабатываются, а уходят воркерам."""
+    await bot.delete_webhook(drop_pending_updates=True)
+    backoff = Backoff(config=_POLLING_BACKOFF)
+    offset = None
+    # Запрос ждёт дольше long polling, иначе пустой ответ сервера приняли бы за таймаут сети
+    request_timeout = int(bot.session.timeout + _POLLING_TIMEOUT_SECONDS)
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=_POLLING_TIMEOUT_SECONDS, allowed_updates=allowed_updates,
+                request_timeout=request_timeout,
+            )
+        except Exception as e:
+            logger.error("Failed to fetch updates - %s: %s, retry in %.1f s", type(e).__name__, e, backoff.next_delay)
+            await backoff.asleep()
+            continue
+        backoff.reset()
+        for update in updates:
+            await route(update.model_dump(mode="json", exclude_unset=True, by_alias=True))
+            # Подтверждаем обновление только после того, как оно ушло в очередь воркера
+            offset = update.update_id + 1
+
+
+async def serve_worker(index: int, queue: Any, completed: Any, handle_update: UpdateHandler) -> None:
+    """Цикл воркера: обновления одного пользователя по очереди, разных — параллельно.
+
+    completed — общий с главным процессом счётчик доделанных обновлений (см. supervise).
+    """
+    loop = asyncio.get_running_loop()
+    # Последняя задача каждого пользователя; новая ждёт предыдущую
+    tails: dict[int, asyncio.Task] = {}
+
+    async def run(previous: asyncio.Task | None, payload: dict[str, Any]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            await handle_update(payload)
+        except Exception:
+            logger.exception("Failed to process update %s", payload.get("update_id"))
+        finally:
+            completed[index] += 1
+
+    def forget(user_id: int, task: asyncio.Task) -> None:
+        if tails.get(user_id) is task:
+            del tails[user_id]
+
+    while True:
+        message = await loop.run_in_executor(None, queue.get)
+        if message is None:
+            break
+        if message[0] == "publish":
+            _, channel, payload = message
+            worker_ipc.deliver(channel, payload)
+            continue
+        _, payload = message
+        user_id = update_user_id(payload)
+        task = asyncio.create_task(run(tails.get(user_id), payload))
+        tails[user_id] = task
+        task.add_done_callback(lambda done, user_id=user_id: forget(user_id, done))
+
+    if tails:
+        await asyncio.wait(list(tails.values()))
@@ -0,0 +1,135 @@
+# utils/webhook_server.py
+"""Приём обновлений по webhook: встроенный aiohttp-сервер.
+
+Telegram ждёт ответа на каждый POST и при медленных ответах копит очередь, поэтому сервер
+только проверяет секрет из заголовка X-Telegram-Bot-Api-Secret-Token, разбирает JSON и сразу
+отвечает 200, а само обновление обрабатывается отдельной задачей. При остановке сервер
+перестаёт принимать запросы и ждёт уже принятые обновления.
+
+Локально режим проверяется без Telegram: запустите бота с BOT_MODE=webhook и пустым
+WEBHOOK_BASE_URL и отправьте записанные обновления:
+
+    python -m utils.webhook_server updates.jsonl --url http://127.0.0.1:8080/telegram/webhook --secret ...
+"""
+import argparse
+import asyncio
+import hmac
+import json
+import logging
+import re
+import sys
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from aiohttp import ClientSession, web
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+# Ограничения Bot API на secret_token
+_SECRET_RE = re.compile(r"[A-Za-z0-9_-]{1,256}")
+_DRAIN_TIMEOUT_SECONDS = 10.0
+
+UpdateHandler = Callable[[dict[str, Any]], Awaitable[Any]]
+
+
+class WebhookServer:
+    def __init__(self, handle_update: UpdateHandler, secret: str, path: str, host: str, port: int):
+        if not _SECRET_RE.fullmatch(secret or ""):
+            raise RuntimeError("WEBHOOK_SECRET is required: 1-256 characters A-Z, a-z, 0-9, _ and -")
+        self._handle_update = handle_update
+        self._secret = secret.encode()
+        self._path = path
+        self._host = host
+        self._port = port
+        self._runner: web.AppRunner | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.stats = {"accepted": 0, "rejected": 0, "failed": 0}
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post(self._path, self._receive)
+        app.router.add_get("/healthz", self._health)
+        return app
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self._host, self._port).start()
+        logger.info("Webhook server listening on %s:%s%s", self._host, self._port, self._path)
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._tasks:
+            _, pending = await asyncio.wait(set(self._tasks), timeout=_DRAIN_TIMEOUT_SECONDS)
+            if pending:
+                logger.warning("Webhook stopped with %s updates still in progress", len(pending))
+
+    async def _health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def _receive(self, request: web.Request) -> web.Response:
+        secret = request.headers.get(SECRET_HEADER, "").encode()
+        if not hmac.compare_digest(secret, self._secret):
+            self.stats["rejected"] += 1
+            return web.Response(status=401)
+        try:
+            payload = await request.json()
+        except ValueError:
+            self.stats["rejected"] += 1
+            return web.Response(status=400)
+        if not isinstance(payload, dict):
+            self.stats["rejected"] += 1
+            return web.Response(status=400)
+
+        self.stats["accepted"] += 1
+        task = asyncio.create_task(self._process(payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        # Ответ не ждёт обработки: Telegram не держит следующий апдейт из-за медленного хендлера
+        return web.Response()
+
+    async def _process(self, payload: dict[str, Any]) -> None:
+        try:
+            await self._handle_update(payload)
+        except Exception:
+            self.stats["failed"] += 1
+            logger.exception("Failed to process webhook update %s", payload.get("update_id"))
+
+
+def _read_updates(path: Path) -> list[dict[str, Any]]:
+    # JSON Lines с обновлениями или сохранённый ответ getUpdates ({"ok": true, "result": [...]})
+    text = path.read_text(encoding="utf-8").strip()
+    if text.startswith("{") and '"result"' in text.split("\n", 1)[0]:
+        try:
+            return json.loads(text)["result"]
+        except (ValueError, KeyError):
+            pass
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+async def replay(path: Path, url: str, secret: str) -> int:
+    """Отправляет записанные обновления по одному; возвращает число ответов не 200."""
+    failures = 0
+    async with ClientSession() as session:
+        for update in _read_updates(path):
+            async with session.post(url, json=update, headers={SECRET_HEADER: secret}) as response:
+                if response.status != 200:
+                    failures += 1
+                print(f"update {update.get('update_id')}: HTTP {response.status}")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Отправить записанные обновления на webhook бота")
+    parser.add_argument("updates", type=Path, help="JSON Lines с обновлениями или ответ getUpdates")
+    parser.add_argument("--url", required=True)
+    parser.add_argument("--secret", required=True)
+    args = parser.parse_args()
+    sys.exit(1 if asyncio.run(replay(args.updates, args.url, args.secret)) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+# utils/worker_ipc.py
+"""Связь между процессами-воркерами в многопроцессном режиме (UPDATE_WORKERS > 1).
+
+Кэши в памяти (клиенты, записи зрения, контент разделов) у каждого воркера свои. Сбросив
+ключи у себя, воркер рассылает их остальным через publish: сообщение уходит в общую шину,
+главный процесс пересылает его в очереди остальных воркеров, а они применяют сброс в
+подписчике канала. В однопроцессном режиме publish ничего не делает.
+"""
+import logging
+import os
+import signal
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+# Номер текущего воркера; None — однопроцессный режим или главный процесс
+worker_index: int | None = None
+_bus: Any = None
+_subscribers: dict[str, Callable[[Any], None]] = {}
+
+
+def attach(index: int, bus: Any) -> None:
+    global worker_index, _bus
+    worker_index = index
+    _bus = bus
+
+
+def subscribe(channel: str, callback: Callable[[Any], None]) -> None:
+    _subscribers[channel] = callback
+
+
+def publish(channel: str, payload: Any) -> None:
+    if worker_index is None:
+        return
+    _bus.put((worker_index, channel, payload))
+
+
+def deliver(channel: str, payload: Any) -> None:
+    callback = _subscribers.get(channel)
+    if callback is None:
+        logger.warning("No subscriber for worker channel %s", channel)
+        return
+    callback(payload)
+
+
+def request_restart() -> None:
+    """Просит главный процесс остановить всех воркеров и перезапуститься целиком."""
+    os.kill(os.getppid(), signal.SIGHUP)